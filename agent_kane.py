@@ -1,148 +1,1059 @@
 from typing import Any, Callable, List, Tuple
+import gc
+import math
 import os
+import queue
+import threading
+import weakref
 import gymnasium as gym
-from monte_carlo_tree_search import Node, select, expand, rollout, backpropagate
+import numpy as np
+from monte_carlo_tree_search import (
+    Node,
+    Frontier,
+    expand,
+    rollout,
+    rollouts,
+    backpropagate,
+    ucb1,
+    apply_virtual_loss,
+    revert_virtual_loss,
+    state_key,
+    TranspositionTable,
+)
 import time
 from multiprocessing import Pool
-from tree_metrics import MeasureTree
+from search_budget import SearchBudget
+from state_cache_pool import StateCachePool
+from state_arena import StateArena
+from state_store import StateStore
+from vector_rollout import VectorRollout
+from rollout_policy import RolloutPolicy
+from decision_cache import DecisionCache
+from parallel_config import ParallelConfig, SearchMode, StateMode
+from search_metrics import SearchMetrics
+from array_tree import ArrayTree, array_scorer
 import tqdm
 
 _simulation_env = None
+_rollout_options = {}
+_arena = None
+_vector_rollout = None
+_rollouts_per_leaf = 1
 
 
-def _initialize_env(env_provider: Callable[[bool], gym.Env]):
-    global _simulation_env
+def _initialize_env(
+    env_provider: Callable[[bool], gym.Env],
+    rollout_options: dict = {},
+    arena: StateArena | None = None,
+    num_envs: int = 1,
+    num_rollouts: int = 1,
+):
+    global _simulation_env, _rollout_options, _arena, _vector_rollout, _rollouts_per_leaf
 
-    _simulation_env = env_provider(
-        render_mode="rgb_array", headless=True, with_reward=True
-    )
-    _simulation_env.reset()
+    envs = []
+    for _ in range(num_envs):
+        envs.append(
+            env_provider(render_mode="rgb_array", headless=True, with_reward=True)
+        )
+        envs[-1].reset()
+    _simulation_env = envs[0]
+    _rollout_options = rollout_options
+    _arena = arena
+    _rollouts_per_leaf = num_rollouts
+    if num_envs > 1:
+        _vector_rollout = VectorRollout(envs)
 
 
-def _rollout(node: Node) -> Tuple[bytes, bool, List[float]]:
-    """Run a single rollout from a given node and return the rewards and the terminate status.
+def _rollout(node: Node) -> Tuple[bytes, bool, List[List[float]], bytes, float]:
+    """Run the rollouts from a given node and return the rewards and the terminate status.
 
     args:
         node: The node to start the rollout from.
     returns:
+        bytes: The state of the node.
         bool: True if the node is terminal, False otherwise.
-        List[float]: The rewards collected during the rollout.
+        List[List[float]]: The rewards collected during each rollout.
+        bytes: The key of the state for the transposition table.
+        float: The time of the rollouts in the worker.
     """
+    t_0 = time.perf_counter()
     # the node
-    rewards = rollout(node, _simulation_env)
+    rewards = rollouts(
+        node, _simulation_env, _rollouts_per_leaf, **_rollout_options
+    )
 
     # we return the is_terminal value because this function might run in sub process
     # where the node object is an copy from the original in the main process
 
-    return node.state, node.is_terminal, rewards
+    return (
+        node.state,
+        node.is_terminal,
+        rewards,
+        state_key(node.state),
+        time.perf_counter() - t_0,
+    )
+
+
+def _rollout_slot(
+    task: Tuple[bytes | None, int | None, int | None, int]
+) -> Tuple[bytes | None, bool, List[List[float]], bytes, float]:
+    """Run the rollouts with the states exchanged through the shared `StateArena`.
+
+    args:
+        task: The parent's state or None, the parent's slot, the child's slot and the child's action.
+    returns:
+        The same as `_rollout`, but the state is None when it is written into the child's slot.
+    """
+    parent_state, parent_slot, child_slot, action = task
+    if parent_state is None:
+        # the emulator loads the state straight from the shared memory
+        with _arena.view(parent_slot) as parent_state:
+            result = _rollout(Node(action=action, parent=Node(state=parent_state)))
+    else:
+        result = _rollout(Node(action=action, parent=Node(state=parent_state)))
+
+    state, is_terminal, rewards, key, seconds = result
+    if child_slot is not None and _arena.write(child_slot, state):
+        state = None
+
+    return state, is_terminal, rewards, key, seconds
+
+
+def _rollout_batch(
+    nodes: List[Node],
+) -> List[Tuple[bytes, bool, List[float], bytes, float]]:
+    """Run the rollouts of the nodes in lockstep on the environments of the worker.
+
+    returns:
+        The result of `_rollout` for each node, the time of the batch is split evenly.
+    """
+    t_0 = time.perf_counter()
+    rewards = _vector_rollout.rollout(nodes, **_rollout_options)
+    seconds = (time.perf_counter() - t_0) / len(nodes)
+    return [
+        (node.state, node.is_terminal, [r], state_key(node.state), seconds)
+        for node, r in zip(nodes, rewards)
+    ]
+
+
+def _search_tree(
+    task: Tuple[bytes, int, dict, float, Callable, int]
+) -> Tuple[List[Tuple[int, int, float, float, bool, bool]], int, int]:
+    """Grow an independent tree from the root state on the environment of the worker.
+
+    args:
+        task: The root state, the number of actions, the keyword arguments of the `SearchBudget`,
+            the exploration weight, the scorer and the seed of the random actions.
+    returns:
+        The action, visits, value, squared values, terminal and victory status of each child of the root.
+        int: The number of nodes in the tree.
+        int: The depth of the tree.
+    """
+    root_state, num_actions, budget_options, exploration_weight, scorer, seed = task
+    _simulation_env.action_space.seed(seed)
+    budget = SearchBudget(**budget_options)
+    budget.start()
+
+    # the tree is only used in the worker, so it is kept in arrays and scored in one pass
+    tree = ArrayTree(state=root_state, action=1)
+    scorer = array_scorer(scorer)
+    depth = 0
+    # the root children are expanded whatever the budget, the decision is made from them
+    while tree.num_children[0] == 0 or budget.allows(len(tree), depth):
+        candidates = tree.select(
+            exploration_weight=exploration_weight,
+            action_space=num_actions,
+            scorer=scorer,
+        )
+        # a round expands the children of one node, like a batch of the shared tree
+        new_nodes = tree.expand(
+            candidates, num_actions=num_actions, max_expansions=num_actions
+        )
+        if len(new_nodes) == 0:
+            break
+
+        t_0 = time.time()
+        for index in new_nodes:
+            parent = int(tree.parent[index])
+            node = Node(
+                action=int(tree.action[index]), parent=Node(state=tree.states[parent])
+            )
+            for rewards in rollouts(
+                node, _simulation_env, _rollouts_per_leaf, **_rollout_options
+            ):
+                tree.backpropagate(index, rewards, reward_discount=0.7)
+            tree.states[index] = node.state
+            tree.is_terminal[index] = node.is_terminal
+            tree.is_victory[index] = node.is_victory
+            depth = max(depth, int(tree.depth[index]))
+        budget.record_round(time.time() - t_0)
+
+    children = [
+        (
+            int(tree.action[c]),
+            int(tree.visits[c]),
+            float(tree.value[c]),
+            float(tree.value_squares[c]),
+            bool(tree.is_terminal[c]),
+            bool(tree.is_victory[c]),
+        )
+        for c in tree.children(0)
+    ]
+    return children, len(tree), int(tree.depth[: len(tree)].max())
+
+
+def _warm_root(state: bytes | None, children: list | None) -> Node:
+    """Create a root node with the cached statistics of its children.
+
+    The children have no state, so the rollouts below them replay their actions from the root.
+    """
+    root_node = Node(state=state, action=1, value=0)
+    for action, visits, value, value_squares, is_terminal, is_victory in children or []:
+        root_node.add(
+            Node(
+                action=action,
+                visits=visits,
+                value=value,
+                value_squares=value_squares,
+                is_terminal=is_terminal,
+                is_victory=is_victory,
+            )
+        )
+        root_node.visits += visits
+        root_node.value += value
+    return root_node
+
+
+def _best_child(root_node: Node) -> Node:
+    """Return the child of the root with the highest value among the ones with a result.
+
+    The children whose rollouts were left behind at a deadline have no visits and no value yet.
+    """
+    return max((c for c in root_node.children if c.visits > 0), key=lambda x: x.value)
+
+
+def _rollout_task(node: Node) -> Node:
+    """Copy the node with only its parent's state so that the task does not transfer the whole tree.
+
+    If the parent's state is dropped by the `StateStore`, the path from the nearest ancestor with
+    a state is copied as well, and the worker replays it.
+    """
+    if node.parent is None:
+        return Node(action=node.action)
+
+    path = [node.parent]
+    while path[-1].state is None and path[-1].parent is not None:
+        path.append(path[-1].parent)
+
+    parent = None
+    for ancestor in reversed(path):
+        parent = Node(action=ancestor.action, state=ancestor.state, parent=parent)
+    return Node(action=node.action, parent=parent)
 
 
 class AgentKane:
 
-    def __init__(self, env_provider: Callable[[], gym.Env], num_workers: int = None):
+    def __init__(
+        self,
+        env_provider: Callable[[], gym.Env],
+        num_workers: int = None,
+        parallel: ParallelConfig = ParallelConfig(),
+        rollout_horizon: int | None = None,
+        rollout_evaluator: Callable[[dict], float] | None = None,
+        transpositions: bool = False,
+        target_num_nodes: int = 700,
+        target_depth: int = 16,
+        time_budget_ms: float | None = None,
+        early_stop: bool = False,
+        lean_rollouts: bool = False,
+        restore_states: bool = False,
+        exploration_weight: float = 1.0,
+        rollouts_per_leaf: int = 1,
+        scorer: Callable[[Node, float], float] = ucb1,
+        rollout_policy: RolloutPolicy | None = None,
+        decision_cache: DecisionCache | None = None,
+        verbose: bool = True,
+    ):
+        """
+        Initialize the agent and its pool of simulation workers.
+        args:
+            env_provider: The function that creates the simulation environments.
+            num_workers: The number of simulation workers, defaults to the number of CPUs.
+            parallel: How the rollouts are scheduled on the workers and where the states are kept,
+                see `ParallelConfig`.
+            rollout_horizon: The max number of random steps of a rollout, None to play until the end.
+                The rewards are discounted by 0.7 per step, so the far steps barely count.
+            rollout_evaluator: Score the state where a rollout is cut off by the horizon from its `info`,
+                e.g. `mario_reward.pit_evaluator`. It must be picklable for the workers.
+            transpositions: If True, the nodes that reach the same emulator state share their
+                statistics and subtree through a `TranspositionTable`.
+            target_num_nodes: The number of nodes a search aims for, it stops at twice the number.
+            target_depth: The depth a search aims for, it stops at twice the depth.
+            time_budget_ms: Return the best action found within the time, None for no deadline.
+            early_stop: If True, a search stops as soon as its best action cannot be overtaken
+                within the remaining budget. Not with the root-parallel trees.
+            lean_rollouts: If True, the random steps of the rollouts skip the observations and the
+                `info` dicts, see `MarioReward.step_lean`. The evaluator gets the `LeanInfo` fields.
+            restore_states: If True, the rollouts load their states with `restore` of the simulation
+                environments, which skips the emulator reset, see `MarioReward.restore`.
+            exploration_weight: The exploration weight of the UCB1 scores.
+            rollouts_per_leaf: The number of rollouts of a new node in its task. The first one runs
+                the node and the others start from its state, each of them counts as a visit.
+                Not with the state cache or the batched rollouts.
+            scorer: The score of the nodes in the selection, `ucb1` or `ucb1_tuned`, which uses the
+                variance of the rollouts. The root-parallel trees are array-backed and take the
+                vectorized version of the scorer, see `array_tree.array_scorer`.
+            rollout_policy: The policy of the random steps of the rollouts, e.g. a `WeightedPolicy`
+                or a `HeuristicPolicy` from `rollout_policy`. None for the uniform random actions.
+            decision_cache: The cache of the root children of past searches by the emulator state.
+                The cache is looked up at every decision and a confident cached decision skips the
+                search. Otherwise, the cached statistics only warm-start a new tree, i.e. the first
+                decision after a reset or after the tree under the chosen action is dropped. A
+                reused tree keeps the statistics of the search that grew it. Not with the state
+                cache or the state arena, which need the states of the warm-started children.
+            verbose: If False, the progress bar and the summary of each decision are not printed.
+                The metrics of the last decision are always in `metrics.last`.
+        """
+        states = parallel.states
+        if transpositions and parallel.search is SearchMode.ROOT_PARALLEL:
+            raise ValueError("The root-parallel trees do not share the transposition table")
+        if early_stop and parallel.search is SearchMode.ROOT_PARALLEL:
+            raise ValueError(
+                "The independent root-parallel trees cannot tell when their merged decision is settled"
+            )
+        if parallel.search is SearchMode.ROOT_PARALLEL:
+            # fail before the workers start if the scorer has no vectorized version
+            array_scorer(scorer)
+        if decision_cache is not None and states in (StateMode.CACHE, StateMode.ARENA):
+            raise ValueError(
+                "The decision cache cannot be used with the state cache or the state arena"
+            )
+        if rollouts_per_leaf > 1 and (
+            states is StateMode.CACHE or parallel.rollouts_per_task > 1
+        ):
+            raise ValueError(
+                "The rollouts per leaf cannot be used with the state cache or the batched rollouts"
+            )
+
         self._env_provider = env_provider
         self.num_workers = num_workers if num_workers else os.cpu_count()
-        self._pool = Pool(
-            processes=self.num_workers,
-            initializer=_initialize_env,
-            initargs=[env_provider],
-        )
+        self.parallel = parallel
+        self.exploration_weight = exploration_weight
+        self.scorer = scorer
+        rollout_options = {
+            "horizon": rollout_horizon,
+            "evaluator": rollout_evaluator,
+            "lean": lean_rollouts,
+            "restore": restore_states,
+            "policy": rollout_policy,
+        }
+        self._pool = None
+        self._cache_pool = None
+        self._arena = None
+        # the arena slot of each node with the finalizer that frees it
+        self._slots = weakref.WeakKeyDictionary()
+        self._arena_exhausted = False
+        if states is StateMode.ARENA:
+            self._arena = StateArena(parallel.arena_slots, slot_size=parallel.slot_size)
+        if states is StateMode.CACHE:
+            self._cache_pool = StateCachePool(
+                env_provider,
+                num_workers=self.num_workers,
+                cache_size=parallel.state_cache_size,
+                rollout_options=rollout_options,
+            )
+        else:
+            self._pool = Pool(
+                processes=self.num_workers,
+                initializer=_initialize_env,
+                initargs=[
+                    env_provider,
+                    rollout_options,
+                    self._arena,
+                    parallel.rollouts_per_task,
+                    rollouts_per_leaf,
+                ],
+            )
+        # the finished rollouts of the tasks dispatched to the pool
+        self._results = queue.Queue()
+        # the nodes whose rollouts are still running after the deadline of their search
+        self._abandoned = set()
         self._previous_node = None
+        self._decision_cache = decision_cache
+        self.verbose = verbose
+        # the instrumentation of the decisions
+        self.metrics = SearchMetrics(self.num_workers)
+        self._tree_size = {}
+        # the cached statistics to start the next new tree from
+        self._warm_start = None
+        self._state_store = None
+        if states is StateMode.STORE:
+            self._state_store = StateStore(
+                parallel.memory_budget, delta=parallel.state_deltas
+            )
+        self._transpositions = TranspositionTable() if transpositions else None
+        self._budget = SearchBudget(
+            target_num_nodes=target_num_nodes,
+            target_depth=target_depth,
+            time_budget_ms=time_budget_ms,
+            early_stop=early_stop,
+            concurrency=self.num_workers * parallel.rollouts_per_task,
+        )
+
+        # the background search between the decisions
+        self._speculation = None
+        self._speculation_stop = threading.Event()
+        self._speculation_error = None
+        self._speculation_budget = SearchBudget(
+            target_num_nodes=target_num_nodes,
+            target_depth=target_depth,
+            concurrency=self.num_workers * parallel.rollouts_per_task,
+        )
+        self._num_actions = None
 
     def act(self, env: gym.Env, observation: Any) -> Tuple[Any, Any]:
         """Select an action based on the given state"""
+        # take over the tree grown in the background
+        self._stop_speculation()
+        # the speculated tree is dropped if the environment did not reach the state of its root
+        if (
+            self.parallel.speculative
+            and self._previous_node is not None
+            and self._previous_node.state is not None
+            and self._previous_node.state != env.serialize()
+        ):
+            self._previous_node = None
+        self.metrics.reset()
+        self.metrics.frame_skip = getattr(env, "frame_skip", 1)
+
+        key = None
+        if self._decision_cache is not None:
+            key = state_key(env.serialize())
+            cached = self._cached_decision(key)
+            if cached is not None:
+                self.metrics.finish(cached=True, num_nodes=0, max_depth=0)
+                return cached
+
         # search for the optimal action
         action, tree = self._search(env)
+        self._warm_start = None
+
+        if key is not None:
+            self._decision_cache.put(
+                key,
+                [
+                    (
+                        c.action,
+                        c.visits,
+                        c.value,
+                        c.value_squares,
+                        c.is_terminal,
+                        c.is_victory,
+                    )
+                    for c in tree.children
+                ],
+            )
+        self.metrics.finish(cached=False, **self._tree_size)
+
+        # the background search needs the state of the new root, which stays in a worker with
+        # the state cache or in its slot with the state arena
+        if self.parallel.speculative and self._previous_node is not None:
+            if self._previous_node.state is None and self._cache_pool is not None:
+                self._previous_node.state = self._cache_pool.fetch(self._previous_node)
+            if self._previous_node.state is None and self._previous_node in self._slots:
+                slot, _ = self._slots[self._previous_node]
+                self._previous_node.state = self._arena.read(slot)
+            if self._previous_node.state is not None:
+                self._start_speculation()
 
         return action, tree
 
+    def _cached_decision(self, key: bytes) -> Tuple[Any, Node] | None:
+        """Return the confident decision of the cache, or keep the statistics for a warm start."""
+        children = self._decision_cache.get(key)
+        if children is None:
+            return None
+
+        action = self._decision_cache.decision(children)
+        if action is None:
+            self._warm_start = children
+            return None
+
+        if self.verbose:
+            print(f"Decision: {action} from the decision cache")
+        root_node = _warm_root(None, children)
+        # continue with the subtree of the decision if the tree is reused
+        next_root = None
+        if self._previous_node is not None:
+            for child in self._previous_node.children:
+                if child.action == action and child.transposition is None:
+                    next_root = child
+                    next_root.parent = None
+                    self._abandoned.discard(next_root)
+        self._previous_node = next_root
+
+        return action, root_node
+
     def _search(self, env: gym.Env) -> Tuple[Any, Node]:
         """Perform a Monte Carlo Tree Search from the given state and select the best action."""
+        if self.parallel.search is SearchMode.ROOT_PARALLEL:
+            return self._search_root_parallel(env)
+
         t = time.time()
+        self._budget.start()
 
         # prepare the root node
         if self._previous_node is not None:
-            # resue the previous node
+            # resue the previous node, the cached statistics of its state are not added to the
+            # ones it already has
             root_node = self._previous_node
+            # the environment is in the state of the root if the store dropped it
+            if root_node.state is None:
+                root_node.state = env.serialize()
         else:
-            # create a new node
-            root_node = Node(state=env.serialize(), action=1, value=0)
+            # create a new node, with the cached statistics of the state if any
+            root_node = _warm_root(env.serialize(), self._warm_start)
 
         # run the MCTS algorithm loop on the internal simulation environment
+        self._num_actions = env.action_space.n
+        self._grow(root_node, self._budget, self.metrics, verbose=self.verbose)
+
+        # select the best action
+        decision = _best_child(root_node)
+        if self._state_store is not None:
+            self._state_store.restore(decision)
+            if decision.transposition not in (None, root_node):
+                self._state_store.restore(decision.transposition)
+        decision.parent = None
+        # continue with the subtree of the same state if the decision shares it with another node
+        next_root = decision
+        if decision.transposition not in (None, root_node):
+            next_root = decision.transposition
+            next_root.parent = None
+            if next_root.state is None:
+                next_root.state = decision.state
+
+        self._tree_size = {
+            "num_nodes": root_node.size,
+            "max_depth": root_node.height,
+        }
+
+        if self.verbose:
+            print(
+                f"Decision: {decision.action} {root_node.value} in {time.time() - t} seconds"
+            )
+            print(f"Number of nodes: {root_node.size}")
+            print(f"Max depth: {root_node.height}")
+
+        # save the current node, it is expanded by the next search even if it was left behind
+        self._abandoned.discard(next_root)
+        self._previous_node = next_root
+
+        return decision.action, root_node
+
+    def _search_root_parallel(self, env: gym.Env) -> Tuple[Any, Node]:
+        """Grow independent trees in the workers and decide with their merged root children."""
+        t = time.time()
+        budget = self._budget
+        num_trees = self.parallel.num_trees
+        # the trees share the budget of the decision, the nodes are split between them and the time
+        # between the waves of the trees that run on the workers at once
+        num_waves = math.ceil(num_trees / self.num_workers)
+        budget_options = {
+            "target_num_nodes": math.ceil(budget.target_num_nodes / num_trees),
+            "target_depth": budget.target_depth,
+            "time_budget_ms": (
+                None if budget.time_budget_ms is None else budget.time_budget_ms / num_waves
+            ),
+        }
+        root_state = env.serialize()
+        weights = self.parallel.tree_exploration_weights or (self.exploration_weight,)
+        seeds = np.random.SeedSequence().generate_state(num_trees)
+        tasks = [
+            (
+                root_state,
+                env.action_space.n,
+                budget_options,
+                weights[i % len(weights)],
+                self.scorer,
+                int(seed),
+            )
+            for i, seed in enumerate(seeds)
+        ]
+
+        # sum the statistics of the root children over the trees
+        root_node = Node(state=root_state, action=1, value=0)
+        children = {}
+        with self.metrics.phase("rollout"):
+            trees = self._pool.map(_search_tree, tasks)
+        self.metrics.add("bytes_sent", len(root_state) * len(tasks))
+        # the trees are merged at their roots
+        num_nodes = 1 + sum(size - 1 for _, size, _ in trees)
+        max_depth = max(height for _, _, height in trees)
+        num_rollouts = sum(visits for tree, _, _ in trees for _, visits, *_ in tree)
+        # the cached statistics of the root children of a warm start count as one more tree
+        for tree in [tree for tree, _, _ in trees] + [self._warm_start or []]:
+            for action, visits, value, value_squares, is_terminal, is_victory in tree:
+                if action not in children:
+                    root_node.add(children.setdefault(action, Node(action=action)))
+                child = children[action]
+                child.visits += visits
+                child.value += value
+                child.value_squares += value_squares
+                child.is_terminal = child.is_terminal or is_terminal
+                child.is_victory = child.is_victory or is_victory
+                root_node.visits += visits
+                root_node.value += value
+
+        decision = _best_child(root_node)
+        self.metrics.add("rollouts", num_rollouts)
+        self._tree_size = {"num_nodes": num_nodes, "max_depth": max_depth}
+        if self.verbose:
+            print(
+                f"Decision: {decision.action} {root_node.value} in {time.time() - t} seconds"
+            )
+            print(f"Number of nodes: {num_nodes}")
+            print(f"Max depth: {max_depth}")
+
+        return decision.action, root_node
+
+    def _grow(
+        self,
+        root_node: Node,
+        budget: SearchBudget,
+        metrics: SearchMetrics,
+        stop: threading.Event | None = None,
+        verbose: bool = True,
+    ):
+        """Grow the tree under the root node within the budget or until the stop event is set."""
+        if self._transpositions is not None:
+            self._transpositions.reroot(root_node)
+        if self._state_store is not None:
+            self._state_store.reroot(root_node)
+
+        # the candidates are maintained incrementally instead of traversing the tree every iteration
+        frontier = Frontier(
+            root_node,
+            exploration_weight=self.exploration_weight,
+            action_space=self._num_actions,
+            scorer=self.scorer,
+        )
+        # the nodes left behind by an earlier deadline are not expanded until their results arrive
+        for node in self._abandoned:
+            frontier.discard(node)
+        grow = (
+            self._grow_streaming
+            if self.parallel.search is SearchMode.STREAMING
+            else self._grow_batched
+        )
+        grow(root_node, frontier, root_node.size, budget, metrics, stop, verbose)
+
+    def _grow_batched(
+        self,
+        root_node: Node,
+        frontier: Frontier,
+        num_nodes: int,
+        budget: SearchBudget,
+        metrics: SearchMetrics,
+        stop: threading.Event | None,
+        verbose: bool,
+    ):
+        """Grow the tree in iterations, each expands a batch of nodes and waits for all of their rollouts."""
+        num_actions = self._num_actions
         depth = 0
-        i = 0
-        target_depth = 16
-        target_num_nodes = 700  # 1200
-        measure = MeasureTree()
-        measure(root_node)
-        num_nodes = measure.num_nodes
-        pbar = tqdm.tqdm(total=target_depth)
-        # while depth < target_depth or i < 8:
-        while (num_nodes < target_num_nodes or depth < target_depth) and (
-            num_nodes < target_num_nodes * 2 and depth < target_depth * 2
+        pbar = tqdm.tqdm(total=budget.target_depth, disable=not verbose)
+        while not (stop and stop.is_set()) and (
+            # the root children are expanded whatever the budget, the decision is made from them
+            not root_node.children
+            or budget.allows(num_nodes, depth)
         ):
-            i += 1
+            if budget.is_decided(root_node, num_nodes, num_actions):
+                if verbose:
+                    print("The decision is settled")
+                break
             # Selection
-            candidates = select(root_node, exploration_weight=1.4)
+            with metrics.phase("select"):
+                candidates = frontier.select()
             if len(candidates) == 0:
                 break
+            depths = {node: depth for node, depth, _ in candidates}
 
             # Expansion
-            new_nodes = expand(
-                candidates,
-                num_actions=env.action_space.n,
-                max_expansions=self.num_workers,
-            )
-            num_nodes += len(new_nodes)
+            with metrics.phase("expand"):
+                new_nodes = expand(
+                    candidates,
+                    num_actions=num_actions,
+                    max_expansions=self.num_workers * self.parallel.rollouts_per_task,
+                )
+                num_nodes += len(new_nodes)
+                for node in new_nodes:
+                    frontier.add(node, depths[node.parent] + 1)
 
             if len(new_nodes) == 0:
-                print("No more actions to explore")
+                if verbose:
+                    print("No more actions to explore")
                 break
 
             # Rollout
             t_0 = time.time()
-            # prepare new_nodes for rollout so that it will not transfer the whole tree
-            nodes = []
-            for node in new_nodes:
-                parent = None
-                if node.parent:
-                    parent = Node(action=node.parent.action, state=node.parent.state)
-                nodes.append(Node(action=node.action, parent=parent))
-
-            rollout_results = self._pool.map(_rollout, nodes)
+            if self.parallel.rollouts_per_task > 1:
+                # each task runs a batch of rollouts on the environments of a worker
+                with metrics.phase("dispatch"):
+                    tasks = [self._task(node, metrics) for node in new_nodes]
+                    batches = [
+                        tasks[i : i + self.parallel.rollouts_per_task]
+                        for i in range(0, len(tasks), self.parallel.rollouts_per_task)
+                    ]
+                with metrics.phase("rollout"):
+                    rollout_results = [
+                        result
+                        for results in self._pool.map(_rollout_batch, batches)
+                        for result in results
+                    ]
+            elif self._cache_pool is None:
+                # prepare new_nodes for rollout so that it will not transfer the whole tree
+                with metrics.phase("dispatch"):
+                    tasks = [self._task(node, metrics) for node in new_nodes]
+                with metrics.phase("rollout"):
+                    rollout_results = self._pool.map(self._rollout_function, tasks)
+            else:
+                with metrics.phase("dispatch"):
+                    for node in new_nodes:
+                        self._cache_pool.submit(node)
+                with metrics.phase("rollout"):
+                    finished = dict(self._next_result() for _ in new_nodes)
+                rollout_results = [finished[node] for node in new_nodes]
+            budget.record_round(time.time() - t_0)
             depth = max([c[1] + 1 for c in candidates])
             pbar.set_description(
                 f"Time: {time.time() - t_0:.4f} Depth: {depth} Nodes: {num_nodes}"
             )
             pbar.update(max(pbar.n, depth) - pbar.n)
             # Backpropagation
-            for node, (state, is_terminated, rewards) in zip(
-                new_nodes, rollout_results
-            ):
-                node.state = bytes(state)
-                node.is_terminal = is_terminated
-                backpropagate(node, list(rewards), reward_discount=0.7)
+            with metrics.phase("backprop"):
+                for node, result in zip(new_nodes, rollout_results):
+                    self._update(root_node, node, result, frontier, budget, metrics)
             del rollout_results
 
         pbar.close()
-        # select the best action
-        decision = max(root_node.children, key=lambda x: x.value)
-        decision.parent = None
 
-        print(
-            f"Decision: {decision.action} {root_node.value} in {time.time() - t} seconds"
+    def _grow_streaming(
+        self,
+        root_node: Node,
+        frontier: Frontier,
+        num_nodes: int,
+        budget: SearchBudget,
+        metrics: SearchMetrics,
+        stop: threading.Event | None,
+        verbose: bool,
+    ):
+        """Grow the tree without a barrier: a new leaf is dispatched whenever a worker becomes free.
+
+        The pending leaves are kept out of the frontier and their paths carry a virtual loss,
+        so that the following selections spread over the tree until the results arrive. At the
+        deadline, the rollouts that are still running are left behind: their virtual loss is
+        reverted, and their results are backed up when they arrive during a later search.
+        """
+        num_actions = self._num_actions
+        depth = 0
+        # the pending nodes with their depth and dispatch time
+        pending = {}
+        decided = False
+        # the deadline only cuts the search short once the root children have a result
+        has_results = any(c.visits > 0 for c in root_node.children)
+        pbar = tqdm.tqdm(total=budget.target_depth, disable=not verbose)
+        while True:
+            # keep all workers busy as long as the budget allows
+            while (
+                len(pending) < self.num_workers
+                and not decided
+                and not (stop and stop.is_set())
+                and (not root_node.children or budget.allows(num_nodes, depth))
+            ):
+                # Selection
+                with metrics.phase("select"):
+                    candidates = frontier.select()
+                depths = {node: depth for node, depth, _ in candidates}
+
+                # Expansion
+                with metrics.phase("expand"):
+                    new_nodes = expand(
+                        candidates,
+                        num_actions=num_actions,
+                        max_expansions=self.num_workers - len(pending),
+                    )
+                if len(new_nodes) == 0:
+                    break
+                num_nodes += len(new_nodes)
+
+                # Rollout
+                with metrics.phase("dispatch"):
+                    for node in new_nodes:
+                        pending[node] = (depths[node.parent] + 1, time.time())
+                        depth = max(depth, pending[node][0])
+                        apply_virtual_loss(node, self.parallel.virtual_loss)
+                        frontier.update(node)
+                        self._dispatch(node, metrics)
+
+            # wait for the next result, the decision needs a root child with one, which may only
+            # come from the rollouts that an earlier search left behind
+            if len(pending) == 0 and (has_results or not self._abandoned):
+                break
+            timeout = budget.remaining() if has_results else None
+            with metrics.phase("rollout"):
+                received = self._next_result(timeout)
+            if received is None:
+                self._abandon(pending)
+                break
+            node, result = received
+            if node not in pending:
+                self._late_result(root_node, node, result, frontier, budget, metrics)
+                has_results = any(c.visits > 0 for c in root_node.children)
+                continue
+
+            # Backpropagation
+            node_depth, t_0 = pending.pop(node)
+            budget.record_round(time.time() - t_0)
+            with metrics.phase("backprop"):
+                revert_virtual_loss(node, self.parallel.virtual_loss)
+                self._update(root_node, node, result, frontier, budget, metrics)
+                frontier.add(node, node_depth)
+            has_results = True
+            decided = decided or budget.is_decided(
+                root_node, num_nodes, num_actions
+            )
+
+            pbar.set_description(
+                f"Depth: {depth} Nodes: {num_nodes} Pending: {len(pending)}"
+            )
+            pbar.update(max(pbar.n, depth) - pbar.n)
+
+        pbar.close()
+
+    def _abandon(self, pending: dict):
+        """Leave the pending rollouts behind at the deadline without their virtual loss."""
+        for node in pending:
+            revert_virtual_loss(node, self.parallel.virtual_loss)
+            self._abandoned.add(node)
+
+    def _late_result(
+        self,
+        root_node: Node,
+        node: Node,
+        result: tuple,
+        frontier: Frontier,
+        budget: SearchBudget,
+        metrics: SearchMetrics,
+    ):
+        """Back up the result of a rollout that an earlier search left behind at its deadline."""
+        self._abandoned.discard(node)
+        depth, ancestor = 0, node
+        while ancestor is not None and ancestor is not root_node:
+            ancestor = ancestor.parent
+            depth += 1
+        # the node is in a subtree that is discarded since
+        if ancestor is None:
+            return
+        self._update(root_node, node, result, frontier, budget, metrics)
+        frontier.add(node, depth)
+
+    def _dispatch(self, node: Node, metrics: SearchMetrics):
+        """Start the rollout of the node without waiting for it."""
+        if self._cache_pool is not None:
+            self._cache_pool.submit(node)
+            return
+
+        self._pool.apply_async(
+            self._rollout_function,
+            (self._task(node, metrics),),
+            callback=lambda result: self._results.put((node, result)),
+            error_callback=lambda error: self._results.put((None, error)),
         )
 
-        # display the tree
-        measure = MeasureTree()
-        measure(root_node)
-        print(f"Number of nodes: {measure.num_nodes}")
-        print(f"Max depth: {measure.max_depth}")
+    @property
+    def _rollout_function(self) -> Callable:
+        return _rollout if self._arena is None else _rollout_slot
 
-        # save the current node
-        self._previous_node = decision
+    def _task(self, node: Node, metrics: SearchMetrics) -> Any:
+        """Prepare the argument of the rollout function for the node and count the state bytes it carries."""
+        task = self._make_task(node)
+        if isinstance(task, Node):
+            ancestor = task.parent
+            while ancestor is not None:
+                metrics.add("bytes_sent", len(ancestor.state or b""))
+                ancestor = ancestor.parent
+        elif task[0] is not None:
+            metrics.add("bytes_sent", len(task[0]))
+        return task
 
-        return decision.action, root_node
+    def _make_task(self, node: Node) -> Any:
+        if self._arena is None:
+            # rebuild the parent's state from its delta here rather than replaying it in the worker
+            if (
+                self._state_store is not None
+                and node.parent is not None
+                and node.parent.state is None
+            ):
+                state = self._state_store.state(node.parent)
+                if state is not None:
+                    parent = Node(action=node.parent.action, state=state)
+                    return Node(action=node.action, parent=parent)
+            return _rollout_task(node)
+
+        parent_slot = self._slot(node.parent)
+        if parent_slot is None and node.parent.state is None:
+            raise ValueError("The state of the parent is not available")
+
+        return (
+            node.parent.state if parent_slot is None else None,
+            parent_slot,
+            self._allocate_slot(node),
+            node.action,
+        )
+
+    def _slot(self, node: Node) -> int | None:
+        """Return the arena slot that holds the state of the node."""
+        if node not in self._slots:
+            # the states from the main process, e.g. the root state, go to the arena once
+            if node.state is None or self._allocate_slot(node) is None:
+                return None
+            if not self._arena.write(self._slots[node][0], node.state):
+                self._slots.pop(node)[1]()
+                return None
+        return self._slots[node][0]
+
+    def _allocate_slot(self, node: Node) -> int | None:
+        """Allocate a slot for the node, which is freed with the node."""
+        slot = self._arena.allocate()
+        if slot is None and not self._arena_exhausted:
+            # the discarded subtrees are only freed by the garbage collector, which is not
+            # worth running again until a slot has been freed since the last time
+            gc.collect()
+            slot = self._arena.allocate()
+            self._arena_exhausted = slot is None
+        if slot is None:
+            return None
+
+        self._slots[node] = (slot, weakref.finalize(node, self._free_slot, slot))
+        return slot
+
+    def _free_slot(self, slot: int):
+        self._arena.free(slot)
+        self._arena_exhausted = False
+
+    def _next_result(self, timeout: float | None = None) -> Tuple[Node, tuple] | None:
+        """Wait for the next finished rollout and return the node with its result.
+
+        Return None if no rollout finishes within the timeout in seconds.
+        """
+        if self._cache_pool is not None:
+            return self._cache_pool.next_result(timeout)
+
+        try:
+            node, result = self._results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        if node is None:
+            raise result
+        return node, result
+
+    def _update(
+        self,
+        root_node: Node,
+        node: Node,
+        result: tuple,
+        frontier: Frontier,
+        budget: SearchBudget,
+        metrics: SearchMetrics,
+    ):
+        """Apply the result of the rollouts of a node and backpropagate the rewards of each of them."""
+        state, is_terminated, rewards, key, seconds = result
+        metrics.add("rollouts", len(rewards))
+        # the other rollouts of a leaf repeat the reward of running it, see `rollouts`
+        metrics.add("steps", sum(len(r) for r in rewards) - (len(rewards) - 1))
+        metrics.add("worker_busy", seconds)
+        if state is not None:
+            metrics.add("bytes_received", len(state))
+        # the state stays in the worker with the state cache or in the arena
+        if state is not None:
+            node.state = bytes(state)
+            if node in self._slots:
+                self._slots.pop(node)[1]()
+        node.is_terminal = is_terminated
+        values = {c: c.value for c in root_node.children}
+
+        if self._transpositions is None:
+            for r in rewards:
+                backpropagate(node, list(r), reward_discount=0.7)
+            frontier.update(node)
+        else:
+            self._transpositions.register(node, key)
+            starts = set()
+            for r in rewards:
+                starts.update(
+                    self._transpositions.backpropagate(
+                        node, list(r), reward_discount=0.7
+                    )
+                )
+            for start in starts:
+                frontier.update(start)
+
+        # the store sees the state after an alias took over the one of its first node
+        if self._state_store is not None:
+            self._state_store.add(node)
+            self._state_store.add(node.parent)
+            self._state_store.evict(self._num_actions)
+
+        budget.record_change(root_node, values)
+
+    def _start_speculation(self):
+        """Start growing the tree under the chosen action in the background."""
+        self._speculation_stop.clear()
+        self._speculation = threading.Thread(
+            target=self._speculate, args=(self._previous_node,), daemon=True
+        )
+        self._speculation.start()
+
+    def _speculate(self, root_node: Node):
+        try:
+            self._speculation_budget.start()
+            self._grow(
+                root_node,
+                self._speculation_budget,
+                SearchMetrics(self.num_workers),
+                stop=self._speculation_stop,
+                verbose=False,
+            )
+        except Exception as error:
+            self._speculation_error = error
+
+    def _stop_speculation(self):
+        """Stop the background search and wait for its pending rollouts."""
+        if self._speculation is None:
+            return
+
+        self._speculation_stop.set()
+        self._speculation.join()
+        self._speculation = None
+
+        if self._speculation_error is not None:
+            error, self._speculation_error = self._speculation_error, None
+            raise error
+
+    def close(self):
+        """Stop the workers and release the shared resources."""
+        self._stop_speculation()
+        if self._pool is not None:
+            # the rollouts left behind at a deadline may still be sending their results, a worker
+            # that is terminated in the middle of it would keep the result queue locked
+            self._pool.close()
+            self._pool.join()
+        if self._cache_pool is not None:
+            self._cache_pool.close()
+        if self._arena is not None:
+            for _, finalizer in list(self._slots.values()):
+                finalizer.detach()
+            self._arena.close()
 
 
 class RolloutWorker:
@@ -0,0 +1,269 @@
+from typing import Callable, List, Tuple
+import functools
+
+import numpy as np
+
+import monte_carlo_tree_search as mcts
+from monte_carlo_tree_search import Node, VALUE_RANGE, action_weights
+
+
+class ArrayTree:
+    """Monte Carlo Tree Search tree stored in preallocated NumPy arrays.
+
+    The nodes are addressed by their index in the arrays and the root node is always at index 0.
+    The arrays grow by doubling their capacity when the tree is full. The root-parallel trees of
+    `AgentKane` are grown with it in the workers, see `agent_kane._search_tree`.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 1024,
+        state: bytes | None = None,
+        action: int = None,
+    ):
+        """
+        Initialize the tree with a single root node.
+        args:
+            capacity: The number of nodes to preallocate.
+            state: The serialized state of the root node.
+            action: The action of the root node.
+        """
+        self.size = 0
+        self.capacity = capacity
+        self.action = np.full(capacity, -1, dtype=np.int8)
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.depth = np.zeros(capacity, dtype=np.int32)
+        self.num_children = np.zeros(capacity, dtype=np.int32)
+        self.visits = np.zeros(capacity, dtype=np.int64)
+        self.value = np.zeros(capacity, dtype=np.float64)
+        self.value_squares = np.zeros(capacity, dtype=np.float64)
+        self.is_terminal = np.zeros(capacity, dtype=bool)
+        self.is_victory = np.zeros(capacity, dtype=bool)
+        # the states are opaque handles, so they are kept in a plain list
+        self.states: List[bytes | None] = [None] * capacity
+
+        # the weight of the missing action (-1) is the last item, which is 0
+        self._action_weights = np.array(action_weights + [0.0])
+
+        # the root node
+        self.add(-1, action, state)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def add(self, parent: int, action: int = None, state: bytes | None = None) -> int:
+        """Add a new node under the given parent and return its index."""
+        if self.size == self.capacity:
+            self._grow()
+
+        index = self.size
+        self.size += 1
+
+        self.action[index] = -1 if action is None else action
+        self.parent[index] = parent
+        self.states[index] = state
+        if parent >= 0:
+            self.depth[index] = self.depth[parent] + 1
+            self.num_children[parent] += 1
+
+        return index
+
+    def children(self, index: int) -> np.ndarray:
+        """Return the indices of the children of the given node."""
+        return np.flatnonzero(self.parent[: self.size] == index)
+
+    def ucb1(self, indices: np.ndarray, exploration_weight: float = 1.0) -> np.ndarray:
+        """Calculate the UCB1 values of the given nodes in one pass, see `monte_carlo_tree_search.ucb1`."""
+        visits = self.visits[indices]
+        parents = self.parent[indices]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = self.value[indices] / visits
+            parent_visits = self.visits[np.maximum(parents, 0)]
+            exploration = exploration_weight * np.sqrt(
+                2 * np.log(parent_visits) / visits
+            )
+            scores = (mean + exploration) * self._action_weights[self.action[indices]]
+
+        # the root node has no parent to explore against
+        scores = np.where(parents < 0, mean, scores)
+        # prioritize the unvisited nodes
+        return np.where(visits == 0, np.inf, scores)
+
+    def ucb1_tuned(
+        self,
+        indices: np.ndarray,
+        exploration_weight: float = 1.0,
+        value_range: float = VALUE_RANGE,
+    ) -> np.ndarray:
+        """Calculate the UCB1-Tuned values of the given nodes in one pass, see `monte_carlo_tree_search.ucb1_tuned`."""
+        visits = self.visits[indices]
+        parents = self.parent[indices]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = self.value[indices] / visits
+            variance = np.maximum(self.value_squares[indices] / visits - mean * mean, 0.0)
+            log_visits = np.log(self.visits[np.maximum(parents, 0)])
+            bound = variance / value_range**2 + np.sqrt(2 * log_visits / visits)
+            exploration = exploration_weight * np.sqrt(
+                log_visits / visits * np.minimum(0.25, bound)
+            )
+            scores = (mean + exploration) * self._action_weights[self.action[indices]]
+
+        scores = np.where(parents < 0, mean, scores)
+        return np.where(visits == 0, np.inf, scores)
+
+    def select(
+        self,
+        max_candidates: int = 8,
+        exploration_weight: float = 1.0,
+        action_space: int = 4,
+        scorer: Callable[["ArrayTree", np.ndarray, float], np.ndarray] | None = None,
+    ) -> List[Tuple[int, int, float]]:
+        """Score all nodes that are not fully expanded and select the most promising ones.
+
+        The terminal nodes are never expanded, so they are not candidates either.
+
+        parameters
+        ----------
+        max_candidates: int
+            The max number of selected candidate nodes
+        exploration_weight: float
+            The exploration weight for the UCB1 calculation.
+        action_space: int
+            The number of actions a node can be expanded with.
+        scorer: Callable
+            The vectorized score of the nodes, see `array_scorer`. None for `ArrayTree.ucb1`.
+
+        return
+        ------
+        List[Tuple[int, int, float]]
+            The list of selected node indices with the depth of the node and their UCB1 score.
+        """
+        candidates = np.flatnonzero(
+            (self.num_children[: self.size] < action_space)
+            & ~self.is_terminal[: self.size]
+        )
+        scores = (scorer or ArrayTree.ucb1)(self, candidates, exploration_weight)
+        weights = self._action_weights[self.action[candidates]]
+
+        # sort: ucb1 DESC, then the action weight DESC
+        order = np.lexsort((-weights, -scores))[:max_candidates]
+
+        return [
+            (int(candidates[i]), int(self.depth[candidates[i]]), float(scores[i]))
+            for i in order
+        ]
+
+    def expand(
+        self,
+        candidates: List[Tuple[int, int, float]],
+        num_actions: int,
+        max_expansions: int = 8,
+    ) -> List[int]:
+        """Expand the given nodes with their missing actions and return the indices of the new nodes."""
+        new_nodes = []
+
+        for index, _, _ in candidates:
+            # ignore the terminal node
+            if self.is_terminal[index]:
+                continue
+            # continue from the actions that are already expanded
+            for action in range(self.num_children[index], num_actions):
+                if len(new_nodes) >= max_expansions:
+                    return new_nodes
+                new_nodes.append(self.add(index, action))
+
+        return new_nodes
+
+    def backpropagate(
+        self, index: int, rewards: List[float], reward_discount: float = 0.9
+    ) -> float:
+        """Update the value of the nodes in the path from the given node to the root."""
+        rewards = np.asarray(rewards, dtype=np.float64)
+        cumulative_reward = float(
+            np.sum(rewards * reward_discount ** np.arange(len(rewards)))
+        )
+
+        # collect the path to the root, then update it in one pass
+        path = [index]
+        while self.parent[path[-1]] >= 0:
+            path.append(self.parent[path[-1]])
+
+        values = cumulative_reward * reward_discount ** np.arange(len(path))
+        self.visits[path] += 1
+        self.value[path] += values
+        self.value_squares[path] += values * values
+
+        return cumulative_reward
+
+    def best_action(self) -> int:
+        """Return the action of the root child with the highest value."""
+        children = self.children(0)
+        return int(self.action[children[np.argmax(self.value[children])]])
+
+    def to_node(self, index: int = 0) -> Node:
+        """Convert the subtree of the given node into `Node` objects."""
+        nodes = {}
+        # the parents are always added before their children
+        for i in [index, *self._descendants(index)]:
+            node = Node(
+                action=None if self.action[i] < 0 else int(self.action[i]),
+                state=self.states[i],
+                visits=int(self.visits[i]),
+                value=float(self.value[i]),
+                value_squares=float(self.value_squares[i]),
+                is_terminal=bool(self.is_terminal[i]),
+                is_victory=bool(self.is_victory[i]),
+            )
+            if i != index:
+                nodes[int(self.parent[i])].add(node)
+            nodes[i] = node
+
+        return nodes[index]
+
+    def _descendants(self, index: int) -> List[int]:
+        in_subtree = np.zeros(self.size, dtype=bool)
+        in_subtree[index] = True
+        for i in range(index + 1, self.size):
+            in_subtree[i] = in_subtree[self.parent[i]]
+        in_subtree[index] = False
+        return np.flatnonzero(in_subtree).tolist()
+
+    def _grow(self):
+        """Double the capacity of the arrays."""
+        for name in (
+            "action",
+            "parent",
+            "depth",
+            "num_children",
+            "visits",
+            "value",
+            "value_squares",
+            "is_terminal",
+            "is_victory",
+        ):
+            array = getattr(self, name)
+            grown = np.empty(self.capacity * 2, dtype=array.dtype)
+            grown[: self.capacity] = array
+            grown[self.capacity :] = -1 if name in ("action", "parent") else 0
+            setattr(self, name, grown)
+
+        self.states.extend([None] * self.capacity)
+        self.capacity *= 2
+
+
+def array_scorer(
+    scorer: Callable[[Node, float], float]
+) -> Callable[[ArrayTree, np.ndarray, float], np.ndarray]:
+    """Return the vectorized version of a `Node` scorer, `ucb1` or `ucb1_tuned`.
+
+    The keywords of a `functools.partial`, e.g. the value range of `ucb1_tuned`, are kept.
+    """
+    if isinstance(scorer, functools.partial):
+        return functools.partial(array_scorer(scorer.func), **scorer.keywords)
+    if scorer is mcts.ucb1:
+        return ArrayTree.ucb1
+    if scorer is mcts.ucb1_tuned:
+        return ArrayTree.ucb1_tuned
+    raise ValueError(f"{scorer} has no vectorized version for the array-backed tree")
@@ -0,0 +1,44 @@
+"""Run from the root of the repository with `python -m benchmarks.restore_benchmark`."""
+
+import time
+
+from environment import create_env
+from monte_carlo_tree_search import Node, rollout
+
+
+def benchmark(num_rollouts: int = 200, horizon: int = 16) -> dict:
+    """
+    Measure the rollouts per second with the reset before the state is loaded and with `restore`.
+
+    Parameters
+    ----------
+    num_rollouts : int
+        The number of rollouts of each way.
+    horizon : int
+        The number of random steps of a rollout.
+    """
+    env = create_env(headless=True, with_reward=True)
+    env.reset()
+    # a few steps into the level, so the state is not the one of a reset
+    for _ in range(8):
+        env.step(1)
+    state = env.serialize()
+
+    results = {}
+    for restore in (False, True):
+        t_0 = time.perf_counter()
+        for _ in range(num_rollouts):
+            rollout(Node(state=state), env, horizon=horizon, restore=restore)
+        results["restore" if restore else "reset"] = num_rollouts / (
+            time.perf_counter() - t_0
+        )
+
+    env.close()
+    return results
+
+
+if __name__ == "__main__":
+    results = benchmark()
+    for name, rate in results.items():
+        print(f"{name}: {rate:.1f} rollouts/s")
+    print(f"speedup: {results['restore'] / results['reset']:.2f}x")
@@ -0,0 +1,51 @@
+"""Run from the root of the repository with `python -m benchmarks.snapshot_codec_benchmark`."""
+
+import lzma
+import time
+
+from environment import create_env
+import snapshot_codec
+
+
+def benchmark(num_steps: int = 500) -> dict:
+    """
+    Measure the encoding and decoding cost of the deltas between the states of consecutive steps
+    against the bytes they save.
+
+    Parameters
+    ----------
+    num_steps : int
+        The number of random steps to take the states from.
+    """
+    env = create_env(headless=True, with_reward=True)
+    env.reset()
+    states = [env.serialize()]
+    for _ in range(num_steps):
+        _, _, terminated, truncated, _ = env.step(env.action_space.sample())
+        if terminated or truncated:
+            env.reset()
+        states.append(env.serialize())
+    env.close()
+
+    pairs = list(zip(states[:-1], states[1:]))
+    t_0 = time.perf_counter()
+    deltas = [snapshot_codec.encode(base, state) for base, state in pairs]
+    t_1 = time.perf_counter()
+    for (base, _), delta in zip(pairs, deltas):
+        snapshot_codec.decode(base, delta)
+    t_2 = time.perf_counter()
+
+    full_size = sum(len(state) for _, state in pairs)
+    return {
+        "encode_us": (t_1 - t_0) / len(pairs) * 1e6,
+        "decode_us": (t_2 - t_1) / len(pairs) * 1e6,
+        "full_bytes": full_size / len(pairs),
+        "delta_bytes": sum(len(delta) for delta in deltas) / len(pairs),
+        "lzma_full_bytes": sum(len(lzma.compress(s)) for _, s in pairs) / len(pairs),
+        "lzma_delta_bytes": sum(len(lzma.compress(d)) for d in deltas) / len(pairs),
+    }
+
+
+if __name__ == "__main__":
+    for name, value in benchmark().items():
+        print(f"{name}: {value:.1f}")
@@ -0,0 +1,120 @@
+from typing import List, Tuple
+import json
+import sqlite3
+
+# the action, visits, value, squared values, terminal and victory status of a root child
+ChildStats = Tuple[int, int, float, float, bool, bool]
+
+
+class DecisionCache:
+    """An on-disk map from the emulator states to the statistics of the root children of past searches.
+
+    The same states come up in every episode of a level, so a search can start from the statistics
+    of the previous ones, or be skipped when they already settle the decision. The least recently
+    used states are evicted beyond the size cap. The lookups only mark the states as used in memory,
+    the marks are written with the next `put` or on `close`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 100_000,
+        min_visits: int = 1000,
+        confidence: float = 0.8,
+    ):
+        """
+        Open or create the cache.
+        args:
+            path: The SQLite database file, ":memory:" for a cache of this process only.
+            max_entries: The max number of states in the cache.
+            min_visits: The number of visits of the root children a confident decision needs.
+            confidence: The share of the visits the chosen child needs for a confident decision.
+        """
+        self.max_entries = max_entries
+        self.min_visits = min_visits
+        self.confidence = confidence
+
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS decisions"
+            " (key BLOB PRIMARY KEY, children TEXT NOT NULL, used INTEGER NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS decisions_used ON decisions (used)"
+        )
+        self._connection.commit()
+        self._clock = self._connection.execute(
+            "SELECT COALESCE(MAX(used), 0) FROM decisions"
+        ).fetchone()[0]
+
+        # the states looked up since the last write with their last use
+        self._touched = {}
+
+        # the statistics of the lookups
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM decisions").fetchone()[0]
+
+    def get(self, key: bytes) -> List[ChildStats] | None:
+        """Return the statistics of the root children of the state, or None if it is not cached."""
+        row = self._connection.execute(
+            "SELECT children FROM decisions WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self._touched[key] = self._tick()
+        # the rows of the older caches have no terminal and victory status
+        return [
+            tuple(child) + (False,) * (6 - len(child)) for child in json.loads(row[0])
+        ]
+
+    def put(self, key: bytes, children: List[ChildStats]):
+        """Store the statistics of the root children of the state and evict beyond the size cap."""
+        self._write_touched()
+        self._connection.execute(
+            "INSERT OR REPLACE INTO decisions (key, children, used) VALUES (?, ?, ?)",
+            (key, json.dumps(children), self._tick()),
+        )
+        self._connection.execute(
+            "DELETE FROM decisions WHERE key IN"
+            " (SELECT key FROM decisions ORDER BY used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+        self._connection.commit()
+
+    def decision(self, children: List[ChildStats]) -> int | None:
+        """Return the action of the children if the decision is confident, otherwise None.
+
+        The action is chosen the same way as the search does, by the largest value.
+        """
+        total_visits = sum(child[1] for child in children)
+        if total_visits < self.min_visits:
+            return None
+
+        action, visits = max(children, key=lambda child: child[2])[:2]
+        if visits < self.confidence * total_visits:
+            return None
+        return action
+
+    def close(self):
+        self._write_touched()
+        self._connection.commit()
+        self._connection.close()
+
+    def _write_touched(self):
+        """Write the last uses of the states looked up since the last write."""
+        if self._touched:
+            self._connection.executemany(
+                "UPDATE decisions SET used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _tick(self) -> int:
+        self._clock += 1
+        return self._clock
@@ -10,6 +10,7 @@ def create_env(
     headless: bool = False,
     with_reward: bool = False,
     render_mode: str = "rgb_array",
+    reward_source: str = "info",
 ) -> Env:
     """
     Create the environment that host the game.
@@ -24,6 +25,8 @@ def create_env(
         Whether to use the `MarioReward` wrapper for the environment.
     render_mode : str
         The mode to render the game for the environment.
+    reward_source : str
+        Where `MarioReward` reads the position of Mario from, "info" or "ram".
     """
     # create the basic environment
     env = make("SuperMarioBros-4-1-v0", render_mode=render_mode, headless=headless)
@@ -33,7 +36,7 @@ def create_env(
 
     # the reward for speedrunning
     if with_reward:
-        env = MarioReward(env)
+        env = MarioReward(env, reward_source=reward_source)
 
     # the frame skip to save computational costs
     if frame_skip > 0:
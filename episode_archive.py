@@ -0,0 +1,235 @@
+from pathlib import Path
+from typing import Iterator, List, NamedTuple
+import io
+import json
+import lzma
+import struct
+
+import numpy as np
+
+import snapshot_codec
+
+# the name of the archive in a recording directory
+ARCHIVE_NAME = "episode.archive"
+
+_MAGIC = b"MARIOEP1"
+# the magic, the index, the kind of the state and the lengths of the play info, the state and the tree
+_RECORD = struct.Struct("<4sIBIII")
+_RECORD_MAGIC = b"STEP"
+# the offset of the index, the number of steps and the magic
+_FOOTER = struct.Struct("<QI8s")
+_FOOTER_MAGIC = b"EPINDEX1"
+
+# the kinds of the saved states
+KEYFRAME = 0
+DELTA = 1
+
+
+class Step(NamedTuple):
+    """A step of a recorded episode."""
+
+    index: int
+    play_info: dict
+    state: bytes
+    tree: np.ndarray | None
+
+
+class EpisodeWriter:
+    """Append the steps of an episode to a single file.
+
+    Every step is a record with its own header, so the steps written before a crash can still be
+    read. The index of the records is appended as a footer by `close`, the reader rebuilds it by
+    scanning the records when the footer is missing.
+    """
+
+    def __init__(self, path: Path):
+        """
+        args:
+            path: The file of the archive, it must not exist yet.
+        """
+        self.path = Path(path)
+        self._file = self.path.open("xb")
+        self._file.write(_MAGIC)
+        self._offsets = []
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def append(
+        self,
+        play_info: dict,
+        state: bytes,
+        kind: int = KEYFRAME,
+        tree: np.ndarray | None = None,
+    ):
+        """
+        Append a step.
+        args:
+            play_info: The meta data of the step.
+            state: The lzma compressed state, or its delta against the state of the previous step.
+            kind: `KEYFRAME` or `DELTA`.
+            tree: The flattened search tree, see `tree_recording.flatten`.
+        """
+        info = json.dumps(play_info).encode()
+        tree_data = b""
+        if tree is not None:
+            buffer = io.BytesIO()
+            np.save(buffer, tree)
+            tree_data = buffer.getvalue()
+
+        self._offsets.append(self._file.tell())
+        self._file.write(
+            _RECORD.pack(
+                _RECORD_MAGIC,
+                len(self._offsets) - 1,
+                kind,
+                len(info),
+                len(state),
+                len(tree_data),
+            )
+        )
+        self._file.write(info)
+        self._file.write(state)
+        self._file.write(tree_data)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        """Write the index and close the file."""
+        if self._file.closed:
+            return
+        index_offset = self._file.tell()
+        self._file.write(np.array(self._offsets, dtype=np.uint64).tobytes())
+        self._file.write(_FOOTER.pack(index_offset, len(self._offsets), _FOOTER_MAGIC))
+        self._file.close()
+
+
+class EpisodeReader:
+    """Read the steps of an archive by their index or in order."""
+
+    def __init__(self, path: Path):
+        """
+        args:
+            path: The file of the archive.
+        """
+        self.path = Path(path)
+        self._file = self.path.open("rb")
+        if self._file.read(len(_MAGIC)) != _MAGIC:
+            raise ValueError(f"{path} is not an episode archive")
+        self._offsets = self._read_index()
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> Step:
+        return Step(index, self.play_info(index), self.state(index), self.tree(index))
+
+    def __iter__(self) -> Iterator[Step]:
+        """Stream the steps, the deltas are applied to the previous states as they come."""
+        state = None
+        for index in range(len(self)):
+            header, payload = self._read(index, tree=True)
+            state = self._decode(header, payload, state)
+            yield Step(index, self._info(header, payload), state, self._tree(index, header))
+
+    def play_info(self, index: int) -> dict:
+        """Return the meta data of the step."""
+        header, payload = self._read(index, state=False)
+        return self._info(header, payload)
+
+    def state(self, index: int) -> bytes:
+        """Return the state after the step, replaying the deltas from the last keyframe."""
+        self._check(index)
+        # walk back to the keyframe
+        records = []
+        for i in range(index, -1, -1):
+            records.append(self._read(i))
+            if records[-1][0][2] == KEYFRAME:
+                break
+        else:
+            raise ValueError(f"No keyframe is recorded before the step {index}")
+
+        state = None
+        for header, payload in reversed(records):
+            state = self._decode(header, payload, state)
+        return state
+
+    def tree(self, index: int) -> np.ndarray | None:
+        """Return the flattened search tree of the step, memory-mapped from the archive."""
+        header, _ = self._read(index, state=False)
+        return self._tree(index, header)
+
+    def close(self):
+        self._file.close()
+
+    def _check(self, index: int):
+        if not 0 <= index < len(self._offsets):
+            raise IndexError(f"No step {index} is recorded")
+
+    def _read(self, index: int, state: bool = True, tree: bool = False) -> tuple:
+        """Read the header of the record and its payload, up to the parts that are needed."""
+        self._check(index)
+        self._file.seek(self._offsets[index])
+        header = _RECORD.unpack(self._file.read(_RECORD.size))
+        _, _, _, info_length, state_length, tree_length = header
+        length = info_length
+        if state or tree:
+            length += state_length
+        if tree:
+            length += tree_length
+        return header, self._file.read(length)
+
+    def _info(self, header: tuple, payload: bytes) -> dict:
+        return json.loads(payload[: header[3]])
+
+    def _decode(self, header: tuple, payload: bytes, previous: bytes | None) -> bytes:
+        _, index, kind, info_length, state_length, _ = header
+        data = lzma.decompress(payload[info_length : info_length + state_length])
+        if kind == KEYFRAME:
+            return data
+        if previous is None:
+            raise ValueError(f"No state is recorded before the delta of the step {index}")
+        return snapshot_codec.decode(previous, data)
+
+    def _tree(self, index: int, header: tuple) -> np.ndarray | None:
+        _, _, _, info_length, state_length, tree_length = header
+        if tree_length == 0:
+            return None
+        self._file.seek(
+            self._offsets[index] + _RECORD.size + info_length + state_length
+        )
+        version = np.lib.format.read_magic(self._file)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(self._file)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(self._file)
+        return np.memmap(
+            self.path, dtype=dtype, mode="r", offset=self._file.tell(), shape=shape
+        )
+
+    def _read_index(self) -> List[int]:
+        """Read the index from the footer, or rebuild it if the writer did not close the archive."""
+        size = self._file.seek(0, io.SEEK_END)
+        if size >= len(_MAGIC) + _FOOTER.size:
+            self._file.seek(size - _FOOTER.size)
+            index_offset, num_steps, magic = _FOOTER.unpack(self._file.read(_FOOTER.size))
+            if magic == _FOOTER_MAGIC:
+                self._file.seek(index_offset)
+                offsets = np.frombuffer(
+                    self._file.read(num_steps * 8), dtype=np.uint64
+                )
+                return [int(offset) for offset in offsets]
+
+        # scan the records, a truncated last record is dropped
+        offsets = []
+        offset = len(_MAGIC)
+        while offset + _RECORD.size <= size:
+            self._file.seek(offset)
+            header = _RECORD.unpack(self._file.read(_RECORD.size))
+            end = offset + _RECORD.size + sum(header[3:])
+            if header[0] != _RECORD_MAGIC or end > size:
+                break
+            offsets.append(offset)
+            offset = end
+        return offsets
@@ -23,3 +23,25 @@ class FrameSkip(Wrapper):
 
         # return the latest data with the accumulated reward
         return obs, total_reward, terminated, truncated, info
+
+    def step_lean(self, action: int) -> tuple:
+        """Execute the action for a number of frames with the lean steps of the wrapped environment.
+
+        The observation and the `info` dict are not produced, see `MarioReward.step_lean`.
+        """
+        total_reward = 0
+        for _ in range(self.frame_skip):
+            reward, terminated, truncated, info = self.env.step_lean(action)
+            total_reward += reward
+            if terminated or truncated:
+                break
+
+        return total_reward, terminated, truncated, info
+
+    def restore(self, state: bytes):
+        """Restore the state with the `restore` of the wrapped environment, or with a reset if it has none."""
+        if hasattr(self.env, "restore"):
+            self.env.restore(state)
+        else:
+            self.env.reset()
+            self.env.deserialize(state)
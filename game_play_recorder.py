@@ -1,41 +1,245 @@
-import numpy as np
-from PIL import Image
 from pathlib import Path
 from monte_carlo_tree_search import Node
-import pickle
 import lzma
 import json
+import csv
+import queue
+import threading
+import time
+from typing import Any, Callable, List
+from collections import OrderedDict
+import numpy as np
+
+import snapshot_codec
+from episode_archive import ARCHIVE_NAME, DELTA, KEYFRAME, EpisodeReader, EpisodeWriter
+from tree_recording import flatten, save_tree
+
+# the open readers of the archives in the LRU order, with the size and the modification time of the
+# version of the archive they read
+_readers = OrderedDict()
+_MAX_READERS = 8
 
 
 class GamePlayRecorder:
 
-    def __init__(self, recording_name: str):
+    def __init__(
+        self,
+        recording_name: str,
+        keyframe_interval: int = 30,
+        background: bool = False,
+        max_queued: int = 16,
+        archive: bool = False,
+    ):
+        """
+        args:
+            recording_name: The directory of the recording.
+            keyframe_interval: Every this many steps the full state is saved, the states between
+                are saved as deltas against the previous ones, see `snapshot_codec`.
+            background: Write the recording in a background thread, `record` only takes a snapshot
+                of the tree and queues it. Call `flush` or `close` to wait for the writes.
+            max_queued: The number of steps that can wait for the background thread before `record`
+                blocks until it catches up.
+            archive: Append the steps to a single `episode_archive` file in the directory instead of
+                writing the files of each step.
+        """
         self._output_dir = Path(recording_name)
         self._output_dir.mkdir(parents=True)
         self._index = 0
+        self.keyframe_interval = keyframe_interval
+        self._previous_state = None
+        self._archive = None
+        if archive:
+            self._archive = EpisodeWriter(Path(self._output_dir, ARCHIVE_NAME))
+
+        # the backpressure of the background writes
+        self.num_blocked = 0
+        self.blocked_seconds = 0.0
+        self.max_backlog = 0
+
+        self._queue = None
+        self._writer = None
+        self._error = None
+        if background:
+            self._queue = queue.Queue(maxsize=max_queued)
+            self._writer = threading.Thread(target=self._write_loop, daemon=True)
+            self._writer.start()
+
+    @property
+    def backlog(self) -> int:
+        """Return the number of writes waiting for the background thread."""
+        return 0 if self._queue is None else self._queue.qsize()
 
     def record(self, play_info: dict, state: bytes, tree: Node):
+        # the tree keeps changing in the next searches, so it is copied before the handoff
+        self._submit(self._write_step, self._index, play_info, state, flatten(tree))
+        # increase the index
+        self._index += 1
+
+    def record_metrics(self, metrics: dict):
+        """Append the metrics of a decision to `metrics.jsonl` and `metrics.csv` in the recording."""
+        self._submit(self._write_metrics, metrics)
+
+    def flush(self):
+        """Wait until the queued writes are done."""
+        if self._queue is not None:
+            self._queue.join()
+        self._raise_error()
+        if self._archive is not None:
+            self._archive.flush()
+
+    def close(self):
+        """Finish the queued writes and stop the background thread."""
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join()
+            self._writer = None
+        if self._archive is not None:
+            self._archive.close()
+        self._raise_error()
+
+    def _submit(self, write: Callable, *args: Any):
+        if self._writer is None:
+            write(*args)
+            return
+
+        self._raise_error()
+        try:
+            self._queue.put_nowait((write, args))
+        except queue.Full:
+            # the writer falls behind, wait for it rather than piling up the snapshots
+            t_0 = time.perf_counter()
+            self._queue.put((write, args))
+            self.num_blocked += 1
+            self.blocked_seconds += time.perf_counter() - t_0
+        self.max_backlog = max(self.max_backlog, self._queue.qsize())
+
+    def _write_loop(self):
+        while (item := self._queue.get()) is not None:
+            write, args = item
+            try:
+                if self._error is None:
+                    write(*args)
+            except Exception as error:
+                # raised in the game loop by the next call
+                self._error = error
+            finally:
+                self._queue.task_done()
+        self._queue.task_done()
+
+    def _raise_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def _write_step(
+        self, index: int, play_info: dict, state: bytes, tree: np.ndarray
+    ):
+        # the state is saved as a delta against the previous one between the keyframes
+        delta = None
+        if self._previous_state is not None and index % self.keyframe_interval:
+            delta = snapshot_codec.encode(self._previous_state, state)
+        self._previous_state = state
+
+        if self._archive is not None:
+            if delta is None:
+                self._archive.append(play_info, lzma.compress(state), KEYFRAME, tree)
+            else:
+                self._archive.append(play_info, lzma.compress(delta), DELTA, tree)
+            return
+
         # the stem for the data
-        file_stem = Path(self._output_dir, f"{self._index:04d}")
+        file_stem = Path(self._output_dir, f"{index:04d}")
 
         # save the meata data
         json.dump(play_info, file_stem.with_suffix(".json").open("w"))
 
         # save the state
-        file_stem.with_suffix(".state.xz").write_bytes(lzma.compress(state))
-        # increase the index
-        self._index += 1
+        if delta is None:
+            file_stem.with_suffix(".state.xz").write_bytes(lzma.compress(state))
+        else:
+            file_stem.with_suffix(".delta.xz").write_bytes(lzma.compress(delta))
+
+        # save the tree, see `tree_recording.TreeRecording` to read it
+        save_tree(file_stem.with_suffix(".tree.npy"), tree)
+
+    def _write_metrics(self, metrics: dict):
+        with Path(self._output_dir, "metrics.jsonl").open("a") as f:
+            f.write(json.dumps(metrics) + "\n")
+
+        csv_file = Path(self._output_dir, "metrics.csv")
+        is_new = not csv_file.exists()
+        with csv_file.open("a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(metrics))
+            if is_new:
+                writer.writeheader()
+            writer.writerow(metrics)
+
+
+def load_state(recording_dir: Path, index: int) -> bytes:
+    """
+    Load the state of a step of a recording, replaying the deltas from the last keyframe.
+    args:
+        recording_dir: The directory of the recording.
+        index: The index of the step.
+    returns:
+        bytes: The state after the step.
+    """
+    archive = _open_archive(recording_dir)
+    if archive is not None:
+        return archive.state(index)
+
+    file_stem = Path(recording_dir, f"{index:04d}")
+    keyframe = file_stem.with_suffix(".state.xz")
+    if keyframe.exists():
+        return lzma.decompress(keyframe.read_bytes())
+
+    delta_file = file_stem.with_suffix(".delta.xz")
+    if not delta_file.exists() or index == 0:
+        raise ValueError(f"No state is recorded for the step {index}")
+    delta = lzma.decompress(delta_file.read_bytes())
+    return snapshot_codec.decode(load_state(recording_dir, index - 1), delta)
+
+
+def load_play_info(recording_dir: Path, index: int) -> dict:
+    """Load the meta data of a step of a recording, e.g. its action."""
+    archive = _open_archive(recording_dir)
+    if archive is not None:
+        return archive.play_info(index)
+    return json.loads(Path(recording_dir, f"{index:04d}.json").read_text())
+
+
+def recorded_steps(recording_dir: Path) -> List[int]:
+    """Return the indices of the steps that have a state in the recording."""
+    archive = _open_archive(recording_dir)
+    if archive is not None:
+        return list(range(len(archive)))
+    return sorted(
+        int(path.name.split(".")[0])
+        for pattern in ("*.state.xz", "*.delta.xz")
+        for path in Path(recording_dir).glob(pattern)
+    )
+
+
+def _open_archive(recording_dir: Path) -> EpisodeReader | None:
+    """Return the reader of the archive in the recording, None for the recordings of separate files."""
+    path = Path(recording_dir, ARCHIVE_NAME)
+    if not path.exists():
+        return None
+    stat = path.stat()
+    version = (stat.st_size, stat.st_mtime_ns)
+
+    # the tools look up the steps one by one, so the index is read once per version of the archive
+    cached = _readers.pop(path, None)
+    if cached is not None and cached[0] == version:
+        reader = cached[1]
+    else:
+        # an archive that is still being written is read again once it grows
+        if cached is not None:
+            cached[1].close()
+        reader = EpisodeReader(path)
+    _readers[path] = (version, reader)
 
-        # save the tree
-        def to_dict(node: Node) -> dict:
-            return {
-                "action": node.action,
-                "visits": node.visits,
-                "value": node.value,
-                "is_terminal": node.is_terminal,
-                "is_victory": node.is_victory,
-                "children": [to_dict(child) for child in node.children],
-            }
-
-        tree_data = to_dict(tree)
-        file_stem.with_suffix(".tree.json").write_bytes(pickle.dumps(tree_data))
+    while len(_readers) > _MAX_READERS:
+        _, (_, evicted) = _readers.popitem(last=False)
+        evicted.close()
+    return reader
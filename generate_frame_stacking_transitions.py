@@ -2,7 +2,7 @@
 
 from pathlib import Path
 from run import create_env
-import json
+from game_play_recorder import load_play_info
 import shutil
 import numpy as np
 import gymnasium as gym
@@ -25,7 +25,9 @@ FAST_MOVE = [
 def replay(replay: str):
     if replay is None:
         # get the latest directory
-        saved_dir = sorted(Path("data").iterdir(), reverse=True)[0]
+        saved_dir = sorted(
+            (path for path in Path("data").iterdir() if path.is_dir()), reverse=True
+        )[0]
         if not saved_dir.exists():
             raise ValueError("No saved game play found")
         print(f"Using the latest directory: {saved_dir}")
@@ -52,7 +54,7 @@ def replay(replay: str):
     done, index, frames = False, 0, 0
     while not done:
         # read the step data
-        step_info = json.loads(Path(saved_dir, f"{index:04d}.json").read_text())
+        step_info = load_play_info(saved_dir, index)
         # run the game with 8 steps
         for _ in range(8):
             # step
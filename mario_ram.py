@@ -0,0 +1,54 @@
+"""
+The addresses of the Super Mario Bros. RAM the reward is computed from, the same ones the `info` of
+`SuperMarioBrosEnv` is built from. Reading them directly skips the `info` dict of every frame.
+"""
+
+import numpy as np
+
+# the horizontal position is the page of the level and the pixel within the page
+X_PAGE = 0x006D
+X_PIXEL = 0x0086
+# the vertical position on the screen and the viewport, which is 1 on the screen, 0 above it in the
+# area of the score board and above 1 below it, i.e. falling into a pit
+Y_PIXEL = 0x03B8
+Y_VIEWPORT = 0x00B5
+# the state of the player, 0x06 means dead
+PLAYER_STATE = 0x000E
+DEAD = 0x06
+# the game mode, 2 means the end of the world
+GAME_MODE = 0x0770
+WORLD_OVER = 2
+# the enemies that mark the end of a stage when Mario touches them
+ENEMY_TYPES = (0x0016, 0x0017, 0x0018, 0x0019, 0x001A)
+STAGE_OVER_ENEMIES = (0x2D, 0x31)
+PLAYER_FLOAT_STATE = 0x001D
+FLAGPOLE = 3
+
+
+def x_position(ram: np.ndarray) -> int:
+    """Return the horizontal position of Mario in the level, `info["x_pos"]`."""
+    return int(ram[X_PAGE]) * 0x100 + int(ram[X_PIXEL])
+
+
+def y_position(ram: np.ndarray) -> int:
+    """Return the vertical position of Mario from the bottom, `info["y_pos"]`."""
+    y_pixel = int(ram[Y_PIXEL])
+    # above the top of the screen, the position overflows past 255
+    if ram[Y_VIEWPORT] < 1:
+        return 255 + (255 - y_pixel)
+    return 255 - y_pixel
+
+
+def flag_get(ram: np.ndarray) -> bool:
+    """Return True if Mario finished the world or the stage, `info["flag_get"]`."""
+    if ram[GAME_MODE] == WORLD_OVER:
+        return True
+    for address in ENEMY_TYPES:
+        if ram[address] in STAGE_OVER_ENEMIES:
+            return ram[PLAYER_FLOAT_STATE] == FLAGPOLE
+    return False
+
+
+def is_dead(ram: np.ndarray) -> bool:
+    """Return True if Mario is dead, `info["is_dead"]`."""
+    return ram[PLAYER_STATE] == DEAD
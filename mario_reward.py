@@ -1,6 +1,16 @@
-from typing import Any
+from typing import Any, NamedTuple, Tuple
 from gym_super_mario_bros import SuperMarioBrosEnv
 from gymnasium import Wrapper, Env
+import mario_ram
+
+
+class LeanInfo(NamedTuple):
+    """The fields of `info` returned by the lean steps."""
+
+    x_pos: int
+    y_pos: int
+    flag_get: bool
+    is_dead: bool
 
 
 class MarioReward(Wrapper):
@@ -13,20 +23,30 @@ class MarioReward(Wrapper):
         self,
         env: Env,
         max_stuck_frames: int = 8,
+        reward_source: str = "info",
     ):
         """
         Initialize the wrapper.
         args:
             env: The environment to wrap.
             max_stuck_frame: int The maximum number of frames the agent can be stuck before the episode is terminated.
+            reward_source: "info" to compute the reward from the `info` of the wrapped environment,
+                "ram" to read the position of Mario straight from the emulator RAM.
         """
         super().__init__(env)
+        if reward_source not in ("info", "ram"):
+            raise ValueError(f"Unknown reward source: {reward_source}")
         self.max_stuck_frames = max_stuck_frames
+        self.reward_source = reward_source
 
         # the progress of the gamy
         self._progress = 0
+        # the progress at the last reset, which `restore` starts from the same as a reset would
+        self._reset_progress = 0
         # the number of frames the agent has been stuck
         self._n_stuck_frames = 0
+        # the action map of the joypad space, found on the first lean step
+        self._action_map = None
 
     def reset(
         self, *, seed: int | None = None, options: dict[str, Any] | None = None
@@ -36,21 +56,111 @@ class MarioReward(Wrapper):
 
         # reset the internal variables with the new episode
         self._progress = info["x_pos"]
+        self._reset_progress = self._progress
         self._n_stuck_frames = 0
 
         return obs, info
 
+    def restore(self, state: bytes):
+        """
+        Restore the emulator state without resetting the emulator first, and re-sync the wrappers
+        with it. The progress starts from the position of the last reset, the same as after a reset
+        and `deserialize`, so the first step after the restore is rewarded the same way.
+        args:
+            state: The state serialized by `serialize`.
+        """
+        self.env.deserialize(state)
+
+        # clear the end of the episode the emulator may be left in by the last rollout
+        mario = self.unwrapped
+        mario.done = False
+        mario._did_reset()
+        env = self.env
+        while env is not mario:
+            if hasattr(env, "_elapsed_steps"):
+                env._elapsed_steps = 0
+            env = env.env
+
+        self._progress = self._reset_progress
+        self._n_stuck_frames = 0
+
     def step(self, action: int) -> tuple:
         # call to the step but ignore the reward because we are going to replace it
         obs, _, terminated, truncated, info = self.env.step(action)
 
-        # get the information from the environment
-        x_pos, y_pos = info["x_pos"], info["y_pos"]
-        flag_get, is_dead = info["flag_get"], info["is_dead"]
+        if self.reward_source == "ram":
+            reward, done = self._reward(*self._read_ram())
+        else:
+            reward, done = self._reward(
+                info["x_pos"], info["y_pos"], info["flag_get"], info["is_dead"]
+            )
+
+        return obs, reward, terminated or done, truncated, info
+
+    def step_lean(self, action: int) -> Tuple[float, bool, bool, LeanInfo]:
+        """
+        Step the emulator without the observation and the `info` dict, for the headless simulations.
+        The joypad mapping, the done flag, the reward bookkeeping of the base environment and the time
+        limits of the wrapped environments are applied directly, and the reward is always read from
+        the RAM.
+        args:
+            action: The action of the joypad space.
+        returns:
+            float: The reward, the same as the one of `step`.
+            bool: Whether the episode is terminated.
+            bool: Whether the episode is truncated.
+            LeanInfo: The fields of `info` the reward is computed from.
+        """
+        mario = self.unwrapped
+        if self._action_map is None:
+            self._action_map = _find_action_map(self.env)
+
+        mario._frame_advance(self._action_map[action])
+        # the base reward is not used, but it keeps track of the last position and time of Mario
+        mario._get_reward()
+        mario.done = bool(mario._get_done())
+        mario._did_step(mario.done)
+        truncated = self._count_step()
+
+        info = self._read_ram()
+        reward, done = self._reward(*info)
+
+        return reward, mario.done or done, truncated, info
+
+    def _count_step(self) -> bool:
+        """Count the lean step in the time limits of the wrapped environments, return True if one is reached."""
+        truncated = False
+        env = self.env
+        while env is not self.unwrapped:
+            if hasattr(env, "_elapsed_steps"):
+                env._elapsed_steps += 1
+                if env._elapsed_steps >= env._max_episode_steps:
+                    truncated = True
+            env = env.env
+        return truncated
+
+    def _read_ram(self) -> LeanInfo:
+        """Read the fields of `info` the reward needs from the emulator RAM."""
+        ram = self.unwrapped.ram
+        return LeanInfo(
+            mario_ram.x_position(ram),
+            mario_ram.y_position(ram),
+            mario_ram.flag_get(ram),
+            mario_ram.is_dead(ram),
+        )
 
+    def _reward(
+        self, x_pos: int, y_pos: int, flag_get: bool, is_dead: bool
+    ) -> Tuple[float, bool]:
+        """
+        Compute the reward from the position of Mario.
+        returns:
+            float: The reward.
+            bool: True if the episode is terminated by the death or the stuck.
+        """
         # death penalty and
         if is_dead or y_pos < 75:
-            return obs, -50, True, truncated, info
+            return -50, True
 
         # stuck penalty
         x_displacement = x_pos - self._progress
@@ -63,8 +173,7 @@ class MarioReward(Wrapper):
             stuck_penalty = -self._n_stuck_frames
             # early termination if stuck
             if self._n_stuck_frames >= self.max_stuck_frames:
-                # return obs, stuck_penalty, True, truncated, info
-                return obs, stuck_penalty, True, truncated, info
+                return stuck_penalty, True
 
             # x position reward
             x_reward = x_displacement
@@ -81,7 +190,27 @@ class MarioReward(Wrapper):
             flag_reward = 0
 
         # put it all together
-        reward = stuck_penalty + x_reward + flag_reward
+        return stuck_penalty + x_reward + flag_reward, False
+
+
+def _find_action_map(env: Env) -> list:
+    """Return the action map of the `JoypadSpace` in the wrapped environments."""
+    while not hasattr(env, "_action_map"):
+        if not hasattr(env, "env"):
+            raise ValueError("The environment does not have a joypad space")
+        env = env.env
+    return env._action_map
 
-        # return obs, reward, terminated, truncated, info
-        return obs, reward, terminated, truncated, info
+
+def pit_evaluator(info: dict, ground_level: int = 79, death_penalty: float = -50) -> float:
+    """
+    Score the state where a rollout is cut off. Mario below the ground level is falling into a pit,
+    so the death penalty is only a few frames away. Otherwise, the state is neutral.
+    args:
+        info: The info of the last step.
+        ground_level: The y position of Mario standing on the ground.
+        death_penalty: The reward of the death, the same as the one of `MarioReward`.
+    """
+    if info["y_pos"] < ground_level:
+        return death_penalty
+    return 0
@@ -1,5 +1,8 @@
 from typing import Any, List, Callable, Tuple
 import math
+import heapq
+import hashlib
+import itertools
 from collections import deque
 
 import gymnasium as gym
@@ -15,6 +18,10 @@ action_weights = [
     0.1,
 ]
 
+# the range of the values of the nodes, from the death penalty of `MarioReward` of -50 to about 300
+# for reaching the flag
+VALUE_RANGE = 350.0
+
 
 class Node:
     """Monte Carlo Tree Search Node."""
@@ -29,25 +36,49 @@ class Node:
         value: float = 0,
         is_terminal: bool = False,
         is_victory: bool = False,
+        transposition: "Node" = None,
+        value_squares: float = 0,
     ):
         self.action = action
         self.state = state
         self.parent = parent
-        self.children = children.copy()
+        self.children = []
         self.visits = visits
         self.value = value
         self.is_terminal = is_terminal
         self.is_victory = is_victory
+        # the node that reached the same state first, see `TranspositionTable`
+        self.transposition = transposition
+        # the sum of the squared values backpropagated to the node, for the variance
+        self.value_squares = value_squares
+        # the metrics of the subtree under the node, maintained by `add`
+        self.size = 1
+        self.height = 0
+        self.deepest = self
+        for child in children:
+            self.add(child)
 
     def is_leaf(self) -> bool:
         """Check if the node is a leaf node."""
         return len(self.children) == 0
 
     def add(self, child: "Node"):
-        """Add a child node to the current node."""
+        """Add a child node to the current node and update the subtree metrics of the ancestors.
+
+        The metrics of a subtree only depend on the nodes under it, so a node that is detached as
+        the new root keeps them valid without another traversal.
+        """
         child.parent = self
         self.children.append(child)
 
+        node, height = self, child.height + 1
+        while node is not None:
+            node.size += child.size
+            if node.height < height:
+                node.height = height
+                node.deepest = child.deepest
+            node, height = node.parent, height + 1
+
     def is_fully_expanded(self, action_space: int):
         """Return True if the node has all possible children."""
         return len(self.children) == action_space
@@ -65,13 +96,49 @@ def ucb1(node: Node, exploration_weight: float) -> float:
         return node.value / node.visits
 
     # calculate the UCB1 value for regular nodes
-    ucb1_value = node.value / node.visits + math.sqrt(
+    ucb1_value = node.value / node.visits + exploration_weight * math.sqrt(
         2 * math.log(node.parent.visits) / node.visits
     )
 
     return ucb1_value * action_weights[node.action]
 
 
+def variance(node: Node) -> float:
+    """Return the variance of the values backpropagated to the node."""
+    if node.visits == 0:
+        return 0.0
+    mean = node.value / node.visits
+    return max(node.value_squares / node.visits - mean * mean, 0.0)
+
+
+def ucb1_tuned(
+    node: Node, exploration_weight: float, value_range: float = VALUE_RANGE
+) -> float:
+    """Calculate the UCB1-Tuned value, which scales the exploration with the variance of the node.
+
+    The variance is normalized by the range of the values, so that it is capped by 1/4 the same as
+    the one of the rewards in [0, 1].
+
+    args:
+        node: The node to score.
+        exploration_weight: The exploration weight.
+        value_range: The range of the values. Use `functools.partial` to set it for other reward scales.
+    """
+    if node.visits == 0:
+        return float("inf")
+
+    if node.parent is None:
+        return node.value / node.visits
+
+    log_visits = math.log(node.parent.visits)
+    bound = variance(node) / value_range**2 + math.sqrt(2 * log_visits / node.visits)
+    ucb1_value = node.value / node.visits + exploration_weight * math.sqrt(
+        log_visits / node.visits * min(0.25, bound)
+    )
+
+    return ucb1_value * action_weights[node.action]
+
+
 def select(
     node: Node,
     max_candidates: int = 8,
@@ -101,7 +168,10 @@ def select(
         current_node, depth = stack.pop()
         stack.extend(map(lambda n: (n, depth + 1), current_node.children))
         # add nodes that can expand to the candidates for further short listing
-        if not current_node.is_fully_expanded(action_space):
+        if (
+            not current_node.is_fully_expanded(action_space)
+            and current_node.transposition is None
+        ):
             candidates.append((current_node, depth))
 
     # 2. calculate the ucb1 scores for these nodes
@@ -124,6 +194,106 @@ def select(
     return candidates[:max_candidates]
 
 
+class Frontier:
+    """Incremental index of the nodes that are not fully expanded, ordered by their UCB1 scores.
+
+    It answers the same query as `select` without traversing the whole tree. The UCB1 score of a node
+    depends on its own statistics and the visits of its parent, so a backpropagation only changes the
+    scores of the nodes on the path and their children. The outdated heap entries are skipped lazily.
+    """
+
+    def __init__(
+        self,
+        root: Node,
+        exploration_weight: float = 1.0,
+        action_space: int = 4,
+        scorer: Callable[[Node, float], float] = ucb1,
+    ):
+        """
+        Index the tree under the given root node.
+        args:
+            root: The root node of the tree.
+            exploration_weight: The exploration weight for the UCB1 calculation.
+            action_space: The number of actions a node can be expanded with.
+            scorer: The score of a node with the exploration weight, `ucb1` or `ucb1_tuned`.
+        """
+        self.exploration_weight = exploration_weight
+        self.action_space = action_space
+        self.scorer = scorer
+
+        self._heap = []
+        # the live heap entry and the depth of each indexed node
+        self._entries = {}
+        self._counter = itertools.count()
+
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            stack.extend(map(lambda n: (n, depth + 1), node.children))
+            self._push(node, depth)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, node: Node) -> bool:
+        return node in self._entries
+
+    def add(self, node: Node, depth: int):
+        """Index a newly expanded node and refresh its parent, which might be fully expanded now."""
+        self._push(node, depth)
+        if node.parent in self._entries:
+            self._push(node.parent, self._entries[node.parent][1])
+
+    def discard(self, node: Node):
+        """Remove the node from the index, e.g. while it is waiting for its rollout."""
+        self._entries.pop(node, None)
+
+    def update(self, node: Node):
+        """Rescore the path from the given node to the root after a backpropagation."""
+        current_node = node
+        while current_node is not None:
+            for n in (current_node, *current_node.children):
+                if n in self._entries:
+                    self._push(n, self._entries[n][1])
+            current_node = current_node.parent
+
+    def select(self, max_candidates: int = 8) -> List[Tuple[Node, int, float]]:
+        """Return the most promising nodes with their depth and UCB1 score, the same as `select`."""
+        candidates = []
+        while self._heap and len(candidates) < max_candidates:
+            entry = heapq.heappop(self._heap)
+            node = entry[-1]
+            if self._entries.get(node, (None,))[0] is entry:
+                candidates.append(entry)
+
+        # the selected nodes stay in the index until they are fully expanded
+        for entry in candidates:
+            heapq.heappush(self._heap, entry)
+
+        return [(e[-1], self._entries[e[-1]][1], -e[0]) for e in candidates]
+
+    def _push(self, node: Node, depth: int):
+        if node.is_fully_expanded(self.action_space) or node.transposition is not None:
+            self._entries.pop(node, None)
+            return
+
+        weight = action_weights[node.action] if node.action is not None else 0
+        # sort condidation: ucb1 DESC, then the action weight
+        entry = (
+            -self.scorer(node, self.exploration_weight),
+            -weight,
+            next(self._counter),
+            node,
+        )
+        self._entries[node] = (entry, depth)
+        heapq.heappush(self._heap, entry)
+
+        # compact the heap when the outdated entries dominate it
+        if len(self._heap) > 4 * len(self._entries) + 64:
+            self._heap = [entry for entry, _ in self._entries.values()]
+            heapq.heapify(self._heap)
+
+
 def expand(
     candidates: List[Tuple[Node, int, float]], num_actions: int, max_expansions: int = 8
 ) -> List[Node]:
@@ -132,11 +302,11 @@ def expand(
 
     # continue expand the nodes until the limit is reached or there is no expandable nodes left
     for node, _, _ in candidates:
-        # ignore the terminal node
-        if node.is_terminal:
+        # ignore the terminal node and the node that shares its subtree with another one
+        if node.is_terminal or node.transposition is not None:
             continue
-        # expand the node
-        for i in range(num_actions):
+        # expand the node, continuing from the actions it is already expanded with
+        for i in range(len(node.children), num_actions):
             # check with the limitation
             if len(new_nodes) >= max_expansions:
                 return new_nodes
@@ -148,23 +318,152 @@ def expand(
     return new_nodes
 
 
-def rollout(node: Node, env: gym.Env) -> List[float]:
-    """Simulate a game from the given node until the end. If the node is not simulated, simulate the game from the node."""
+def state_key(state: bytes) -> bytes:
+    """Return a compact digest of the serialized emulator state."""
+    return hashlib.blake2b(state, digest_size=16).digest()
+
+
+class TranspositionTable:
+    """Map the emulator states to the nodes that reached them first.
+
+    Different branches often reach the same state, e.g. NOOP and left while Mario is airborne.
+    The later node becomes an alias of the first one: it shares the state, it is never expanded,
+    and it receives every backpropagation that passes through the first node. The tree becomes a DAG.
+    """
+
+    def __init__(self):
+        # the first node of each state
+        self._nodes = {}
+        # the key of each registered node
+        self._keys = {}
+        # the aliases of each first node
+        self._aliases = {}
+
+    def __len__(self) -> int:
+        return len(self._nodes)
+
+    def __contains__(self, node: Node) -> bool:
+        return node in self._keys
+
+    def register(self, node: Node, key: bytes | None = None) -> Node:
+        """Register a stepped node with the key of its state and return the first node of the state."""
+        key = key if key is not None else state_key(node.state)
+        canonical = self._nodes.setdefault(key, node)
+        self._keys[node] = key
+
+        if canonical is not node:
+            node.transposition = canonical
+            # share the storage of the state
+            node.state = canonical.state
+            self._aliases.setdefault(canonical, []).append(node)
+
+        return canonical
+
+    def backpropagate(
+        self, node: Node, rewards: List[float], reward_discount: float = 0.9
+    ) -> List[Node]:
+        """Update the values like `backpropagate`, but along every path that reaches the states on the way.
+
+        returns:
+            List[Node]: The nodes where the updated paths start.
+        """
+        cumulative_reward = 0.0
+        for i, reward in enumerate(rewards):
+            cumulative_reward += (reward_discount**i) * reward
+
+        starts = []
+        updated = set()
+        stack = [(node, 0)]
+        while stack:
+            current_node, i = stack.pop()
+            starts.append(current_node)
+            while current_node is not None and current_node not in updated:
+                updated.add(current_node)
+                current_node.visits += 1
+                value = cumulative_reward * (reward_discount**i)
+                current_node.value += value
+                current_node.value_squares += value * value
+                # the aliases continue the update on their own paths
+                stack.extend((alias, i) for alias in self._aliases.get(current_node, ()))
+                current_node = current_node.parent
+                i += 1
+
+        return starts
+
+    def reroot(self, root: Node):
+        """Forget the nodes outside of the tree under the new root.
+
+        An alias whose first node is gone takes its place and becomes expandable again.
+        """
+        subtree = set()
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            subtree.add(node)
+            stack.extend(node.children)
+
+        self._keys = {n: k for n, k in self._keys.items() if n in subtree}
+        aliases, self._aliases, self._nodes = self._aliases, {}, {}
+        for node, key in self._keys.items():
+            if node.transposition is None or node.transposition not in subtree:
+                node.transposition = None
+                self._nodes.setdefault(key, node)
+        for node, key in self._keys.items():
+            canonical = self._nodes[key]
+            if canonical is not node:
+                node.transposition = canonical
+                self._aliases.setdefault(canonical, []).append(node)
+
+        if root not in self._keys and root.state is not None:
+            self.register(root)
+
+
+def rollout(
+    node: Node,
+    env: gym.Env,
+    horizon: int | None = None,
+    evaluator: Callable[[dict], float] | None = None,
+    lean: bool = False,
+    restore: bool = False,
+    policy: Callable[[gym.Env, Any], int] | None = None,
+) -> List[float]:
+    """Simulate a game from the given node until the end. If the node is not simulated, simulate the game from the node.
+
+    args:
+        node: The node to start the rollout from.
+        env: The simulation environment.
+        horizon: The max number of random steps after the node, None to play until the end.
+        evaluator: Score the state where the rollout is cut off by the horizon from its `info`,
+            the score is appended as the last reward.
+        lean: Take the random steps with `step_lean` of the environment, which skips the observations.
+        restore: Load the state with `restore` of the environment instead of a reset and `deserialize`.
+        policy: Choose the actions of the random steps from the environment and the last `info`,
+            see `rollout_policy`. None for the uniform random actions.
+    returns:
+        List[float]: The rewards collected during the rollout.
+    """
     # If the node is a terminal node, return an empty list
     if node.is_terminal:
         return []
 
     rewards = []
+    info = None
+
+    # rebuild the parent's state if it is dropped by the `StateStore`
+    if node.state is None and node.parent and node.parent.state is None:
+        replay_state(node.parent, env, restore=restore)
 
-    env.reset()
+    if not restore:
+        env.reset()
+    load = env.restore if restore else env.deserialize
 
     # load the state from the node if it is not None
     if node.state is not None:
-        env.deserialize(node.state)
+        load(node.state)
     # load the parent's state as the initial state
     # and run the node since it is not run yet
     elif node.parent:
-        env.deserialize(node.parent.state)
+        load(node.parent.state)
         # run the node
         _, reward, terminated, truncated, info = env.step(node.action)
         rewards.append(reward)
@@ -179,14 +478,85 @@ def rollout(node: Node, env: gym.Env) -> List[float]:
 
     # run the rest of the game with random actions
     done = False
-    while not done:
-        _, reward, terminated, truncated, _ = env.step(env.action_space.sample())
+    steps = 0
+    if policy is not None:
+        policy.reset()
+    while not done and (horizon is None or steps < horizon):
+        action = env.action_space.sample() if policy is None else policy(env, info)
+        if lean:
+            reward, terminated, truncated, info = env.step_lean(action)
+        else:
+            _, reward, terminated, truncated, info = env.step(action)
         done = terminated or truncated
         rewards.append(reward)
+        steps += 1
+
+    # estimate the rest of the game that is cut off
+    if not done and evaluator is not None and info is not None:
+        if lean and steps > 0:
+            info = info._asdict()
+        rewards.append(evaluator(info))
 
     return rewards
 
 
+def rollouts(
+    node: Node, env: gym.Env, num_rollouts: int = 1, **options
+) -> List[List[float]]:
+    """Run a number of rollouts from the node, see `rollout` for the options.
+
+    The first rollout runs the node, and the others start from its state. The reward of running the
+    node is repeated at the beginning of each of them, so all of them are returns of the same node.
+
+    returns:
+        List[List[float]]: The rewards of each rollout, only one if the node is terminal.
+    """
+    is_run = node.state is not None
+    results = [rollout(node, env, **options)]
+    head = [] if is_run else results[0][:1]
+    for _ in range(num_rollouts - 1):
+        if node.is_terminal:
+            break
+        results.append(head + rollout(node, env, **options))
+
+    return results
+
+
+def replay_state(node: Node, env: gym.Env, restore: bool = False) -> bytes:
+    """Rebuild the state of the node by replaying the actions from its nearest ancestor with a state.
+
+    Each action is replayed from the loaded state of the previous one, the same way the nodes
+    are run in `rollout`, so the wrappers count from the same point and the state is the same.
+
+    args:
+        node: The node without a state.
+        env: The simulation environment.
+        restore: Load the states with `restore` of the environment instead of a reset and `deserialize`.
+    returns:
+        bytes: The state of the node, which is also set on the node.
+    """
+    path = []
+    ancestor = node
+    while ancestor.state is None:
+        if ancestor.parent is None:
+            raise ValueError("None of the ancestors of the node has a state")
+        path.append(ancestor)
+        ancestor = ancestor.parent
+
+    state = ancestor.state
+    for current in reversed(path):
+        if restore:
+            env.restore(state)
+        else:
+            env.reset()
+            env.deserialize(state)
+        env.step(current.action)
+        state = env.serialize()
+
+    node.state = state
+    return state
+
+
 def backpropagate(
     node: Node, rewards: List[int], reward_discount: float = 0.9
 ) -> float:
@@ -202,8 +572,50 @@ def backpropagate(
     while current_node is not None:
         current_node.visits += 1
         # apply the discounted reward to the node
-        current_node.value += cumulative_reward * (reward_discount**i)
+        value = cumulative_reward * (reward_discount**i)
+        current_node.value += value
+        current_node.value_squares += value * value
         current_node = current_node.parent
         i += 1
 
     return cumulative_reward
+
+
+def apply_virtual_loss(node: Node, virtual_loss: float = 1.0):
+    """Count a pending rollout as a visit with a loss along the path to the root.
+
+    It discourages concurrent selections from piling onto the same path while the rollout is running.
+    The loss counts in the squared values as well, so the variance sees it as a regular return.
+    """
+    current_node = node
+    while current_node is not None:
+        current_node.visits += 1
+        current_node.value -= virtual_loss
+        current_node.value_squares += virtual_loss * virtual_loss
+        current_node = current_node.parent
+
+
+def revert_virtual_loss(node: Node, virtual_loss: float = 1.0):
+    """Undo `apply_virtual_loss` once the result of the rollout has arrived."""
+    current_node = node
+    while current_node is not None:
+        current_node.visits -= 1
+        current_node.value += virtual_loss
+        current_node.value_squares -= virtual_loss * virtual_loss
+        current_node = current_node.parent
+
+
+def is_decided(
+    node: Node, remaining: int, max_change: float, action_space: int = 4
+) -> bool:
+    """Return True if the best child of the node cannot be overtaken within the remaining rollouts.
+
+    A rollout changes the values of the children by at most `max_change` in total, so the best child
+    stays the best when its margin over the runner-up is larger than `remaining * max_change`.
+    """
+    # an action that is not expanded yet might still be the best one
+    if not node.is_fully_expanded(action_space):
+        return False
+
+    best, runner_up = sorted((c.value for c in node.children), reverse=True)[:2]
+    return best - runner_up > remaining * max_change
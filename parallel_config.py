@@ -0,0 +1,81 @@
+from dataclasses import dataclass
+from enum import Enum
+from typing import Tuple
+
+
+class SearchMode(Enum):
+    """How the rollouts of a decision are scheduled on the workers."""
+
+    # the rollouts of a batch of leaves are dispatched together and backed up once all of them finish
+    BATCHED = "batched"
+    # a new leaf is selected as soon as any worker finishes its rollout, the paths of the pending
+    # rollouts get a virtual loss
+    STREAMING = "streaming"
+    # each task grows an independent tree, the decision is made with their merged root children
+    ROOT_PARALLEL = "root_parallel"
+
+
+class StateMode(Enum):
+    """Where the emulator states of the nodes are kept."""
+
+    # in the nodes, the rollout tasks carry the parent's state to the workers
+    NODES = "nodes"
+    # in the nodes within a memory budget, see `StateStore`
+    STORE = "store"
+    # in the workers that ran the rollouts, the tasks are routed to them, see `StateCachePool`
+    CACHE = "cache"
+    # in the slots of a shared memory that the workers write into, see `StateArena`
+    ARENA = "arena"
+
+
+@dataclass(frozen=True)
+class ParallelConfig:
+    """The parallel search of `AgentKane`.
+
+    The options of a mode are only used in that mode. The modes that cannot work together are
+    rejected when the config is created.
+    """
+
+    search: SearchMode = SearchMode.BATCHED
+    states: StateMode = StateMode.NODES
+    # keep growing the tree under the chosen action in the background until the next decision,
+    # while the action is executed, rendered and recorded
+    speculative: bool = False
+
+    # BATCHED: the number of environments in each worker, a task carries this many rollouts that
+    # the worker runs in lockstep with a `VectorRollout`
+    rollouts_per_task: int = 1
+    # STREAMING: the loss applied to the path of a pending rollout
+    virtual_loss: float = 1.0
+    # ROOT_PARALLEL: the number of independent trees of a decision, grown from the same root with
+    # different random actions. They share the node budget, and the time budget is split between
+    # the waves of trees that run on the workers at once.
+    num_trees: int = 8
+    # ROOT_PARALLEL: the exploration weights cycled over the trees, None for the one of the agent
+    tree_exploration_weights: Tuple[float, ...] | None = None
+
+    # CACHE: the number of states each worker keeps
+    state_cache_size: int = 256
+    # ARENA: the number of slots and the max size of a state, the larger ones are pickled
+    arena_slots: int = 4096
+    slot_size: int = 32768
+    # STORE: the bytes of the states beyond which the states off the frontier are dropped, or kept
+    # as deltas against their parents
+    memory_budget: int = 256 * 1024 * 1024
+    state_deltas: bool = False
+
+    def __post_init__(self):
+        if self.search is SearchMode.ROOT_PARALLEL and (
+            self.states is not StateMode.NODES or self.speculative
+        ):
+            raise ValueError(
+                "The root-parallel trees live in the workers, their states are not kept"
+                " and they are not reused"
+            )
+        if self.rollouts_per_task > 1 and (
+            self.search is not SearchMode.BATCHED
+            or self.states not in (StateMode.NODES, StateMode.STORE)
+        ):
+            raise ValueError(
+                "The batched rollouts only work in the batched mode with the states in the nodes"
+            )
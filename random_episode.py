@@ -1,7 +1,7 @@
 from pathlib import Path
 import random
-import lzma
 from gymnasium import Wrapper, Env
+from game_play_recorder import load_state, recorded_steps
 
 
 class RandomEpisode(Wrapper):
@@ -16,7 +16,8 @@ class RandomEpisode(Wrapper):
         if not (data_dir.exists() and data_dir.is_dir()):
             raise ValueError(f"Invalid data directory: {data_dir}")
 
-        self._checkpoints = sorted(data_dir.glob("*.state.xz"))
+        # the keyframes and the deltas between them
+        self._checkpoints = recorded_steps(data_dir)
 
     def reset(self):
         # reset the environment
@@ -26,5 +27,5 @@ class RandomEpisode(Wrapper):
         checkpoint = random.choice(self._checkpoints)
 
         # load the checkpoint
-        saved_state = lzma.decompress(checkpoint.read_bytes())
+        saved_state = load_state(self._data_dir, checkpoint)
         self.deserialize(saved_state)
@@ -1,10 +1,157 @@
 from pathlib import Path
-from run import create_env
-import json
+from typing import Callable, List, Tuple
+import multiprocessing as mp
+import tempfile
+from gymnasium import Env
+from game_play_recorder import load_play_info, load_state, recorded_steps
+import numpy as np
 import cv2
 
+# the number of frames of a step in the recording, the frame skip of `run.py`
+FRAMES_PER_STEP = 8
+SCREEN_SHAPE = (240, 256, 3)
 
-def replay(data_dir: str | None):
+_replay_env = None
+
+
+def _initialize_worker(env_provider: Callable[..., Env]):
+    global _replay_env
+    _replay_env = env_provider(frame_skip=0, render_mode="rgb_array")
+    _replay_env.reset()
+
+
+def _render_segment(
+    task: Tuple[Path, Path, tuple, int, int, List[int]]
+) -> Tuple[int, bool]:
+    """
+    Render the frames of a segment of the recording into a slot of the frame buffer.
+
+    Parameters
+    ----------
+    task : tuple
+        The recording directory, the file and the shape of the frame buffer, the slot to render
+        into, the index of the first step and the actions of the steps.
+
+    Returns
+    -------
+    Tuple[int, bool]
+        The number of rendered frames and whether the game ended in the segment.
+    """
+    saved_dir, buffer_file, buffer_shape, slot, start, actions = task
+    env = _replay_env
+
+    # start from the state saved after the previous step
+    env.reset()
+    if start > 0:
+        env.deserialize(load_state(saved_dir, start - 1))
+    # the time limit counts the frames as if the game was played from the beginning
+    wrapper = env
+    while wrapper is not env.unwrapped:
+        if hasattr(wrapper, "_elapsed_steps"):
+            wrapper._elapsed_steps = start * FRAMES_PER_STEP
+        wrapper = wrapper.env
+
+    frames = np.memmap(buffer_file, dtype=np.uint8, mode="r+", shape=buffer_shape)
+    num_frames, done = 0, False
+    for action in actions:
+        for _ in range(FRAMES_PER_STEP):
+            _, _, terminated, truncated, _ = env.step(action)
+            frames[slot, num_frames] = env.render()
+            num_frames += 1
+            done = terminated or truncated
+            if done:
+                break
+        if done:
+            break
+    frames.flush()
+
+    return num_frames, done
+
+
+def _replay_parallel(
+    saved_dir: Path,
+    video_writer: cv2.VideoWriter,
+    num_workers: int,
+    segment_steps: int,
+    env_provider: Callable[..., Env],
+) -> int:
+    """Render the segments of the recording in parallel and encode their frames in order."""
+    num_steps = len(recorded_steps(saved_dir))
+    actions = [load_play_info(saved_dir, i)["action"] for i in range(num_steps)]
+    segments = [
+        (start, actions[start : start + segment_steps])
+        for start in range(0, num_steps, segment_steps)
+    ]
+    if not segments:
+        return 0
+
+    # the frame buffer has twice as many slots as the workers, a slot is reused by a later segment
+    # once the frames in it are encoded. A slot takes `segment_steps` * 1.5 MB, the buffer is a
+    # temporary file in the recording directory.
+    num_slots = min(2 * num_workers, len(segments))
+    buffer_shape = (num_slots, segment_steps * FRAMES_PER_STEP, *SCREEN_SHAPE)
+    frames = 0
+    with tempfile.TemporaryDirectory(dir=saved_dir) as buffer_dir:
+        buffer_file = Path(buffer_dir, "frames.bin")
+        buffer = np.memmap(buffer_file, dtype=np.uint8, mode="w+", shape=buffer_shape)
+
+        def submit(i: int):
+            start, segment_actions = segments[i]
+            task = (saved_dir, buffer_file, buffer_shape, i % num_slots, start, segment_actions)
+            return pool.apply_async(_render_segment, (task,))
+
+        with mp.Pool(
+            num_workers, initializer=_initialize_worker, initargs=(env_provider,)
+        ) as pool:
+            pending = [submit(i) for i in range(num_slots)]
+            for i in range(len(segments)):
+                num_frames, done = pending[i].get()
+                for frame in buffer[i % num_slots, :num_frames]:
+                    video_writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+                frames += num_frames
+                if done:
+                    break
+                if i + num_slots < len(segments):
+                    pending.append(submit(i + num_slots))
+        del buffer
+
+    return frames
+
+
+def _replay_serial(
+    saved_dir: Path, video_writer: cv2.VideoWriter, env_provider: Callable[..., Env]
+) -> int:
+    """Replay the recording from the beginning in this process."""
+    # initialize the environment without frame skipping
+    env = env_provider(frame_skip=0, render_mode="rgb_array")
+    env.reset()
+
+    # run the saved game play
+    done, index, frames = False, 0, 0
+    while not done:
+        # read the step data
+        step_info = load_play_info(saved_dir, index)
+        # run the game with 8 steps
+        for _ in range(FRAMES_PER_STEP):
+            # step
+            _, _, terminated, truncated, _ = env.step(step_info["action"])
+            # render the game
+            screen = env.render()
+            # render the video
+            video_writer.write(cv2.cvtColor(screen, cv2.COLOR_RGB2BGR))
+            frames += 1
+            # determine if the game is ended
+            if terminated or truncated:
+                done = True
+                break
+
+        # increase the index
+        index += 1
+
+    return frames
+
+
+def replay(data_dir: str | None, num_workers: int = 1, segment_steps: int = 25):
     """
     This function replays the recorded gameplay from the given data directory into a mp4 file.
 
@@ -12,11 +159,23 @@ def replay(data_dir: str | None):
     ----------
     data_dir : str | None
         The directory contains the gameplay data created by the `run.py`
+    num_workers : int
+        The number of processes that render the gameplay. With more than one, the recording is
+        split into segments that start from their saved states, and the frames are encoded in
+        order, so the video is the same as the one rendered serially.
+    segment_steps : int
+        The number of steps of a segment. The frames of two segments per worker are buffered in a
+        temporary file of 1.5 MB per step, e.g. 37 MB per segment of 25 steps.
     """
+    # the emulator is only needed to render, the helpers take the provider of the environment
+    from environment import create_env
+
     # Check the data directory
     if data_dir is None:
         # get the latest directory
-        saved_dir = sorted(Path("data").iterdir(), reverse=True)[0]
+        saved_dir = sorted(
+            (path for path in Path("data").iterdir() if path.is_dir()), reverse=True
+        )[0]
         if not saved_dir.exists():
             raise ValueError("No saved game play found")
         print(f"Using the latest directory: {saved_dir}")
@@ -36,31 +195,12 @@ def replay(data_dir: str | None):
         True,
     )
 
-    # initialize the environment without frame skipping
-    env = create_env(frame_skip=0, render_mode="rgb_array")
-    env.reset()
-
-    # run the saved game play
-    done, index, frames = False, 0, 0
-    while not done:
-        # read the step data
-        step_info = json.loads(Path(saved_dir, f"{index:04d}.json").read_text())
-        # run the game with 4 steps
-        for _ in range(8):
-            # step
-            _, _, terminated, truncated, _ = env.step(step_info["action"])
-            # render the game
-            screen = env.render()
-            # render the video
-            video_writer.write(cv2.cvtColor(screen, cv2.COLOR_RGB2BGR))
-            frames += 1
-            # determine if the game is ended
-            if terminated or truncated:
-                done = True
-                break
-
-        # increase the index
-        index += 1
+    if num_workers > 1:
+        frames = _replay_parallel(
+            saved_dir, video_writer, num_workers, segment_steps, create_env
+        )
+    else:
+        frames = _replay_serial(saved_dir, video_writer, create_env)
 
     print(f"Total frames: {frames}")
     print(str(video_file))
@@ -82,5 +222,22 @@ if __name__ == "__main__":
         nargs="?",
         help="The directory containing the saved game play data",
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="The number of processes that render the gameplay in parallel",
+    )
+    parser.add_argument(
+        "--segment-steps",
+        type=int,
+        default=25,
+        help="The number of steps each process renders at a time, a step buffers 1.5 MB of frames",
+    )
     args = parser.parse_args()
-    replay(data_dir=args.data_dir)
+    mp.set_start_method("spawn")
+    replay(
+        data_dir=args.data_dir,
+        num_workers=args.workers,
+        segment_steps=args.segment_steps,
+    )
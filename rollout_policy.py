@@ -0,0 +1,139 @@
+"""
+The policies that choose the actions of the random steps of the rollouts. The actions index
+`action_space.FAST_MOVE`: NOOP, right + B, right + A + B and left.
+
+A policy draws from the random generator of the action space of the environment, so seeding the
+action space seeds the policy as well. It is copied for each environment of a `VectorRollout`.
+"""
+
+from typing import List
+
+import gymnasium as gym
+import numpy as np
+
+from monte_carlo_tree_search import action_weights
+
+NOOP, RIGHT, JUMP_RIGHT, LEFT = range(4)
+
+
+def _field(info, name: str):
+    """Read a field of `info`, which is a dict or the `LeanInfo` of the lean steps."""
+    if info is None:
+        return None
+    if isinstance(info, dict):
+        return info.get(name)
+    return getattr(info, name, None)
+
+
+class RolloutPolicy:
+    """The uniform random policy, which is also the interface of the other policies."""
+
+    def reset(self):
+        """Forget the previous steps at the beginning of a rollout."""
+
+    def __call__(self, env: gym.Env, info) -> int:
+        """
+        Choose the action of the next step.
+        args:
+            env: The simulation environment.
+            info: The info of the last step, None before the first one.
+        returns:
+            int: The action.
+        """
+        return env.action_space.sample()
+
+
+class WeightedPolicy(RolloutPolicy):
+    """Sample the actions with fixed weights, by default the `action_weights` of the UCB1 scores."""
+
+    def __init__(self, weights: List[float] = action_weights):
+        """
+        args:
+            weights: The relative weight of each action.
+        """
+        self.probabilities = np.asarray(weights, dtype=float) / sum(weights)
+
+    def __call__(self, env: gym.Env, info) -> int:
+        return int(
+            env.action_space.np_random.choice(
+                len(self.probabilities), p=self.probabilities
+            )
+        )
+
+
+class StickyPolicy(RolloutPolicy):
+    """Repeat the previous action with a probability, otherwise ask the base policy.
+
+    The held actions make longer runs and jumps than the independent ones.
+    """
+
+    def __init__(
+        self,
+        base: RolloutPolicy | None = None,
+        repeat_probability: float = 0.75,
+    ):
+        """
+        args:
+            base: The policy of the new actions, the uniform random one by default.
+            repeat_probability: The probability of repeating the previous action.
+        """
+        self.base = base if base is not None else RolloutPolicy()
+        self.repeat_probability = repeat_probability
+        self._previous = None
+
+    def reset(self):
+        self.base.reset()
+        self._previous = None
+
+    def __call__(self, env: gym.Env, info) -> int:
+        if (
+            self._previous is None
+            or env.action_space.np_random.random() >= self.repeat_probability
+        ):
+            self._previous = self.base(env, info)
+        return self._previous
+
+
+class HeuristicPolicy(RolloutPolicy):
+    """Run right, and jump when Mario stops making progress or is about to fall."""
+
+    def __init__(
+        self,
+        stuck_steps: int = 2,
+        ground_level: int = 79,
+        explore_probability: float = 0.1,
+    ):
+        """
+        args:
+            stuck_steps: The number of steps without progress before Mario jumps.
+            ground_level: The y position of Mario on the ground, see `mario_reward.pit_evaluator`.
+            explore_probability: The probability of a uniform random action instead.
+        """
+        self.stuck_steps = stuck_steps
+        self.ground_level = ground_level
+        self.explore_probability = explore_probability
+        self._progress = None
+        self._n_stuck_steps = 0
+
+    def reset(self):
+        self._progress = None
+        self._n_stuck_steps = 0
+
+    def __call__(self, env: gym.Env, info) -> int:
+        random = env.action_space.np_random
+        x_pos, y_pos = _field(info, "x_pos"), _field(info, "y_pos")
+        if x_pos is not None:
+            if self._progress is not None and x_pos <= self._progress:
+                self._n_stuck_steps += 1
+            else:
+                self._n_stuck_steps = 0
+            self._progress = x_pos
+
+        if random.random() < self.explore_probability:
+            return env.action_space.sample()
+        # jump over the obstacle, or out of the pit while Mario is still high enough
+        if self._n_stuck_steps >= self.stuck_steps:
+            return JUMP_RIGHT
+        if y_pos is not None and y_pos < self.ground_level:
+            return JUMP_RIGHT
+        return RIGHT if random.random() < 0.7 else JUMP_RIGHT
@@ -2,61 +2,107 @@ import multiprocessing as mp
 import datetime as dt
 import time
 import os
+from pathlib import Path
 
 import gymnasium as gym
 
 from nes_py.wrappers import JoypadSpace
 
 from agent_kane import AgentKane
+from decision_cache import DecisionCache
 from game_play_recorder import GamePlayRecorder
 from environment import create_env
 
 
-def run():
-    """Run the game."""
+def run(decision_cache_path: str | None = None):
+    """
+    Run the game.
+    args:
+        decision_cache_path: The SQLite file of the decisions of the past episodes, None to search
+            every decision from scratch.
+    """
     # Prepare the environment
     env = create_env(render_mode="human")
     state, _ = env.reset()
 
+    # the decisions of the past episodes, the early states of the level repeat in every episode
+    decision_cache = None
+    if decision_cache_path is not None:
+        Path(decision_cache_path).parent.mkdir(parents=True, exist_ok=True)
+        decision_cache = DecisionCache(decision_cache_path)
+
     # and the environments that will be used for the simulations of the MCTS
-    agent = AgentKane(env_provider=create_env, num_workers=int(os.cpu_count() * 2))
+    agent = AgentKane(
+        env_provider=create_env,
+        num_workers=int(os.cpu_count() * 2),
+        decision_cache=decision_cache,
+    )
 
     # Record the gameplay steps. These data can be renders to actual game play with the `replay.py`
-    recorder = GamePlayRecorder(f"data/{dt.datetime.now().isoformat()}")
-
-    # The game play loop
-    done = False
-    while not done:
-        # make decision based on the observation
-        t_0 = time.time()
-        action, tree = agent.act(env, state)
-        t_1 = time.time()
-
-        # execute the decision
-        _, reward, terminated, truncated, _ = env.step(action)
-
-        # render for visualisation
-        env.render()
-
-        # recording the information about the step
-        recorder.record(
-            {
-                "action": action,
-                "reward": reward,
-                "time": t_1 - t_0,
-            },
-            env.serialize(),
-            tree,
-        )
+    # The steps are appended to a single archive in the background, so the recording does not
+    # delay the decisions
+    recorder = GamePlayRecorder(
+        f"data/{dt.datetime.now().isoformat()}", background=True, archive=True
+    )
+
+    try:
+        # The game play loop
+        done = False
+        while not done:
+            # make decision based on the observation
+            t_0 = time.time()
+            action, tree = agent.act(env, state)
+            t_1 = time.time()
+
+            # execute the decision
+            _, reward, terminated, truncated, _ = env.step(action)
 
-        # check if game is ended
-        if terminated or truncated:
-            break
+            # render for visualisation
+            env.render()
 
-    # clean up
-    env.close()
+            # recording the information about the step
+            recorder.record(
+                {
+                    "action": action,
+                    "reward": reward,
+                    "time": t_1 - t_0,
+                },
+                env.serialize(),
+                tree,
+            )
+            recorder.record_metrics(agent.metrics.last)
+
+            # check if game is ended
+            if terminated or truncated:
+                break
+    finally:
+        # clean up, the recorder raises the errors of its background writes, the rest is closed anyway
+        try:
+            recorder.close()
+        finally:
+            try:
+                agent.close()
+            finally:
+                if decision_cache is not None:
+                    decision_cache.close()
+                env.close()
+
+    if recorder.num_blocked:
+        print(
+            f"The recording held up {recorder.num_blocked} steps for {recorder.blocked_seconds:.2f} seconds"
+        )
 
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the game with the agent.")
+    parser.add_argument(
+        "--decision-cache",
+        type=str,
+        default=None,
+        help="The SQLite file to reuse the decisions of the past episodes from, e.g. data/decisions.sqlite",
+    )
+    args = parser.parse_args()
     mp.set_start_method("spawn")
-    run()
+    run(decision_cache_path=args.decision_cache)
@@ -0,0 +1,98 @@
+import time
+
+from monte_carlo_tree_search import Node, is_decided
+
+
+class SearchBudget:
+    """The stopping rules of a search.
+
+    The search stops on the node and depth targets, and optionally on a wall-clock deadline or
+    as soon as the best root child cannot be overtaken within the rest of the budget.
+    """
+
+    def __init__(
+        self,
+        target_num_nodes: int = 700,
+        target_depth: int = 16,
+        time_budget_ms: float | None = None,
+        early_stop: bool = False,
+        concurrency: int = 1,
+    ):
+        """
+        Initialize the budget.
+        args:
+            target_num_nodes: The number of nodes to reach, the search stops at twice the number.
+            target_depth: The depth to reach, the search stops at twice the depth.
+            time_budget_ms: The wall-clock time of a search in milliseconds, None for no deadline.
+            early_stop: If True, stop once the decision cannot change within the remaining budget.
+            concurrency: The number of rollouts that run at the same time.
+        """
+        self.target_num_nodes = target_num_nodes
+        self.target_depth = target_depth
+        self.time_budget_ms = time_budget_ms
+        self.early_stop = early_stop
+        self.concurrency = concurrency
+
+        self._deadline = None
+        # the estimated time of a round of rollouts
+        self._round_time = 0.0
+        # the largest change of the root children caused by a single rollout
+        self._max_change = 0.0
+
+    def start(self):
+        """Start the clock of a new search."""
+        self._deadline = None
+        if self.time_budget_ms is not None:
+            self._deadline = time.time() + self.time_budget_ms / 1000
+        self._round_time = 0.0
+        self._max_change = 0.0
+
+    def allows(self, num_nodes: int, depth: int) -> bool:
+        """Return True if another round of rollouts fits into the budget."""
+        if not (
+            (num_nodes < self.target_num_nodes or depth < self.target_depth)
+            and (
+                num_nodes < self.target_num_nodes * 2 and depth < self.target_depth * 2
+            )
+        ):
+            return False
+
+        return self._deadline is None or time.time() + self._round_time < self._deadline
+
+    def remaining(self) -> float | None:
+        """Return the seconds left until the deadline, None if there is no deadline."""
+        if self._deadline is None:
+            return None
+        return max(0.0, self._deadline - time.time())
+
+    def record_round(self, seconds: float):
+        """Update the estimated time of a round of rollouts."""
+        if self._round_time == 0:
+            self._round_time = seconds
+        else:
+            self._round_time = 0.8 * self._round_time + 0.2 * seconds
+
+    def record_change(self, root: Node, values: dict):
+        """Track how much a single rollout changed the values of the root children.
+
+        args:
+            root: The root node of the search.
+            values: The values of the root children before the rollout was backpropagated.
+        """
+        change = sum(abs(c.value - values.get(c, 0)) for c in root.children)
+        self._max_change = max(self._max_change, change)
+
+    def is_decided(self, root: Node, num_nodes: int, action_space: int) -> bool:
+        """Return True if the early stop is enabled and the decision is not expected to change any more.
+
+        The largest change observed so far stands in for the bound of a single rollout.
+        """
+        if not self.early_stop or self._max_change == 0:
+            return False
+
+        remaining = self.target_num_nodes * 2 - num_nodes
+        if self._deadline is not None and self._round_time > 0:
+            rounds = max(0.0, self._deadline - time.time()) / self._round_time
+            remaining = min(remaining, int(rounds + 1) * self.concurrency)
+
+        return is_decided(root, remaining, self._max_change, action_space)
@@ -0,0 +1,70 @@
+from contextlib import contextmanager
+import time
+
+
+class SearchMetrics:
+    """The counters and phase timers of a decision.
+
+    The phases are timed in the main process: select, expand, dispatch (preparing and sending the
+    tasks), rollout (waiting for the results) and backprop. The workers report the time of their
+    rollouts, from which the idle time of the workers and the IPC overhead are estimated.
+    """
+
+    PHASES = ("select", "expand", "dispatch", "rollout", "backprop")
+
+    def __init__(self, num_workers: int = 1, frame_skip: int = 1):
+        """
+        args:
+            num_workers: The number of workers, for the idle time of the workers.
+            frame_skip: The number of emulator frames of a step.
+        """
+        self.num_workers = num_workers
+        self.frame_skip = frame_skip
+        # the metrics of the last finished decision
+        self.last = None
+        self.reset()
+
+    def reset(self):
+        """Start the metrics of a new decision."""
+        self.seconds = dict.fromkeys(self.PHASES, 0.0)
+        self.counters = {
+            "rollouts": 0,
+            "steps": 0,
+            "bytes_sent": 0,
+            "bytes_received": 0,
+            "worker_busy": 0.0,
+        }
+        self._start = time.perf_counter()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Add the time of the block to the phase."""
+        t_0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - t_0
+
+    def add(self, name: str, amount: float = 1):
+        self.counters[name] += amount
+
+    def finish(self, **fields) -> dict:
+        """Finish the decision and return its metrics, with the extra fields, e.g. the tree size."""
+        total = time.perf_counter() - self._start
+        rollout = self.seconds["rollout"]
+        busy = self.counters["worker_busy"]
+        metrics = {
+            "seconds": total,
+            **{f"{name}_seconds": seconds for name, seconds in self.seconds.items()},
+            **self.counters,
+            # the waiting that the average worker does not spend on the rollouts
+            "ipc_seconds": max(rollout - busy / self.num_workers, 0.0),
+            "worker_idle": max(rollout * self.num_workers - busy, 0.0),
+            "rollouts_per_second": self.counters["rollouts"] / total if total else 0.0,
+            "frames_per_second": (
+                self.counters["steps"] * self.frame_skip / total if total else 0.0
+            ),
+            **fields,
+        }
+        self.last = metrics
+        return metrics
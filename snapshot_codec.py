@@ -0,0 +1,75 @@
+"""
+The deltas between the emulator states. The states of a parent and a child are 8 frames apart, so
+they only differ in a few bytes of the RAM and the registers. A delta keeps the runs of the bytes
+that differ, XORed with the base state.
+
+The layout of a delta is the header `<I I` (the length of the state, the number of runs), the
+offsets and lengths of the runs as `uint32` pairs, then the XORed bytes of the runs.
+"""
+
+import struct
+
+import numpy as np
+
+_HEADER = struct.Struct("<II")
+
+
+def encode(base: bytes, state: bytes, max_gap: int = 8) -> bytes | None:
+    """
+    Encode the state as a delta against the base state.
+    args:
+        base: The state to encode against, e.g. the state of the parent.
+        state: The state to encode.
+        max_gap: The runs separated by at most this many equal bytes are merged, which saves the
+            8 bytes of a run for the cost of the gap.
+    returns:
+        bytes | None: The delta, or None if the states have different lengths.
+    """
+    if len(base) != len(state):
+        return None
+
+    xor = np.bitwise_xor(
+        np.frombuffer(base, dtype=np.uint8), np.frombuffer(state, dtype=np.uint8)
+    )
+    changed = np.flatnonzero(xor)
+    if len(changed) == 0:
+        return _HEADER.pack(len(state), 0)
+
+    # split the changed bytes where the gap to the next one is too large
+    breaks = np.flatnonzero(np.diff(changed) > max_gap + 1)
+    starts = changed[np.concatenate(([0], breaks + 1))]
+    ends = changed[np.concatenate((breaks, [len(changed) - 1]))] + 1
+
+    runs = np.empty((len(starts), 2), dtype=np.uint32)
+    runs[:, 0] = starts
+    runs[:, 1] = ends - starts
+    data = np.concatenate([xor[s:e] for s, e in zip(starts, ends)])
+
+    return _HEADER.pack(len(state), len(runs)) + runs.tobytes() + data.tobytes()
+
+
+def decode(base: bytes, delta: bytes) -> bytes:
+    """
+    Rebuild the state from the base state and the delta.
+    args:
+        base: The state the delta is encoded against.
+        delta: The delta returned by `encode`.
+    returns:
+        bytes: The state.
+    """
+    length, num_runs = _HEADER.unpack_from(delta)
+    if length != len(base):
+        raise ValueError("The delta is not encoded against the base state")
+
+    state = np.frombuffer(base, dtype=np.uint8).copy()
+    runs = np.frombuffer(
+        delta, dtype=np.uint32, count=num_runs * 2, offset=_HEADER.size
+    ).reshape(-1, 2)
+    data = np.frombuffer(delta, dtype=np.uint8, offset=_HEADER.size + runs.nbytes)
+
+    position = 0
+    for start, size in runs:
+        state[start : start + size] ^= data[position : position + size]
+        position += size
+
+    return state.tobytes()
@@ -0,0 +1,121 @@
+import sys
+from multiprocessing import shared_memory, resource_tracker
+
+import numpy as np
+
+
+class StateArena:
+    """Fixed-size slots of emulator states in shared memory.
+
+    The main process allocates the slots and the workers write the serialized states straight into them,
+    so the states are not pickled and sent through the pipes of the pool. A pickled arena attaches to the
+    same shared memory in the process that unpickles it.
+    """
+
+    def __init__(
+        self,
+        num_slots: int,
+        slot_size: int = 32768,
+        name: str | None = None,
+    ):
+        """
+        Create the shared memory, or attach to an existing one by its name.
+        args:
+            num_slots: The number of slots.
+            slot_size: The max size of a state in bytes.
+            name: The name of the existing shared memory to attach to.
+        """
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+
+        # the lengths of the states are stored before the slots
+        size = num_slots * (4 + slot_size)
+        if name is None:
+            self._memory = shared_memory.SharedMemory(create=True, size=size)
+            self._owner = True
+        else:
+            self._memory = _attach(name)
+            self._owner = False
+
+        self._lengths = np.ndarray(
+            (num_slots,), dtype=np.uint32, buffer=self._memory.buf
+        )
+        self._slots = np.ndarray(
+            (num_slots, slot_size),
+            dtype=np.uint8,
+            buffer=self._memory.buf,
+            offset=num_slots * 4,
+        )
+        # the free slots are managed by the main process only
+        self._free = list(range(num_slots - 1, -1, -1)) if self._owner else []
+
+    def __getstate__(self) -> dict:
+        return {
+            "num_slots": self.num_slots,
+            "slot_size": self.slot_size,
+            "name": self._memory.name,
+        }
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
+
+    def __len__(self) -> int:
+        """Return the number of slots in use."""
+        return self.num_slots - len(self._free)
+
+    @property
+    def name(self) -> str:
+        return self._memory.name
+
+    def allocate(self) -> int | None:
+        """Return a free slot, or None if the arena is full."""
+        return self._free.pop() if self._free else None
+
+    def free(self, slot: int):
+        """Return the slot to the arena."""
+        self._lengths[slot] = 0
+        self._free.append(slot)
+
+    def write(self, slot: int, state: bytes) -> bool:
+        """Write the state into the slot, return False if it does not fit."""
+        if len(state) > self.slot_size:
+            return False
+        self._slots[slot, : len(state)] = np.frombuffer(state, dtype=np.uint8)
+        self._lengths[slot] = len(state)
+        return True
+
+    def read(self, slot: int) -> bytes:
+        """Return a copy of the state in the slot."""
+        return self._slots[slot, : self._lengths[slot]].tobytes()
+
+    def view(self, slot: int) -> memoryview:
+        """
+        Return the state in the slot without copying it.
+        The view must be released before the arena is closed, e.g. by using it as a context manager.
+        """
+        start = self.num_slots * 4 + slot * self.slot_size
+        return self._memory.buf[start : start + int(self._lengths[slot])]
+
+    def close(self):
+        """Detach from the shared memory, and release it if this arena created it."""
+        del self._lengths, self._slots
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+
+def _attach(name: str) -> shared_memory.SharedMemory:
+    """
+    Attach to an existing shared memory without registering it with the resource tracker.
+    Only the owner registers the shared memory and unlinks it, a worker that registered it too would
+    have the tracker release or warn about a segment it does not own.
+    """
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+
+    register = resource_tracker.register
+    resource_tracker.register = lambda name, rtype: None
+    try:
+        return shared_memory.SharedMemory(name=name)
+    finally:
+        resource_tracker.register = register
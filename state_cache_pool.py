@@ -0,0 +1,292 @@
+from typing import Callable, List, Tuple
+from collections import OrderedDict, deque
+import itertools
+import queue
+import time
+import multiprocessing as mp
+import weakref
+
+import gymnasium as gym
+
+from monte_carlo_tree_search import Node, rollout, state_key
+
+
+def _worker(
+    env_provider: Callable[..., gym.Env],
+    rollout_options: dict,
+    tasks: mp.SimpleQueue,
+    results: mp.Queue,
+):
+    """The loop of a simulation worker that keeps the states of the nodes in a local cache.
+
+    The main process mirrors the cache and decides the evictions, so the worker never drops a state
+    the main process still expects it to hold.
+    """
+    env = env_provider(render_mode="rgb_array", headless=True, with_reward=True)
+    env.reset()
+    cache = {}
+
+    while (message := tasks.get()) is not None:
+        kind = message[0]
+        if kind == "rollout":
+            _, parent_id, parent_state, child_id, action, evictions = message
+            # return the evicted states to the main process before anything else, the state of
+            # a failed rollout was never stored
+            for node_id, spill in evictions:
+                state = cache.pop(node_id, None)
+                if spill:
+                    results.put(("spill", node_id, state))
+
+            if parent_state is None:
+                parent_state = cache[parent_id]
+            else:
+                cache[parent_id] = parent_state
+
+            node = Node(action=action, parent=Node(state=parent_state))
+            t_0 = time.perf_counter()
+            try:
+                rewards = rollout(node, env, **rollout_options)
+            except Exception as error:
+                results.put(("error", child_id, error))
+                continue
+            cache[child_id] = node.state
+            results.put(
+                (
+                    "rollout",
+                    child_id,
+                    (
+                        None,
+                        node.is_terminal,
+                        [rewards],
+                        state_key(node.state),
+                        time.perf_counter() - t_0,
+                    ),
+                )
+            )
+        elif kind == "fetch":
+            _, node_id = message
+            results.put(("state", node_id, cache[node_id]))
+
+
+class StateCachePool:
+    """A pool of simulation workers that keep the states of the nodes they simulated.
+
+    A rollout task only carries the id of the parent and the action when the worker already holds
+    the parent's state, and the child's state stays in the worker. The tasks are routed to the
+    workers that hold the parent's state, and a state only travels to the main process when it is
+    evicted from the least recently used end of a worker's cache or when it is fetched explicitly,
+    e.g. for the root of the next search.
+    """
+
+    def __init__(
+        self,
+        env_provider: Callable[..., gym.Env],
+        num_workers: int,
+        cache_size: int = 256,
+        rollout_options: dict = {},
+        max_queued: int = 2,
+    ):
+        """
+        Start the workers.
+        args:
+            env_provider: The function that creates the simulation environments.
+            num_workers: The number of workers.
+            cache_size: The number of states each worker keeps, at least 2 for the parent and the
+                child of a task.
+            rollout_options: The keyword arguments of `rollout`.
+            max_queued: The number of tasks a worker can have queued before the tasks that it
+                holds the parent for are sent to another worker.
+        """
+        if cache_size < 2:
+            raise ValueError("The cache needs room for the parent and the child of a task")
+        self.num_workers = num_workers
+        self.cache_size = cache_size
+        self.max_queued = max_queued
+
+        self._tasks = [mp.SimpleQueue() for _ in range(num_workers)]
+        self._results = mp.Queue()
+        self._workers = [
+            mp.Process(
+                target=_worker,
+                args=(env_provider, rollout_options, tasks, self._results),
+                daemon=True,
+            )
+            for tasks in self._tasks
+        ]
+        for worker in self._workers:
+            worker.start()
+
+        # the mirrors of the worker caches in the LRU order
+        self._caches = [OrderedDict() for _ in range(num_workers)]
+        # the workers that hold each state
+        self._holders = {}
+        # the states on the way back from the workers
+        self._spilling = set()
+        # the number of tasks each worker has not finished yet
+        self._queued = [0] * num_workers
+        # the node of each id, and the pending node of each task
+        self._ids = weakref.WeakKeyDictionary()
+        self._nodes = weakref.WeakValueDictionary()
+        self._pending = {}
+        self._counter = itertools.count()
+        # the results that arrived while waiting for something else
+        self._buffered = deque()
+
+        # the statistics of the routing
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def __len__(self) -> int:
+        """Return the number of pending rollouts."""
+        return len(self._pending)
+
+    def submit(self, node: Node):
+        """Dispatch the rollout of a newly expanded node."""
+        parent_id = self._id(node.parent)
+        holders = self._holders.get(parent_id, ())
+        worker = min(holders, key=lambda w: self._queued[w], default=None)
+
+        parent_state = None
+        if worker is None or self._queued[worker] >= self.max_queued:
+            # the workers holding the parent are busy, send the state to the least busy worker
+            # if the main process has it, otherwise wait in the queue of a holder
+            state = self._local_state(node.parent)
+            if state is not None:
+                worker = min(range(self.num_workers), key=lambda w: self._queued[w])
+                if parent_id not in self._caches[worker]:
+                    parent_state = state
+        if worker is None:
+            raise ValueError("The state of the parent is not available")
+
+        if parent_state is None:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+
+        child_id = self._id(node)
+        evictions = self._cache(worker, parent_id, child_id)
+        self._tasks[worker].put(
+            ("rollout", parent_id, parent_state, child_id, node.action, evictions)
+        )
+        self._queued[worker] += 1
+        self._pending[child_id] = (node, worker)
+
+    def next_result(self, timeout: float | None = None) -> Tuple[Node, tuple] | None:
+        """Wait for the next finished rollout and return the node with its result.
+
+        The result has the same layout as the one of `agent_kane._rollout`, but without the state.
+        Return None if no rollout finishes within the timeout in seconds.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            if self._buffered:
+                kind, node_id, payload = self._buffered.popleft()
+            else:
+                remaining = None if deadline is None else max(0.0, deadline - time.time())
+                try:
+                    kind, node_id, payload = self._receive(remaining)
+                except queue.Empty:
+                    return None
+
+            if kind == "rollout":
+                node, worker = self._pending.pop(node_id)
+                self._queued[worker] -= 1
+                return node, payload
+            if kind == "error":
+                node, worker = self._pending.pop(node_id)
+                self._queued[worker] -= 1
+                # the worker did not store the state of the failed rollout
+                self._caches[worker].pop(node_id, None)
+                holders = self._holders.get(node_id, set())
+                holders.discard(worker)
+                if not holders:
+                    self._holders.pop(node_id, None)
+                raise payload
+
+    def fetch(self, node: Node) -> bytes:
+        """Return the state of the node, fetching it from a worker if necessary."""
+        state = self._local_state(node)
+        if state is not None:
+            return state
+
+        node_id = self._id(node)
+        holders = self._holders.get(node_id)
+        if not holders:
+            raise ValueError("The state of the node is not available")
+        self._tasks[next(iter(holders))].put(("fetch", node_id))
+        while node.state is None:
+            self._wait()
+        return node.state
+
+    def close(self):
+        """Stop the workers."""
+        for tasks in self._tasks:
+            tasks.put(None)
+        # a worker only exits once its results are flushed into the pipe, so keep reading them
+        while any(worker.is_alive() for worker in self._workers):
+            try:
+                self._results.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        for worker in self._workers:
+            worker.join()
+
+    def _id(self, node: Node) -> int:
+        if node not in self._ids:
+            node_id = next(self._counter)
+            self._ids[node] = node_id
+            self._nodes[node_id] = node
+        return self._ids[node]
+
+    def _local_state(self, node: Node) -> bytes | None:
+        """Return the state of the node in the main process, waiting for it if it is being evicted."""
+        while node.state is None and self._ids.get(node) in self._spilling:
+            self._wait()
+        return node.state
+
+    def _cache(
+        self, worker: int, parent_id: int, child_id: int
+    ) -> List[Tuple[int, bool]]:
+        """Update the mirror of the worker's cache.
+
+        returns:
+            List[Tuple[int, bool]]: The ids the worker has to evict, and whether to send the state back.
+        """
+        cache = self._caches[worker]
+        for node_id in (parent_id, child_id):
+            cache[node_id] = None
+            cache.move_to_end(node_id)
+            self._holders.setdefault(node_id, set()).add(worker)
+
+        evictions = []
+        while len(cache) > self.cache_size:
+            node_id, _ = cache.popitem(last=False)
+            holders = self._holders[node_id]
+            holders.discard(worker)
+            # the last copy of a state that is still in the tree goes back to the main process
+            spill = False
+            if not holders:
+                del self._holders[node_id]
+                node = self._nodes.get(node_id)
+                spill = node is not None and node.state is None
+                if spill:
+                    self._spilling.add(node_id)
+            evictions.append((node_id, spill))
+
+        return evictions
+
+    def _wait(self):
+        """Receive one message, keep the results and apply the states."""
+        message = self._receive()
+        if message[0] in ("rollout", "error"):
+            self._buffered.append(message)
+
+    def _receive(self, timeout: float | None = None) -> tuple:
+        message = self._results.get(timeout=timeout)
+        kind, node_id, payload = message
+        if kind in ("spill", "state"):
+            self._spilling.discard(node_id)
+            node = self._nodes.get(node_id)
+            if node is not None and node.state is None:
+                node.state = payload
+        return message
@@ -0,0 +1,166 @@
+from collections import OrderedDict
+import weakref
+
+from monte_carlo_tree_search import Node
+import snapshot_codec
+
+
+class StateStore:
+    """A memory budget for the states of the nodes in the tree.
+
+    The states of the nodes that are no longer on the frontier, i.e. the terminal nodes, the
+    transposition aliases and the fully expanded nodes, are dropped in the least recently used
+    order once the states exceed the budget. A rollout rebuilds a dropped state by replaying the
+    actions from the nearest ancestor that still has its state, see `replay_state`.
+    The root and its children are never dropped, since the next decision starts from one of them.
+
+    With `delta`, a state is not dropped but replaced with its delta against the parent's state,
+    see `snapshot_codec`, and `state` rebuilds it along the chain of deltas to a full state.
+
+    The bytes of a state are counted once however many nodes hold it, e.g. the transposition
+    aliases share the state of their first node.
+    """
+
+    def __init__(self, max_bytes: int, delta: bool = False):
+        """
+        args:
+            max_bytes: The memory budget of the states in bytes.
+            delta: Keep the evicted states as deltas against their parents instead of dropping them.
+        """
+        self.max_bytes = max_bytes
+        self.delta = delta
+        self.num_bytes = 0
+        self.num_evicted = 0
+        self._root = None
+        # the nodes with the bytes of their deltas or the id of their state, a node leaves when it is
+        # garbage collected
+        self._nodes = {}
+        # the states held by the nodes with the number of the nodes that hold each of them
+        self._states = {}
+        # the nodes off the frontier in the LRU order, only they are scanned by the eviction
+        self._evictable = OrderedDict()
+        # the nodes added since the last eviction, which may have left the frontier
+        self._pending = {}
+        # the deltas of the evicted states
+        self._deltas = weakref.WeakKeyDictionary()
+
+    def __len__(self) -> int:
+        """Return the number of nodes with a state in the store."""
+        return len(self._nodes)
+
+    def reroot(self, root: Node):
+        """Protect the new root and its children from the eviction."""
+        self._root = weakref.ref(root)
+        self.add(root)
+
+    def add(self, node: Node):
+        """Keep track of the state of the node, or mark it as recently used."""
+        key = id(node)
+        if key in self._nodes:
+            # the node got another state since, e.g. the one of its first node as a transposition alias
+            ref, size, state_id = self._nodes[key]
+            if node.state is not None and state_id != id(node.state):
+                if state_id is not None:
+                    self._release(state_id)
+                self._deltas.pop(node, None)
+                self.num_bytes -= size
+                self._nodes[key] = (ref, 0, self._hold(node.state))
+            if key in self._evictable:
+                self._evictable.move_to_end(key)
+            else:
+                self._pending[key] = None
+            return
+        if node.state is None:
+            return
+
+        # the node is forgotten when it is dropped from the tree
+        ref = weakref.ref(node, lambda _, key=key: self._forget(key))
+        self._nodes[key] = (ref, 0, self._hold(node.state))
+        self._pending[key] = None
+
+    def evict(self, action_space: int):
+        """Drop the states of the least recently used nodes off the frontier until the budget is met."""
+        # a node only leaves the frontier when it is added, i.e. when it or one of its children is
+        # updated, so the other nodes are not checked again
+        for key in list(self._pending):
+            node = self._nodes[key][0]() if key in self._nodes else None
+            if node is not None and node.state is not None and (
+                node.is_terminal
+                or node.transposition is not None
+                or node.is_fully_expanded(action_space)
+            ):
+                self._evictable[key] = None
+        self._pending.clear()
+
+        root = self._root() if self._root is not None else None
+        while self.num_bytes > self.max_bytes and self._evictable:
+            key, _ = self._evictable.popitem(last=False)
+            node = self._nodes[key][0]()
+            # the detached roots of the previous decisions go with their trees, and the root only
+            # moves down the tree, so the nodes that are skipped here are never evicted
+            if node is None or node.parent is None or node.parent is root:
+                continue
+
+            ref, _, state_id = self._nodes[key]
+            if self.delta:
+                # dropping a state that other nodes hold frees nothing, and its delta would add bytes
+                if self._states[state_id][1] > 1:
+                    continue
+                base = self.state(node.parent)
+                delta = None if base is None else snapshot_codec.encode(base, node.state)
+                # the states that do not shrink are kept in full
+                if delta is None or len(delta) >= len(node.state):
+                    continue
+                self._deltas[node] = delta
+                self._nodes[key] = (ref, len(delta), None)
+                self._release(state_id)
+                self.num_bytes += len(delta)
+                node.state = None
+            else:
+                node.state = None
+                self._forget(key)
+            self.num_evicted += 1
+
+    def state(self, node: Node) -> bytes | None:
+        """Return the state of the node, rebuilt from the deltas if it is evicted, or None if it is dropped."""
+        if node.state is not None:
+            return node.state
+        delta = self._deltas.get(node)
+        if delta is None or node.parent is None:
+            return None
+        base = self.state(node.parent)
+        return None if base is None else snapshot_codec.decode(base, delta)
+
+    def restore(self, node: Node) -> bytes | None:
+        """Put the full state back on the node, e.g. before it is detached from its parent."""
+        state = self.state(node)
+        if node.state is None and state is not None:
+            node.state = state
+            self._deltas.pop(node, None)
+            self._forget(id(node))
+            self.add(node)
+        return state
+
+    def _hold(self, state: bytes) -> int:
+        """Count a node that holds the state, the bytes of the state are only counted for the first one."""
+        # the state is kept here as well, so that its id is not reused while it is counted
+        entry = self._states.setdefault(id(state), [state, 0])
+        if entry[1] == 0:
+            self.num_bytes += len(state)
+        entry[1] += 1
+        return id(state)
+
+    def _release(self, state_id: int):
+        entry = self._states[state_id]
+        entry[1] -= 1
+        if entry[1] == 0:
+            del self._states[state_id]
+            self.num_bytes -= len(entry[0])
+
+    def _forget(self, key: int):
+        _, size, state_id = self._nodes.pop(key, (None, 0, None))
+        self._evictable.pop(key, None)
+        self._pending.pop(key, None)
+        self.num_bytes -= size
+        if state_id is not None:
+            self._release(state_id)
@@ -0,0 +1,363 @@
+import time
+
+import pytest
+
+from monte_carlo_tree_search import Node, state_key
+from agent_kane import AgentKane, _warm_root
+from decision_cache import DecisionCache
+from parallel_config import ParallelConfig, SearchMode, StateMode
+from search_budget import SearchBudget
+from search_metrics import SearchMetrics
+from test.fake_env import FakeEnv, create_env
+
+
+class ScriptedAgent(AgentKane):
+    """An agent that finishes the rollouts in the test process, the last dispatched one first.
+
+    While `stalled` is set, or once `stall_after` rollouts have finished, no rollout finishes
+    within the timeout.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(create_env, num_workers=2, verbose=False, **kwargs)
+        self.dispatched = []
+        self.num_results = 0
+        self.stalled = False
+        self.stall_after = None
+        self.last_first = True
+        self.rewards = [[1.0]]
+
+    def _dispatch(self, node, metrics):
+        self.dispatched.append(node)
+
+    def _next_result(self, timeout=None):
+        if self.stalled or self.num_results == self.stall_after:
+            assert timeout is not None, "the search would wait forever"
+            time.sleep(timeout)
+            return None
+        node = self.dispatched.pop(-1 if self.last_first else 0)
+        self.num_results += 1
+        state = b"state-%d" % self.num_results
+        return node, (state, False, self.rewards, state, 0.0)
+
+
+@pytest.fixture
+def agent():
+    agent = ScriptedAgent(parallel=ParallelConfig(search=SearchMode.STREAMING))
+    agent._num_actions = 4
+    yield agent
+    agent.close()
+
+
+def grow(agent: AgentKane, root: Node, **budget_options) -> SearchMetrics:
+    budget = SearchBudget(**budget_options)
+    budget.start()
+    metrics = SearchMetrics(2)
+    agent._grow(root, budget, metrics, verbose=False)
+    return metrics
+
+
+def expected_statistics(node: Node, is_root: bool = True) -> tuple:
+    """The visits, value and squared values of a node where each rollout returns 1"""
+    visits = 0 if is_root else 1
+    value = value_squares = 0.0 if is_root else 1.0
+    for child in node.children:
+        child_visits, child_value, child_squares = expected_statistics(child, False)
+        visits += child_visits
+        value += 0.7 * child_value
+        value_squares += 0.49 * child_squares
+    return visits, value, value_squares
+
+
+def assert_statistics(node: Node, is_root: bool = True):
+    visits, value, value_squares = expected_statistics(node, is_root)
+    assert node.visits == visits
+    assert node.value == pytest.approx(value)
+    assert node.value_squares == pytest.approx(value_squares)
+    for child in node.children:
+        assert_statistics(child, is_root=False)
+
+
+def test_streaming_results_out_of_order(agent):
+    """The results that finish out of order should be backed up as if they were in order"""
+    root = Node(state=b"root", action=1)
+
+    grow(agent, root, target_num_nodes=12, target_depth=2)
+
+    assert agent.num_results == root.size - 1
+    # the virtual losses are reverted, only the rollouts are left in the statistics
+    assert_statistics(root)
+
+
+def test_streaming_drains_at_the_budget(agent):
+    """The search should stop dispatching at the budget and back up every dispatched rollout"""
+    root = Node(state=b"root", action=1)
+
+    grow(agent, root, target_num_nodes=3, target_depth=1)
+
+    assert agent.dispatched == []
+    assert agent.num_results == root.size - 1
+    assert root.size - 1 <= 3 + agent.num_workers
+    assert_statistics(root)
+
+
+def test_steps_of_several_rollouts_per_leaf(agent):
+    """The step of running a leaf should be counted once, not once for each of its rollouts"""
+    agent.rewards = [[1.0, 2.0], [1.0, 3.0, 4.0]]
+    root = Node(state=b"root", action=1)
+
+    metrics = grow(agent, root, target_num_nodes=4, target_depth=1)
+
+    assert metrics.counters["rollouts"] == 2 * agent.num_results
+    assert metrics.counters["steps"] == 4 * agent.num_results
+
+
+def test_streaming_leaves_the_rollouts_behind_at_the_deadline(agent):
+    """The search should not wait past the deadline, the late results are backed up by the next search"""
+    root = Node(state=b"root", action=1)
+    grow(agent, root, target_num_nodes=4, target_depth=1)
+    visits, value = root.visits, root.value
+
+    agent.stalled = True
+    t_0 = time.time()
+    grow(agent, root, time_budget_ms=50)
+
+    assert time.time() - t_0 < 0.5
+    assert len(agent.dispatched) == 2
+    # the rollouts in flight leave no virtual loss behind
+    assert (root.visits, root.value) == (visits, value)
+
+    agent.stalled = False
+    agent.last_first = False
+    grow(agent, root, target_num_nodes=12, target_depth=2)
+
+    assert agent.dispatched == []
+    assert_statistics(root)
+
+
+def test_decisions_after_rollouts_are_left_behind():
+    """A root child without a result should not be chosen over a visited child with a lower value"""
+    agent = ScriptedAgent(
+        parallel=ParallelConfig(search=SearchMode.STREAMING), time_budget_ms=20
+    )
+    agent.rewards = [[-50.0]]
+    agent.stall_after = 1
+    env = FakeEnv()
+    try:
+        action, tree = agent.act(env, None)
+        assert any(c.visits == 0 for c in tree.children)
+        decision = next(c for c in tree.children if c.action == action)
+        assert decision.visits > 0
+
+        agent.stall_after = None
+        action, tree = agent.act(env, None)
+    finally:
+        agent.close()
+
+    assert tree is decision
+    assert action in [c.action for c in tree.children if c.visits > 0]
+
+
+@pytest.mark.parametrize("search", [SearchMode.BATCHED, SearchMode.STREAMING])
+def test_decision_past_the_deadline(search):
+    """A search whose deadline has already passed should still expand the root and decide"""
+    agent = AgentKane(
+        create_env,
+        num_workers=2,
+        parallel=ParallelConfig(search=search),
+        time_budget_ms=0,
+        verbose=False,
+    )
+    env = FakeEnv()
+    try:
+        action, tree = agent.act(env, None)
+    finally:
+        agent.close()
+
+    assert action in range(4)
+    assert len(tree.children) > 0
+
+
+def speculate(agent: AgentKane, env: FakeEnv) -> Node:
+    """Decide, step the environment and return the speculated tree once it is grown."""
+    action, _ = agent.act(env, None)
+    env.step(action)
+    speculation = agent._speculation
+    assert speculation is not None, "no speculation is started"
+    speculation.join()
+    return agent._previous_node
+
+
+def test_speculation_hit_reuses_the_tree():
+    """The next decision should continue with the tree grown in the background"""
+    agent = AgentKane(
+        create_env,
+        num_workers=2,
+        parallel=ParallelConfig(speculative=True),
+        target_num_nodes=8,
+        verbose=False,
+    )
+    env = FakeEnv()
+    try:
+        speculated = speculate(agent, env)
+        assert speculated.size > 1
+        _, tree = agent.act(env, None)
+    finally:
+        agent.close()
+
+    assert tree is speculated
+
+
+def test_speculation_miss_drops_the_tree():
+    """The next decision should start a new tree if the environment left the speculated state"""
+    agent = AgentKane(
+        create_env,
+        num_workers=2,
+        parallel=ParallelConfig(speculative=True),
+        target_num_nodes=8,
+        verbose=False,
+    )
+    env = FakeEnv()
+    try:
+        speculated = speculate(agent, env)
+        env.step(0)
+        _, tree = agent.act(env, None)
+    finally:
+        agent.close()
+
+    assert tree is not speculated
+    assert tree.state == env.serialize()
+
+
+@pytest.mark.parametrize("states", [StateMode.CACHE, StateMode.ARENA])
+def test_speculation_with_the_states_out_of_the_nodes(states):
+    """The state of the next root should be fetched from the workers or the arena to speculate"""
+    agent = AgentKane(
+        create_env,
+        num_workers=2,
+        parallel=ParallelConfig(
+            states=states, state_cache_size=64, arena_slots=64, speculative=True
+        ),
+        target_num_nodes=8,
+        verbose=False,
+    )
+    env = FakeEnv()
+    try:
+        speculated = speculate(agent, env)
+        assert speculated.state == env.serialize()
+        _, tree = agent.act(env, None)
+    finally:
+        agent.close()
+
+    assert tree is speculated
+
+
+def test_speculation_skipped_without_a_state():
+    """A decision without a state, e.g. a child of a warm start, should not be speculated on"""
+    decision_cache = DecisionCache(":memory:")
+    env = FakeEnv()
+    decision_cache.put(
+        state_key(env.serialize()), [(action, 1, 0.0, 0.0) for action in range(4)]
+    )
+    agent = AgentKane(
+        create_env,
+        num_workers=2,
+        parallel=ParallelConfig(speculative=True),
+        decision_cache=decision_cache,
+        target_num_nodes=8,
+        verbose=False,
+    )
+    try:
+        agent.act(env, None)
+        assert agent._previous_node.state is None
+        assert agent._speculation is None
+    finally:
+        agent.close()
+        decision_cache.close()
+
+
+def test_root_parallel_trees_share_the_budget():
+    """The independent trees should split the node budget and report their merged size and depth"""
+    agent = AgentKane(
+        create_env,
+        num_workers=2,
+        parallel=ParallelConfig(search=SearchMode.ROOT_PARALLEL, num_trees=4),
+        target_num_nodes=8,
+        target_depth=1,
+        verbose=False,
+    )
+    try:
+        agent.act(FakeEnv(), None)
+    finally:
+        agent.close()
+
+    # each tree stops at its share of the nodes once its root is expanded
+    assert agent.metrics.last["num_nodes"] == 1 + 4 * 4
+    assert agent.metrics.last["max_depth"] == 1
+
+
+def test_root_parallel_trees_start_from_the_decision_cache():
+    """The cached statistics of the root children should be merged with the trees"""
+    decision_cache = DecisionCache(":memory:")
+    env = FakeEnv()
+    decision_cache.put(
+        state_key(env.serialize()),
+        [(3, 100, 1000.0, 10000.0, False, False)]
+        + [(action, 1, 0.0, 0.0, False, False) for action in range(3)],
+    )
+    agent = AgentKane(
+        create_env,
+        num_workers=2,
+        parallel=ParallelConfig(search=SearchMode.ROOT_PARALLEL, num_trees=2),
+        decision_cache=decision_cache,
+        target_num_nodes=8,
+        target_depth=1,
+        verbose=False,
+    )
+    try:
+        action, tree = agent.act(env, None)
+    finally:
+        agent.close()
+        decision_cache.close()
+
+    assert action == 3
+    assert next(c for c in tree.children if c.action == 3).visits > 100
+    assert agent.metrics.last["rollouts"] == tree.visits - 103
+
+
+def test_root_parallel_trees_without_early_stop():
+    """The early stop should be rejected, the trees cannot tell when the merged decision is settled"""
+    with pytest.raises(ValueError):
+        AgentKane(
+            create_env,
+            num_workers=2,
+            parallel=ParallelConfig(search=SearchMode.ROOT_PARALLEL),
+            early_stop=True,
+            verbose=False,
+        )
+
+
+def test_warm_root_keeps_the_status_of_the_children():
+    """The cached terminal children should not be expanded by the search from a warm start"""
+    root = _warm_root(
+        b"root", [(0, 2, 4.0, 8.0, True, True), (1, 1, 1.0, 1.0, False, False)]
+    )
+
+    assert [c.is_terminal for c in root.children] == [True, False]
+    assert root.children[0].is_victory
+    assert (root.visits, root.value) == (3, 5.0)
+
+
+@pytest.mark.parametrize(
+    "options",
+    [
+        {"search": SearchMode.ROOT_PARALLEL, "speculative": True},
+        {"search": SearchMode.ROOT_PARALLEL, "states": StateMode.CACHE},
+        {"search": SearchMode.STREAMING, "rollouts_per_task": 2},
+        {"states": StateMode.ARENA, "rollouts_per_task": 2},
+    ],
+)
+def test_incompatible_parallel_modes(options):
+    """The parallel modes that cannot work together should be rejected by the config"""
+    with pytest.raises(ValueError):
+        ParallelConfig(**options)
@@ -0,0 +1,145 @@
+import functools
+
+import numpy as np
+import pytest
+
+import monte_carlo_tree_search as mcts
+from array_tree import ArrayTree, array_scorer
+
+
+def test_select_on_root_node():
+    """The root node is the only candidate of a new tree and its score is inf"""
+    tree = ArrayTree(action=0)
+
+    actual = tree.select(action_space=4)
+
+    assert actual == [(0, 0, float("inf"))]
+
+
+def test_select_matches_node_scores():
+    """The vectorized UCB1 scores should be the same as the ones of the `Node` based select"""
+    root = mcts.Node(visits=6, action=1)
+    root.add(child_1 := mcts.Node(action=1, visits=3, value=1))
+    root.add(mcts.Node(action=2, visits=2, value=10))
+    root.add(mcts.Node(action=0, visits=1, value=20))
+    child_1.add(mcts.Node(action=3, visits=1, value=2))
+    child_1.add(mcts.Node(action=2, visits=0, value=0))
+
+    tree = ArrayTree(action=1)
+    tree.visits[0] = 6
+    c1 = tree.add(0, 1)
+    c2 = tree.add(0, 2)
+    c3 = tree.add(0, 0)
+    g1 = tree.add(c1, 3)
+    g2 = tree.add(c1, 2)
+    tree.visits[[c1, c2, c3, g1, g2]] = [3, 2, 1, 1, 0]
+    tree.value[[c1, c2, c3, g1, g2]] = [1, 10, 20, 2, 0]
+
+    expected = [score for _, _, score in mcts.select(root, max_candidates=8)]
+    actual = [score for _, _, score in tree.select(max_candidates=8)]
+
+    assert np.allclose(sorted(expected), sorted(actual))
+    # the unvisited grandchild comes first
+    assert tree.select(max_candidates=1)[0][0] == g2
+
+
+def test_expand_with_limitation():
+    """The expansion should stop at max_expansions and continue from the missing actions later"""
+    tree = ArrayTree(action=0)
+
+    new_nodes = tree.expand([(0, 0, 1.0)], num_actions=4, max_expansions=2)
+    assert [tree.action[i] for i in new_nodes] == [0, 1]
+
+    new_nodes = tree.expand([(0, 0, 1.0)], num_actions=4, max_expansions=8)
+    assert [tree.action[i] for i in new_nodes] == [2, 3]
+    assert tree.num_children[0] == 4
+    assert len(tree.select(action_space=4)) == 4
+
+
+def test_expand_terminal_node():
+    """The function should ignore terminal nodes"""
+    tree = ArrayTree()
+    tree.is_terminal[0] = True
+
+    assert tree.expand([(0, 0, 1.0)], num_actions=4) == []
+
+
+def test_backpropagate_linear_tree():
+    """The values and visits should be the same as the `Node` based backpropagate"""
+    tree = ArrayTree()
+    node_1 = tree.add(0, 1)
+    node_2 = tree.add(node_1, 2)
+    tree.visits[[0, node_1]] = [2, 1]
+    tree.value[[0, node_1]] = [2, 1]
+
+    tree.backpropagate(node_2, [10, 20, 30, 40])
+
+    expected_initial_reward = 10 + 20 * 0.9 + 30 * 0.9**2 + 40 * 0.9**3
+    assert np.isclose(tree.value[node_2], expected_initial_reward)
+    assert np.isclose(tree.value[node_1], 1 + expected_initial_reward * 0.9)
+    assert np.isclose(tree.value[0], 2 + expected_initial_reward * 0.9**2)
+    assert list(tree.visits[[0, node_1, node_2]]) == [3, 2, 1]
+
+
+def test_grow_and_convert():
+    """The tree should grow beyond its capacity and convert back to `Node` objects"""
+    tree = ArrayTree(capacity=2, state=b"root")
+    for action in range(4):
+        tree.add(0, action)
+    tree.value[3] = 5
+
+    assert tree.capacity == 8
+    assert tree.best_action() == 2
+
+    root = tree.to_node()
+    assert root.state == b"root"
+    assert [c.action for c in root.children] == [0, 1, 2, 3]
+    assert root.children[2].parent is root
+
+
+def test_tuned_scores_match_node_scores():
+    """The vectorized UCB1-Tuned scores should be the same as the ones of the `Node` scorer"""
+    root = mcts.Node(visits=6, action=1)
+    root.add(child_1 := mcts.Node(action=1, visits=3, value=30, value_squares=500))
+    root.add(child_2 := mcts.Node(action=2, visits=2, value=-10, value_squares=80))
+
+    tree = ArrayTree(action=1)
+    tree.visits[0] = 6
+    c1 = tree.add(0, 1)
+    c2 = tree.add(0, 2)
+    tree.visits[[c1, c2]] = [3, 2]
+    tree.value[[c1, c2]] = [30, -10]
+    tree.value_squares[[c1, c2]] = [500, 80]
+
+    scorer = array_scorer(functools.partial(mcts.ucb1_tuned, value_range=10.0))
+    actual = scorer(tree, np.array([0, c1, c2]), 1.0)
+
+    expected = [
+        mcts.ucb1_tuned(node, 1.0, value_range=10.0) for node in (root, child_1, child_2)
+    ]
+    assert np.allclose(actual, expected)
+
+
+def test_array_scorer_without_vectorized_version():
+    """A scorer that cannot be vectorized should be rejected"""
+    with pytest.raises(ValueError):
+        array_scorer(lambda node, exploration_weight: 0.0)
+
+
+def test_select_skips_terminal_nodes():
+    """The terminal nodes are never expanded, so they should not block the selection"""
+    tree = ArrayTree(action=0)
+    tree.expand([(0, 0, 1.0)], num_actions=4)
+    tree.is_terminal[1:] = True
+
+    assert [index for index, _, _ in tree.select(action_space=4)] == []
+
+
+def test_backpropagate_squared_values():
+    """The squared values should be backpropagated for the variance of the nodes"""
+    tree = ArrayTree()
+    node_1 = tree.add(0, 1)
+
+    tree.backpropagate(node_1, [10], reward_discount=0.5)
+
+    assert list(tree.value_squares[[0, node_1]]) == [25, 100]
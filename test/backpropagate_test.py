@@ -1,3 +1,5 @@
+import pytest
+
 import monte_carlo_tree_search as mcts
 
 
@@ -30,3 +32,49 @@ def test_linear_tree():
     assert node_1.visits == 2
     assert root.value == 2 + expected_initial_reward * 0.9**2
     assert root.visits == 3
+
+
+def test_virtual_loss_is_reverted():
+    """Verify that the virtual loss marks the whole path and leaves no trace after it is reverted."""
+    root = mcts.Node(visits=2, value=2)
+    root.add(node_1 := mcts.Node(visits=1, value=1))
+    node_1.add(node_2 := mcts.Node())
+
+    mcts.apply_virtual_loss(node_2, virtual_loss=3)
+
+    assert [n.visits for n in (root, node_1, node_2)] == [3, 2, 1]
+    assert [n.value for n in (root, node_1, node_2)] == [-1, -2, -3]
+    assert [n.value_squares for n in (root, node_1, node_2)] == [9, 9, 9]
+
+    mcts.revert_virtual_loss(node_2, virtual_loss=3)
+
+    assert [n.visits for n in (root, node_1, node_2)] == [2, 1, 0]
+    assert [n.value for n in (root, node_1, node_2)] == [2, 1, 0]
+    assert [n.value_squares for n in (root, node_1, node_2)] == [0, 0, 0]
+
+
+def test_variance_of_the_backpropagated_values():
+    """The squared values should give the variance of the returns, which narrows the UCB1-Tuned bonus"""
+    root = mcts.Node(visits=0, action=1)
+    root.add(child := mcts.Node(action=1))
+    root.add(steady := mcts.Node(action=1, visits=2, value=10, value_squares=50))
+    root.visits = 2
+
+    mcts.backpropagate(child, [4], reward_discount=0.5)
+    mcts.backpropagate(child, [8], reward_discount=0.5)
+
+    assert child.value_squares == 16 + 64
+    assert mcts.variance(child) == 4
+    assert mcts.variance(steady) == 0
+    # the same mean, but the noisy node gets the larger exploration bonus once the variance is
+    # normalized by the range of the values
+    root.visits = 2000
+    child.visits, child.value, child.value_squares = 1000, 5000, 29000
+    steady.visits, steady.value, steady.value_squares = 1000, 5000, 25000
+    assert mcts.ucb1_tuned(child, 1.0, value_range=10) > mcts.ucb1_tuned(
+        steady, 1.0, value_range=10
+    )
+    # the variance is negligible against the range of the rewards of the game
+    assert mcts.ucb1_tuned(child, 1.0) == pytest.approx(
+        mcts.ucb1_tuned(steady, 1.0), rel=1e-3
+    )
@@ -0,0 +1,73 @@
+from decision_cache import DecisionCache
+
+
+def test_put_and_get(tmp_path):
+    """The statistics should persist across the connections"""
+    path = str(tmp_path / "decisions.sqlite")
+    cache = DecisionCache(path)
+    cache.put(
+        b"state",
+        [(0, 10, 5.0, 3.0, False, False), (1, 20, 30.0, 50.0, True, True)],
+    )
+    cache.close()
+
+    cache = DecisionCache(path)
+    assert cache.get(b"state") == [
+        (0, 10, 5.0, 3.0, False, False),
+        (1, 20, 30.0, 50.0, True, True),
+    ]
+    assert cache.get(b"other") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.close()
+
+
+def test_evict_least_recently_used():
+    """The cache should drop the least recently used states beyond its cap"""
+    cache = DecisionCache(":memory:", max_entries=2)
+    cache.put(b"a", [(0, 1, 1.0, 1.0)])
+    cache.put(b"b", [(0, 1, 1.0, 1.0)])
+    cache.get(b"a")
+    cache.put(b"c", [(0, 1, 1.0, 1.0)])
+
+    assert len(cache) == 2
+    assert cache.get(b"b") is None
+    assert cache.get(b"a") is not None
+
+
+def test_rows_without_the_status():
+    """The children cached without the terminal and victory status should be read as neither"""
+    cache = DecisionCache(":memory:")
+    cache.put(b"state", [(0, 10, 5.0, 3.0)])
+
+    assert cache.get(b"state") == [(0, 10, 5.0, 3.0, False, False)]
+
+
+def test_lookups_are_written_with_the_next_put(tmp_path):
+    """The lookups should only be written with the next write, and still count for the eviction"""
+    path = str(tmp_path / "decisions.sqlite")
+    cache = DecisionCache(path, max_entries=2)
+    cache.put(b"a", [(0, 1, 1.0, 1.0, False, False)])
+    cache.put(b"b", [(0, 1, 1.0, 1.0, False, False)])
+    cache.get(b"a")
+    assert not cache._connection.in_transaction
+
+    cache.put(b"c", [(0, 1, 1.0, 1.0, False, False)])
+    cache.get(b"a")
+    cache.close()
+
+    cache = DecisionCache(path, max_entries=2)
+    assert cache.get(b"b") is None
+    # the last lookup is written on close
+    cache.put(b"d", [(0, 1, 1.0, 1.0, False, False)])
+    assert cache.get(b"c") is None
+    assert cache.get(b"a") is not None
+    cache.close()
+
+
+def test_confident_decision():
+    """A decision is confident with enough visits and a large share of them"""
+    cache = DecisionCache(":memory:", min_visits=100, confidence=0.8)
+
+    assert cache.decision([(0, 5, 1.0, 0), (1, 45, 40.0, 0)]) is None
+    assert cache.decision([(0, 50, 1.0, 0), (1, 50, 40.0, 0)]) is None
+    assert cache.decision([(0, 10, 1.0, 0), (1, 90, 40.0, 0)]) == 1
@@ -0,0 +1,134 @@
+import lzma
+import os
+
+import pytest
+
+from monte_carlo_tree_search import Node
+from episode_archive import DELTA, KEYFRAME, EpisodeReader, EpisodeWriter
+from game_play_recorder import (
+    _MAX_READERS,
+    _open_archive,
+    GamePlayRecorder,
+    load_play_info,
+    load_state,
+    recorded_steps,
+)
+from tree_recording import TreeRecording, flatten
+import snapshot_codec
+
+
+def mutate(state: bytes, i: int) -> bytes:
+    data = bytearray(state)
+    data[i * 7 % len(data)] ^= 0xFF
+    return bytes(data)
+
+
+def write_archive(path, states, close=True):
+    writer = EpisodeWriter(path)
+    for i, state in enumerate(states):
+        root = Node(action=1, visits=i)
+        root.add(Node(action=i % 4))
+        if i % 3:
+            blob, kind = snapshot_codec.encode(states[i - 1], state), DELTA
+        else:
+            blob, kind = state, KEYFRAME
+        writer.append({"action": i}, lzma.compress(blob), kind, flatten(root))
+    if close:
+        writer.close()
+    else:
+        writer.flush()
+    return writer
+
+
+def test_random_access_and_streaming(tmp_path):
+    """The steps should be read back by their index and in order"""
+    states = [os.urandom(128)]
+    for i in range(6):
+        states.append(mutate(states[-1], i))
+    write_archive(tmp_path / "episode.archive", states)
+
+    reader = EpisodeReader(tmp_path / "episode.archive")
+    assert len(reader) == 7
+    assert reader.play_info(5) == {"action": 5}
+    assert reader.state(5) == states[5]
+    assert reader[4].state == states[4]
+    assert TreeRecording(reader.tree(2)).children() == [1]
+    assert reader.tree(2)["visits"][0] == 2
+
+    steps = list(reader)
+    assert [step.state for step in steps] == states
+    assert [step.play_info["action"] for step in steps] == list(range(7))
+    with pytest.raises(IndexError):
+        reader.state(7)
+    reader.close()
+
+
+def test_unclosed_archive_is_scanned(tmp_path):
+    """The steps of an archive without the index should be found by scanning the records"""
+    states = [os.urandom(64) for _ in range(4)]
+    writer = write_archive(tmp_path / "episode.archive", states, close=False)
+    # a record cut off by a crash
+    writer._file.write(b"STEP\x04")
+    writer._file.flush()
+
+    reader = EpisodeReader(tmp_path / "episode.archive")
+    assert len(reader) == 4
+    assert reader.state(3) == states[3]
+    reader.close()
+    writer._file.close()
+
+
+def test_recorder_writes_an_archive(tmp_path):
+    """The recorder should write the steps into one archive that the loaders read"""
+    recording = tmp_path / "recording"
+    recorder = GamePlayRecorder(
+        recording, keyframe_interval=2, background=True, archive=True
+    )
+    states = [os.urandom(64)]
+    for i in range(4):
+        states.append(mutate(states[-1], i))
+    for i, state in enumerate(states):
+        recorder.record({"action": i}, state, Node(action=1))
+    recorder.close()
+
+    assert sorted(path.name for path in recording.iterdir()) == ["episode.archive"]
+    assert recorded_steps(recording) == [0, 1, 2, 3, 4]
+    assert load_play_info(recording, 3) == {"action": 3}
+    for index, state in enumerate(states):
+        assert load_state(recording, index) == state
+
+
+def test_loaders_follow_a_growing_archive(tmp_path):
+    """The loaders should see the steps appended after their first lookup"""
+    recording = tmp_path / "recording"
+    recording.mkdir()
+    states = [os.urandom(64), os.urandom(64)]
+    writer = write_archive(recording / "episode.archive", states[:1], close=False)
+    assert recorded_steps(recording) == [0]
+
+    writer.append({"action": 1}, lzma.compress(states[1]), KEYFRAME)
+    writer.close()
+
+    assert recorded_steps(recording) == [0, 1]
+    assert load_state(recording, 1) == states[1]
+
+
+def test_loaders_close_the_readers_they_drop(tmp_path):
+    """The readers of the older versions and the least recently used archives should be closed"""
+    recordings = []
+    for i in range(_MAX_READERS + 1):
+        recordings.append(tmp_path / f"recording-{i}")
+        recordings[-1].mkdir()
+    writer = write_archive(recordings[0] / "episode.archive", [b"state"], close=False)
+    first = _open_archive(recordings[0])
+
+    writer.append({"action": 1}, lzma.compress(b"state"), KEYFRAME)
+    writer.close()
+    second = _open_archive(recordings[0])
+    assert first._file.closed
+    assert not second._file.closed
+
+    for recording in recordings[1:]:
+        write_archive(recording / "episode.archive", [b"state"])
+        _open_archive(recording)
+    assert second._file.closed
@@ -65,3 +65,15 @@ def test_expand_terminal_node():
     assert new_nodes == child_2.children
     # child_1 should be left untouched
     assert len(child_1.children) == 0
+
+
+def test_expand_continues_a_partially_expanded_node():
+    """A node expanded across several rounds should get each action once"""
+    root = mcts.Node(visits=10)
+
+    first = mcts.expand([(root, 0, 1)], num_actions=4, max_expansions=3)
+    second = mcts.expand([(root, 0, 1)], num_actions=4, max_expansions=3)
+
+    assert [n.action for n in first] == [0, 1, 2]
+    assert [n.action for n in second] == [3]
+    assert root.is_fully_expanded(action_space=4)
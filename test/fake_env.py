@@ -0,0 +1,29 @@
+import gymnasium as gym
+
+
+class FakeEnv:
+    """A game that ends after five steps, every step is rewarded with 1."""
+
+    action_space = gym.spaces.Discrete(4)
+
+    def __init__(self):
+        self.time = 0
+
+    def reset(self):
+        self.time = 0
+        return None, {}
+
+    def step(self, action: int) -> tuple:
+        self.time += 1
+        return None, 1.0, self.time >= 5, False, {"flag_get": False}
+
+    def serialize(self) -> bytes:
+        return b"%d" % self.time
+
+    def deserialize(self, state: bytes):
+        self.time = int(state)
+
+
+def create_env(**kwargs) -> FakeEnv:
+    """Create the environment with the arguments of the simulation environments."""
+    return FakeEnv()
@@ -0,0 +1,77 @@
+import random
+
+import monte_carlo_tree_search as mcts
+
+
+def scores(candidates):
+    return [(node, score) for node, _, score in candidates]
+
+
+def test_frontier_on_leaf_node():
+    """The frontier of a single node tree is the node itself with an inf score"""
+    leaf = mcts.Node(action=0)
+
+    frontier = mcts.Frontier(leaf)
+
+    assert frontier.select() == [(leaf, 0, float("inf"))]
+
+
+def test_frontier_matches_select():
+    """The frontier should return the same candidates as `select` while the tree grows"""
+    rng = random.Random(0)
+    root = mcts.Node(action=1)
+    frontier = mcts.Frontier(root)
+
+    for _ in range(60):
+        candidates = frontier.select(max_candidates=3)
+        assert scores(candidates) == scores(mcts.select(root, max_candidates=3))
+
+        depths = {node: depth for node, depth, _ in candidates}
+        new_nodes = mcts.expand(candidates, num_actions=4, max_expansions=4)
+        for node in new_nodes:
+            frontier.add(node, depths[node.parent] + 1)
+        for node in new_nodes:
+            mcts.backpropagate(node, [rng.uniform(-5, 10) for _ in range(3)])
+            frontier.update(node)
+
+    assert scores(frontier.select(max_candidates=100)) == scores(
+        mcts.select(root, max_candidates=100)
+    )
+
+
+def test_frontier_drops_fully_expanded_nodes():
+    """A node should leave the frontier once all of its children are added"""
+    root = mcts.Node(visits=1, value=1)
+    frontier = mcts.Frontier(root)
+
+    for action in range(4):
+        root.add(child := mcts.Node(action=action))
+        frontier.add(child, 1)
+
+    assert root not in frontier
+    assert len(frontier) == 4
+
+
+def test_frontier_indexes_existing_tree():
+    """A frontier built from an existing tree should report the depth of the nodes"""
+    root = mcts.Node(visits=2, action=1)
+    root.add(child := mcts.Node(action=1, visits=1, value=1))
+    child.add(grandchild := mcts.Node(action=2))
+
+    frontier = mcts.Frontier(root)
+    depths = {node: depth for node, depth, _ in frontier.select()}
+
+    assert depths == {root: 0, child: 1, grandchild: 2}
+
+
+def test_frontier_discard():
+    """A discarded node should not be selected until it is added again"""
+    root = mcts.Node(visits=1, value=1)
+    root.add(child := mcts.Node(action=1))
+    frontier = mcts.Frontier(root)
+
+    frontier.discard(child)
+    assert [node for node, _, _ in frontier.select()] == [root]
+
+    frontier.add(child, 1)
+    assert [node for node, _, _ in frontier.select()] == [child, root]
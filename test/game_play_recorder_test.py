@@ -0,0 +1,49 @@
+import os
+
+import pytest
+
+from monte_carlo_tree_search import Node
+from game_play_recorder import GamePlayRecorder, load_state
+from tree_recording import TreeRecording
+
+
+def create_tree() -> Node:
+    root = Node(action=1, visits=2, value=1.0)
+    root.add(Node(action=0, visits=1, value=0.5))
+    root.add(Node(action=2, visits=1, value=0.5, is_terminal=True))
+    return root
+
+
+def test_background_recording_matches_the_inline_one(tmp_path):
+    """The background writes should produce the same files as the inline ones"""
+    states = [os.urandom(64) for _ in range(4)]
+    inline = GamePlayRecorder(tmp_path / "inline", keyframe_interval=2)
+    background = GamePlayRecorder(
+        tmp_path / "background", keyframe_interval=2, background=True, max_queued=1
+    )
+    for recorder in (inline, background):
+        for i, state in enumerate(states):
+            tree = create_tree()
+            recorder.record({"action": i}, state, tree)
+            # the tree changes in the next search while the write is still queued
+            tree.add(Node(action=1))
+        recorder.record_metrics({"seconds": 1.0})
+    background.close()
+
+    for path in sorted((tmp_path / "inline").iterdir()):
+        assert (tmp_path / "background" / path.name).read_bytes() == path.read_bytes()
+    for index, state in enumerate(states):
+        assert load_state(tmp_path / "background", index) == state
+    tree = TreeRecording(tmp_path / "background" / "0000.tree.npy")
+    assert len(tree) == 3
+    assert background.backlog == 0
+
+
+def test_background_error_is_raised_by_flush(tmp_path):
+    """A failed background write should be raised in the caller"""
+    recorder = GamePlayRecorder(tmp_path / "recording", background=True)
+    recorder.record_metrics({"value": object()})
+
+    with pytest.raises(TypeError):
+        recorder.flush()
+    recorder.close()
@@ -0,0 +1,81 @@
+import os
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from game_play_recorder import load_play_info, recorded_steps
+import mario_ram
+
+
+def create_ram() -> np.ndarray:
+    return np.zeros(2048, dtype=np.uint8)
+
+
+def test_position():
+    """The position should be read from the page, the pixel and the viewport"""
+    ram = create_ram()
+    ram[mario_ram.X_PAGE] = 2
+    ram[mario_ram.X_PIXEL] = 40
+    ram[mario_ram.Y_PIXEL] = 176
+    ram[mario_ram.Y_VIEWPORT] = 1
+
+    assert mario_ram.x_position(ram) == 552
+    assert mario_ram.y_position(ram) == 79
+
+    # above the screen, e.g. a high jump into the area of the score board
+    ram[mario_ram.Y_VIEWPORT] = 0
+    ram[mario_ram.Y_PIXEL] = 250
+    assert mario_ram.y_position(ram) == 260
+
+
+def test_flag_and_death():
+    """The flag is got at the end of the world or on the flagpole, and the death is a player state"""
+    ram = create_ram()
+    assert not mario_ram.flag_get(ram)
+    assert not mario_ram.is_dead(ram)
+
+    ram[mario_ram.ENEMY_TYPES[2]] = 0x31
+    assert not mario_ram.flag_get(ram)
+    ram[mario_ram.PLAYER_FLOAT_STATE] = mario_ram.FLAGPOLE
+    assert mario_ram.flag_get(ram)
+
+    ram = create_ram()
+    ram[mario_ram.GAME_MODE] = mario_ram.WORLD_OVER
+    assert mario_ram.flag_get(ram)
+
+    ram[mario_ram.PLAYER_STATE] = mario_ram.DEAD
+    assert mario_ram.is_dead(ram)
+
+
+def test_parity_over_recorded_episodes():
+    """The rewards from the RAM should be the same as the ones from the `info` over the recorded episodes"""
+    pytest.importorskip("gym_super_mario_bros")
+    from environment import create_env
+
+    recordings = sorted(Path(os.environ.get("MARIO_RECORDINGS", "data")).glob("*/"))
+    if not recordings:
+        pytest.skip("No recorded episodes")
+
+    num_steps = 0
+    for recording in recordings:
+        envs = [
+            create_env(headless=True, with_reward=True, reward_source=source)
+            for source in ("info", "ram")
+        ]
+        for env in envs:
+            env.reset()
+
+        for index in recorded_steps(recording):
+            action = load_play_info(recording, index)["action"]
+            info_step, ram_step = [env.step(action) for env in envs]
+            assert info_step[1:4] == ram_step[1:4], f"{recording} differs at {index}"
+            num_steps += 1
+            if info_step[2] or info_step[3]:
+                break
+
+        for env in envs:
+            env.close()
+
+    if num_steps == 0:
+        pytest.skip("No steps are recorded in the episodes")
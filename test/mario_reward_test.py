@@ -0,0 +1,86 @@
+import pytest
+
+
+def create_envs(max_episode_steps: int) -> list:
+    """Create two environments with the same time limit for the full and the lean steps."""
+    pytest.importorskip("gym_super_mario_bros")
+    from gymnasium import make
+    from gymnasium.wrappers import TimeLimit
+    from nes_py.wrappers import JoypadSpace
+
+    from action_space import FAST_MOVE
+    from mario_reward import MarioReward
+
+    envs = []
+    for _ in range(2):
+        env = make("SuperMarioBros-4-1-v0", headless=True)
+        env = TimeLimit(env, max_episode_steps=max_episode_steps)
+        env = MarioReward(JoypadSpace(env, FAST_MOVE))
+        env.reset()
+        envs.append(env)
+    return envs
+
+
+def test_lean_step_parity():
+    """The lean steps should be rewarded and terminated the same as the full steps"""
+    full_env, lean_env = create_envs(max_episode_steps=10_000)
+    # run right, with a jump every few frames
+    actions = [2 if i % 16 < 8 else 1 for i in range(300)]
+    try:
+        for i, action in enumerate(actions):
+            _, reward, terminated, truncated, info = full_env.step(action)
+            lean_reward, lean_terminated, lean_truncated, lean_info = lean_env.step_lean(
+                action
+            )
+
+            assert (lean_reward, lean_terminated, lean_truncated) == (
+                reward,
+                terminated,
+                truncated,
+            ), f"step {i} differs"
+            assert (lean_info.x_pos, lean_info.y_pos) == (info["x_pos"], info["y_pos"])
+            if terminated or truncated:
+                break
+    finally:
+        full_env.close()
+        lean_env.close()
+
+
+def test_lean_step_time_limit():
+    """The lean steps should be truncated by the time limit the same as the full steps"""
+    full_env, lean_env = create_envs(max_episode_steps=5)
+    try:
+        full_truncated = [full_env.step(0)[3] for _ in range(5)]
+        lean_truncated = [lean_env.step_lean(0)[2] for _ in range(5)]
+    finally:
+        full_env.close()
+        lean_env.close()
+
+    assert full_truncated == [False] * 4 + [True]
+    assert lean_truncated == full_truncated
+
+
+def test_restore_first_step_reward():
+    """A rollout that restores its state should get the same first reward as one that resets first"""
+    pytest.importorskip("gym_super_mario_bros")
+    from environment import create_env
+    from monte_carlo_tree_search import Node, rollout
+
+    envs = [create_env(headless=True, with_reward=True) for _ in range(2)]
+    try:
+        for env in envs:
+            env.reset()
+        # a few steps into the level, so the state is not the one of a reset
+        for _ in range(8):
+            envs[0].step(1)
+        state = envs[0].serialize()
+
+        rewards = []
+        for env, restore in zip(envs, (False, True)):
+            node = Node(action=1, parent=Node(state=state))
+            rewards.append(rollout(node, env, horizon=0, restore=restore))
+    finally:
+        for env in envs:
+            env.close()
+
+    assert rewards[1] == rewards[0]
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+
+from game_play_recorder import GamePlayRecorder
+from monte_carlo_tree_search import Node
+
+pytest.importorskip("cv2")
+import replay
+
+# the recorded game ends in the middle of this frame
+LAST_FRAME = 8 * 9 + 3
+
+
+class ReplayEnv:
+    """A game that draws the frame number and the action on the screen."""
+
+    def __init__(self, **kwargs):
+        self.unwrapped = self
+        self.frame = 0
+        self.action = 0
+
+    def reset(self):
+        self.frame = 0
+        return None, {}
+
+    def step(self, action: int) -> tuple:
+        self.frame += 1
+        self.action = action
+        return None, 0.0, self.frame >= LAST_FRAME, False, {}
+
+    def render(self) -> np.ndarray:
+        screen = np.zeros(replay.SCREEN_SHAPE, dtype=np.uint8)
+        screen[..., 0] = self.frame
+        screen[..., 2] = self.action
+        return screen
+
+    def deserialize(self, state: bytes):
+        self.frame = int(state)
+
+
+class VideoWriter:
+    def __init__(self):
+        self.frames = []
+
+    def write(self, frame: np.ndarray):
+        # the frames are written in BGR
+        self.frames.append((int(frame[0, 0, 2]), int(frame[0, 0, 0])))
+
+
+@pytest.fixture
+def recording(tmp_path):
+    recorder = GamePlayRecorder(tmp_path / "recording")
+    for i in range(12):
+        recorder.record(
+            {"action": i % 4}, b"%d" % ((i + 1) * replay.FRAMES_PER_STEP), Node(action=1)
+        )
+    recorder.close()
+    return tmp_path / "recording"
+
+
+def test_parallel_replay_matches_the_serial_one(recording):
+    """The segments rendered in parallel should be encoded in the order of the serial replay"""
+    serial = VideoWriter()
+    num_frames = replay._replay_serial(recording, serial, ReplayEnv)
+
+    parallel = VideoWriter()
+    # the fifth segment reuses the first of the four slots of the buffer
+    assert (
+        replay._replay_parallel(
+            recording, parallel, num_workers=2, segment_steps=2, env_provider=ReplayEnv
+        )
+        == num_frames
+    )
+
+    assert num_frames == LAST_FRAME
+    assert [frame for frame, _ in serial.frames] == list(range(1, LAST_FRAME + 1))
+    assert parallel.frames == serial.frames
+    assert not any(recording.glob("tmp*"))
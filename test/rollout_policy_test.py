@@ -0,0 +1,74 @@
+from unittest.mock import MagicMock
+
+import numpy as np
+from gymnasium.spaces import Discrete
+
+from monte_carlo_tree_search import Node, rollout
+from rollout_policy import (
+    HeuristicPolicy,
+    RolloutPolicy,
+    StickyPolicy,
+    WeightedPolicy,
+    JUMP_RIGHT,
+    LEFT,
+    RIGHT,
+)
+
+
+def create_env(seed: int = 0):
+    env = MagicMock()
+    env.action_space = Discrete(4, seed=seed)
+    return env
+
+
+def test_weighted_policy():
+    """The weighted policy should follow the weights of the actions"""
+    env = create_env()
+    policy = WeightedPolicy([0, 1, 0, 3])
+
+    actions = [policy(env, None) for _ in range(2000)]
+
+    assert set(actions) == {1, 3}
+    assert 0.7 < np.mean(np.array(actions) == 3) < 0.8
+
+
+def test_sticky_policy_repeats_actions():
+    """The sticky policy should hold the action of the base policy"""
+    env = create_env()
+    always = StickyPolicy(repeat_probability=1.0)
+    never = StickyPolicy(WeightedPolicy([0, 0, 0, 1]), repeat_probability=0.0)
+
+    assert len({always(env, None) for _ in range(20)}) == 1
+    assert {never(env, None) for _ in range(20)} == {LEFT}
+
+
+def test_heuristic_policy_jumps_when_stuck():
+    """The heuristic policy should jump once Mario stops making progress"""
+    env = create_env()
+    policy = HeuristicPolicy(stuck_steps=2, explore_probability=0.0)
+
+    policy(env, {"x_pos": 10, "y_pos": 79})
+    policy(env, {"x_pos": 10, "y_pos": 79})
+    assert policy(env, {"x_pos": 10, "y_pos": 79}) == JUMP_RIGHT
+    # falling into a pit
+    policy.reset()
+    assert policy(env, {"x_pos": 20, "y_pos": 60}) == JUMP_RIGHT
+    # running on the ground
+    assert policy(env, {"x_pos": 30, "y_pos": 79}) in (RIGHT, JUMP_RIGHT)
+
+
+def test_rollout_with_policy():
+    """The rollout should take the actions from the policy with the last info"""
+    env = create_env()
+    env.step.side_effect = [
+        ("obs", 1, False, False, {"x_pos": 1}),
+        ("obs", 2, True, False, {"x_pos": 2}),
+    ]
+    policy = MagicMock(spec=RolloutPolicy, side_effect=[RIGHT, LEFT])
+
+    rewards = rollout(Node(state="state"), env, policy=policy)
+
+    assert rewards == [1, 2]
+    assert [c.args[0] for c in env.step.call_args_list] == [RIGHT, LEFT]
+    assert policy.call_args_list[1].args[1] == {"x_pos": 1}
+    policy.reset.assert_called_once()
@@ -1,6 +1,7 @@
 import pytest
 from unittest.mock import MagicMock
-from monte_carlo_tree_search import rollout, Node
+from collections import namedtuple
+from monte_carlo_tree_search import rollout, rollouts, Node
 
 
 def test_rollout_with_non_terminal_node():
@@ -104,3 +105,97 @@ def test_rollout_with_node_has_state():
     assert (
         root_node.is_terminal == False
     ), "Node's is_terminal attribute should not be changed."
+
+
+def test_rollout_with_horizon():
+    """
+    Test rollout stops after the horizon and scores the cut off state with the evaluator.
+    """
+    mock_env = MagicMock()
+    mock_env.step.side_effect = [
+        ("state", 1, False, False, {"flag_get": False, "y_pos": 79}),
+        ("state", 2, False, False, {"y_pos": 79}),
+        ("state", 3, False, False, {"y_pos": 60}),
+        ("state", 4, True, False, {"y_pos": 79}),
+    ]
+    root_node = Node(state="root_state", parent=None)
+    root_node.add(node := Node(action=1))
+
+    rewards = rollout(node, mock_env, horizon=2, evaluator=lambda info: info["y_pos"])
+
+    assert rewards == [1, 2, 3, 60], "The rollout should stop after 2 random steps."
+    assert mock_env.step.call_count == 3
+
+
+def test_rollout_with_horizon_ends_before_cut_off():
+    """
+    Test rollout does not call the evaluator when the game ends within the horizon.
+    """
+    mock_env = MagicMock()
+    mock_env.step.side_effect = [
+        ("state-1", 1, False, False, {}),
+        ("state-2", 2, True, False, {}),
+    ]
+    evaluator = MagicMock()
+    root_node = Node(state="root_state", parent=None)
+
+    rewards = rollout(root_node, mock_env, horizon=5, evaluator=evaluator)
+
+    assert rewards == [1, 2]
+    assert evaluator.call_count == 0
+
+
+def test_lean_rollout():
+    """A lean rollout should take the random steps with `step_lean` and pass the fields to the evaluator"""
+    # the same fields as `mario_reward.LeanInfo`
+    LeanInfo = namedtuple("LeanInfo", ["x_pos", "y_pos", "flag_get", "is_dead"])
+    mock_env = MagicMock()
+    mock_env.step_lean.side_effect = [
+        (1, False, False, LeanInfo(40, 90, False, False)),
+        (2, False, False, LeanInfo(48, 60, False, False)),
+    ]
+    node = Node(state="state")
+
+    rewards = rollout(
+        node, mock_env, horizon=2, evaluator=lambda info: info["y_pos"], lean=True
+    )
+
+    assert rewards == [1, 2, 60]
+    assert mock_env.step.call_count == 0
+
+
+def test_rollout_with_restore():
+    """A rollout with `restore` should load the parent's state without resetting the environment"""
+    mock_env = MagicMock()
+    mock_env.step.return_value = ("state", 1, True, False, {"flag_get": False})
+    root_node = Node(state="root_state")
+    root_node.add(node := Node(action=1))
+
+    rollout(node, mock_env, restore=True)
+
+    assert mock_env.reset.call_count == 0
+    assert mock_env.deserialize.call_count == 0
+    mock_env.restore.assert_called_once_with("root_state")
+
+
+def test_rollouts_from_the_same_state():
+    """The rollouts after the first one should start from the node's state with the node's reward"""
+    mock_env = MagicMock()
+    mock_env.step.side_effect = [
+        ("state", 5, False, False, {"flag_get": False}),
+        ("state", 1, True, False, {}),
+        ("state", 2, True, False, {}),
+        ("state", 3, True, False, {}),
+    ]
+    mock_env.serialize.return_value = "node_state"
+    root_node = Node(state="root_state")
+    root_node.add(node := Node(action=1))
+
+    results = rollouts(node, mock_env, num_rollouts=3)
+
+    assert results == [[5, 1], [5, 2], [5, 3]]
+    assert [c.args[0] for c in mock_env.deserialize.call_args_list] == [
+        "root_state",
+        "node_state",
+        "node_state",
+    ]
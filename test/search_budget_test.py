@@ -0,0 +1,68 @@
+import time
+
+import monte_carlo_tree_search as mcts
+from search_budget import SearchBudget
+
+
+def create_root(*values):
+    root = mcts.Node(visits=len(values), action=1)
+    for action, value in enumerate(values):
+        root.add(mcts.Node(action=action, visits=1, value=value))
+    return root
+
+
+def test_is_decided_with_large_margin():
+    """The decision is settled when the runner-up cannot catch up within the remaining rollouts"""
+    root = create_root(100, 10, 5, 0)
+
+    assert mcts.is_decided(root, remaining=8, max_change=10)
+    assert not mcts.is_decided(root, remaining=9, max_change=10)
+
+
+def test_is_decided_requires_all_actions():
+    """An action that is not expanded yet might be the best one"""
+    root = create_root(100, 10)
+
+    assert not mcts.is_decided(root, remaining=0, max_change=1)
+
+
+def test_budget_stops_on_targets():
+    """The node and depth targets should behave the same as the fixed loop condition"""
+    budget = SearchBudget(target_num_nodes=10, target_depth=4)
+    budget.start()
+
+    assert budget.allows(num_nodes=5, depth=6)
+    assert budget.allows(num_nodes=15, depth=2)
+    assert not budget.allows(num_nodes=15, depth=5)
+    assert not budget.allows(num_nodes=20, depth=2)
+
+
+def test_budget_stops_on_deadline():
+    """No new round should start when it cannot finish before the deadline"""
+    budget = SearchBudget(time_budget_ms=50)
+    budget.start()
+    assert budget.allows(num_nodes=0, depth=0)
+
+    budget.record_round(0.1)
+    assert not budget.allows(num_nodes=0, depth=0)
+
+    budget = SearchBudget(time_budget_ms=1)
+    budget.start()
+    time.sleep(0.002)
+    assert not budget.allows(num_nodes=0, depth=0)
+
+
+def test_budget_early_stop():
+    """The early stop uses the largest change of the root children seen so far"""
+    root = create_root(100, 10, 5, 0)
+    budget = SearchBudget(target_num_nodes=10, early_stop=True)
+    budget.start()
+    assert not budget.is_decided(root, num_nodes=10, action_space=4)
+
+    values = {c: c.value for c in root.children}
+    mcts.backpropagate(root.children[1], [5])
+    budget.record_change(root, values)
+
+    # 10 rollouts left, each changes the values by 5 at most
+    assert budget.is_decided(root, num_nodes=10, action_space=4)
+    assert not budget.is_decided(root, num_nodes=0, action_space=4)
@@ -0,0 +1,36 @@
+import time
+
+import pytest
+
+from search_metrics import SearchMetrics
+
+
+def test_phases_and_counters():
+    """The metrics should sum the phases and derive the rates and the worker idle time"""
+    metrics = SearchMetrics(num_workers=2, frame_skip=8)
+    with metrics.phase("rollout"):
+        time.sleep(0.02)
+    metrics.add("rollouts", 4)
+    metrics.add("steps", 10)
+    metrics.add("worker_busy", 0.01)
+
+    result = metrics.finish(num_nodes=5)
+
+    assert result["rollout_seconds"] >= 0.02
+    assert result["select_seconds"] == 0
+    assert result["rollouts"] == 4
+    assert result["num_nodes"] == 5
+    assert result["worker_idle"] >= 0.03
+    assert result["frames_per_second"] == pytest.approx(result["rollouts_per_second"] * 20)
+    assert metrics.last is result
+
+
+def test_reset_starts_a_new_decision():
+    """A reset should clear the counters of the previous decision"""
+    metrics = SearchMetrics()
+    metrics.add("rollouts", 3)
+    metrics.finish()
+
+    metrics.reset()
+
+    assert metrics.finish()["rollouts"] == 0
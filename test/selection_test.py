@@ -1,3 +1,4 @@
+import pytest
 import monte_carlo_tree_search as mcts
 
 
@@ -116,3 +117,17 @@ def test_select_on_tree_with_equal_ucb1_values():
     # the second child should be at first because it has higher weight
     selected_nodes = mcts.select(root)
     assert selected_nodes[0][0] == child_1
+
+
+def test_exploration_weight_scales_the_bonus():
+    """The exploration weight should scale the exploration term of the UCB1 score"""
+    root = mcts.Node(value=0, visits=100, action=0)
+    root.add(child := mcts.Node(action=1, value=5, visits=10))
+
+    greedy = mcts.ucb1(child, exploration_weight=0)
+    default = mcts.ucb1(child, exploration_weight=1.0)
+    explorative = mcts.ucb1(child, exploration_weight=2.0)
+
+    weight = mcts.action_weights[1]
+    assert greedy == pytest.approx(0.5 * weight)
+    assert explorative - greedy == pytest.approx(2 * (default - greedy))
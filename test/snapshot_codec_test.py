@@ -0,0 +1,70 @@
+import os
+
+from monte_carlo_tree_search import Node
+from state_store import StateStore
+import snapshot_codec
+
+
+def mutate(state: bytes, *offsets: int) -> bytes:
+    state = bytearray(state)
+    for offset in offsets:
+        state[offset] ^= 0xFF
+    return bytes(state)
+
+
+def test_encode_and_decode():
+    """A delta should rebuild the state and only hold the runs that differ"""
+    base = os.urandom(4096)
+    state = mutate(base, 0, 3, 2000, 4095)
+
+    delta = snapshot_codec.encode(base, state)
+
+    assert snapshot_codec.decode(base, delta) == state
+    # 0 and 3 are merged into one run of 4 bytes, the others are runs of 1 byte
+    assert len(delta) == 8 + 3 * 8 + 6
+    assert snapshot_codec.decode(base, snapshot_codec.encode(base, base)) == base
+    # the states of different lengths cannot be encoded
+    assert snapshot_codec.encode(base, base[:-1]) is None
+
+
+def test_store_keeps_deltas():
+    """The store in the delta mode should replace the evicted states with deltas along the chain"""
+    root = Node(state=os.urandom(1024), action=1)
+    root.add(child := Node(action=0, state=mutate(root.state, 1)))
+    child.add(grandchild := Node(action=0, state=mutate(child.state, 2)))
+    grandchild.add(leaf := Node(action=0, state=mutate(grandchild.state, 3)))
+    expected = grandchild.state
+    store = StateStore(max_bytes=3000, delta=True)
+    store.reroot(root)
+    for node in (child, grandchild, leaf):
+        store.add(node)
+
+    store.evict(action_space=1)
+
+    assert grandchild.state is None
+    assert store.state(grandchild) == expected
+    assert store.num_bytes < 4 * 1024
+
+    # the state is put back before the node is detached from the tree
+    assert store.restore(grandchild) == expected
+    assert grandchild.state == expected
+
+
+def test_recorder_saves_deltas_between_keyframes(tmp_path):
+    """The recorder should save the keyframes and the deltas that rebuild every state"""
+    from game_play_recorder import GamePlayRecorder, load_state
+
+    recorder = GamePlayRecorder(tmp_path / "recording", keyframe_interval=3)
+    states = [os.urandom(256)]
+    for i in range(5):
+        states.append(mutate(states[-1], i))
+    for state in states:
+        recorder.record({"action": 0}, state, Node(action=1))
+
+    recording = tmp_path / "recording"
+    assert sorted(p.name for p in recording.glob("*.state.xz")) == [
+        "0000.state.xz",
+        "0003.state.xz",
+    ]
+    for index, state in enumerate(states):
+        assert load_state(recording, index) == state
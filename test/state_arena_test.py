@@ -0,0 +1,66 @@
+import multiprocessing
+import pickle
+
+from state_arena import StateArena
+
+
+def test_write_and_read():
+    """A state written into a slot should be read back unchanged"""
+    arena = StateArena(num_slots=2, slot_size=16)
+    try:
+        slot = arena.allocate()
+        assert arena.write(slot, b"state-1")
+        assert arena.read(slot) == b"state-1"
+        assert bytes(arena.view(slot)) == b"state-1"
+        # a state larger than the slot is rejected
+        assert not arena.write(slot, b"x" * 17)
+    finally:
+        arena.close()
+
+
+def test_allocate_until_full():
+    """The arena should run out of slots and reuse the freed ones"""
+    arena = StateArena(num_slots=2, slot_size=16)
+    try:
+        slots = [arena.allocate(), arena.allocate()]
+        assert sorted(slots) == [0, 1]
+        assert arena.allocate() is None
+        assert len(arena) == 2
+
+        arena.free(slots[0])
+        assert arena.allocate() == slots[0]
+    finally:
+        arena.close()
+
+
+def test_pickled_arena_shares_the_memory():
+    """An unpickled arena should attach to the same shared memory"""
+    arena = StateArena(num_slots=2, slot_size=16)
+    try:
+        attached = pickle.loads(pickle.dumps(arena))
+        attached.write(1, b"from worker")
+        assert arena.read(1) == b"from worker"
+        attached.close()
+    finally:
+        arena.close()
+
+
+def _write_in_worker(arena: StateArena, slot: int, state: bytes):
+    arena.write(slot, state)
+    arena.close()
+
+
+def test_worker_writes_into_the_arena():
+    """A state written by a worker process should be read by the owner, which keeps the memory"""
+    arena = StateArena(num_slots=2, slot_size=16)
+    try:
+        worker = multiprocessing.get_context("spawn").Process(
+            target=_write_in_worker, args=(arena, 0, b"from process")
+        )
+        worker.start()
+        worker.join()
+        assert worker.exitcode == 0
+        with arena.view(0) as state:
+            assert bytes(state) == b"from process"
+    finally:
+        arena.close()
@@ -0,0 +1,105 @@
+import pytest
+
+from monte_carlo_tree_search import Node
+from state_cache_pool import StateCachePool
+from test.fake_env import create_env
+
+
+@pytest.fixture
+def pool():
+    pool = StateCachePool(create_env, num_workers=1, cache_size=2)
+    yield pool
+    pool.close()
+
+
+def run(pool: StateCachePool, node: Node) -> tuple:
+    pool.submit(node)
+    finished, result = pool.next_result()
+    assert finished is node
+    return result
+
+
+def test_cache_hits_and_misses(pool):
+    """A task should only carry the parent's state when the worker does not hold it"""
+    root = Node(state=b"0")
+    root.add(child := Node(action=0))
+    child.add(grandchild := Node(action=0))
+
+    state, is_terminal, rewards, _, _ = run(pool, child)
+    assert (pool.cache_hits, pool.cache_misses) == (0, 1)
+    # the state of the child stays in the worker
+    assert state is None
+    assert not is_terminal
+    assert rewards == [[1.0] * 5]
+
+    run(pool, grandchild)
+    assert (pool.cache_hits, pool.cache_misses) == (1, 1)
+    assert child.state is None
+
+
+def test_evicted_state_is_sent_again(pool):
+    """A state evicted from the worker should come back to the main process and be sent again"""
+    root = Node(state=b"0")
+    root.add(child_1 := Node(action=0))
+    root.add(child_2 := Node(action=1))
+    child_1.add(grandchild_1 := Node(action=0))
+    child_1.add(grandchild_2 := Node(action=1))
+
+    run(pool, child_1)
+    # the root is evicted, the main process still has its state
+    run(pool, grandchild_1)
+    run(pool, child_2)
+    assert (pool.cache_hits, pool.cache_misses) == (1, 2)
+
+    # the child is evicted and its state is spilled back to the main process
+    state, _, rewards, _, _ = run(pool, grandchild_2)
+    assert child_1.state == b"1"
+    assert (pool.cache_hits, pool.cache_misses) == (1, 3)
+    assert rewards == [[1.0] * 4]
+
+
+def test_fetch_the_state_from_the_worker(pool):
+    """The state of a node should be fetched from the worker that holds it"""
+    root = Node(state=b"0")
+    root.add(child := Node(action=0))
+    run(pool, child)
+
+    assert pool.fetch(child) == b"1"
+    assert child.state == b"1"
+
+
+def test_failed_rollout_is_not_cached(pool):
+    """A failed rollout should not leave its state in the mirror of the worker's cache"""
+    root = Node(state=b"not a time")
+    root.add(failed := Node(action=0))
+    with pytest.raises(ValueError):
+        run(pool, failed)
+
+    # the parent and the child of the next task evict the entries of the failed one
+    other_root = Node(state=b"0")
+    other_root.add(child := Node(action=0))
+    pool.submit(child)
+    finished, (_, _, rewards, _, _) = pool.next_result(timeout=10)
+
+    assert finished is child
+    assert rewards == [[1.0] * 5]
+    assert pool._ids[failed] not in pool._holders
+
+
+def test_close_with_unread_results():
+    """The pool should close while results are still waiting to be read"""
+    pool = StateCachePool(create_env, num_workers=2, cache_size=8)
+    root = Node(state=b"0")
+    for action in range(4):
+        root.add(child := Node(action=action))
+        pool.submit(child)
+
+    pool.close()
+
+    assert not any(worker.is_alive() for worker in pool._workers)
+
+
+def test_cache_size_is_validated():
+    """The cache should refuse to be smaller than the parent and the child of a task"""
+    with pytest.raises(ValueError):
+        StateCachePool(create_env, num_workers=1, cache_size=1)
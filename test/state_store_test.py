@@ -0,0 +1,131 @@
+import gc
+from unittest.mock import MagicMock
+
+from monte_carlo_tree_search import Node, replay_state, rollout
+from state_store import StateStore
+
+
+def create_tree():
+    root = Node(state=b"r" * 10, action=1)
+    root.add(child := Node(action=0, state=b"c" * 10))
+    child.add(grandchild := Node(action=1, state=b"g" * 10))
+    child.add(leaf := Node(action=0, state=b"l" * 10))
+    return root, child, grandchild, leaf
+
+
+def test_evict_nodes_off_the_frontier():
+    """The fully expanded and terminal nodes lose their states once the budget is exceeded"""
+    root, child, grandchild, leaf = create_tree()
+    child.add(Node(action=2))
+    grandchild.is_terminal = True
+    store = StateStore(max_bytes=25)
+    store.reroot(root)
+    for node in (child, grandchild, leaf):
+        store.add(node)
+    assert store.num_bytes == 40
+
+    store.evict(action_space=2)
+
+    # the child of the root is protected and the leaf is on the frontier
+    assert child.state is not None
+    assert grandchild.state is None
+    assert leaf.state is not None
+    assert store.num_bytes == 30
+    assert store.num_evicted == 1
+
+
+def test_forget_collected_nodes():
+    """A node that is dropped from the tree should leave the store"""
+    store = StateStore(max_bytes=100)
+    node = Node(state=b"state")
+    store.add(node)
+    assert len(store) == 1
+
+    del node
+    gc.collect()
+    assert len(store) == 0
+    assert store.num_bytes == 0
+
+
+def test_replay_state_from_the_nearest_ancestor():
+    """A dropped state should be rebuilt by replaying the actions from the nearest state"""
+    root, child, grandchild, _ = create_tree()
+    child.state, grandchild.state = None, None
+    env = MagicMock()
+    env.serialize.side_effect = [b"child", b"grandchild"]
+
+    assert replay_state(grandchild, env) == b"grandchild"
+
+    assert grandchild.state == b"grandchild"
+    assert [c.args[0] for c in env.deserialize.call_args_list] == [root.state, b"child"]
+    assert [c.args[0] for c in env.step.call_args_list] == [0, 1]
+
+
+def test_rollout_replays_the_dropped_parent():
+    """A rollout of a node whose parent has no state should rebuild it first"""
+    root = Node(state=b"root")
+    root.add(parent := Node(action=2))
+    parent.add(node := Node(action=3))
+    env = MagicMock()
+    env.step.return_value = ("obs", 1, True, False, {"flag_get": False})
+    env.serialize.side_effect = [b"parent", b"node"]
+
+    rewards = rollout(node, env)
+
+    assert rewards == [1]
+    assert parent.state == b"parent"
+    assert node.state == b"node"
+    assert env.deserialize.call_args_list[-1].args[0] == b"parent"
+
+
+def test_evict_the_nodes_that_left_the_frontier_later():
+    """A node is evicted once it is added again after it left the frontier, the least recently used first"""
+    root, child, grandchild, leaf = create_tree()
+    store = StateStore(max_bytes=35)
+    store.reroot(root)
+    for node in (child, grandchild, leaf):
+        store.add(node)
+
+    # nothing is off the frontier yet
+    store.evict(action_space=2)
+    assert store.num_evicted == 0
+
+    grandchild.is_terminal = True
+    leaf.is_terminal = True
+    store.add(leaf)
+    store.add(grandchild)
+    store.evict(action_space=2)
+
+    # the leaf is used before the grandchild
+    assert leaf.state is None
+    assert grandchild.state is not None
+    assert store.num_bytes == 30
+
+
+def test_shared_state_is_counted_once():
+    """The nodes that share a state, e.g. the transposition aliases, should count its bytes once"""
+    root, child, grandchild, leaf = create_tree()
+    leaf.state = grandchild.state
+    leaf.transposition = grandchild
+    store = StateStore(max_bytes=30)
+    store.reroot(root)
+    store.add(child)
+    store.add(grandchild)
+    store.add(leaf)
+    assert store.num_bytes == 30
+
+    # the budget is met, so nothing is evicted
+    store.evict(action_space=2)
+    assert store.num_evicted == 0
+
+    # the state is only freed once neither of the nodes holds it
+    child.children.remove(leaf)
+    del leaf
+    gc.collect()
+    assert store.num_bytes == 30
+    store.max_bytes = 20
+    grandchild.is_terminal = True
+    store.add(grandchild)
+    store.evict(action_space=2)
+    assert grandchild.state is None
+    assert store.num_bytes == 20
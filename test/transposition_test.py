@@ -0,0 +1,69 @@
+import monte_carlo_tree_search as mcts
+
+
+def test_register_shares_the_state():
+    """The second node that reaches a state should become an alias of the first one"""
+    table = mcts.TranspositionTable()
+    root = mcts.Node(state=b"root")
+    root.add(node_1 := mcts.Node(action=0, state=b"airborne"))
+    root.add(node_2 := mcts.Node(action=3, state=bytes(b"airborne")))
+
+    assert table.register(node_1) is node_1
+    assert table.register(node_2) is node_1
+
+    assert node_2.transposition is node_1
+    assert node_2.state is node_1.state
+    assert len(table) == 1
+
+
+def test_alias_is_not_expanded():
+    """Only the first node of a state grows the shared subtree"""
+    table = mcts.TranspositionTable()
+    root = mcts.Node(state=b"root", visits=1, action=1)
+    root.add(node_1 := mcts.Node(action=0, state=b"same", visits=1))
+    root.add(node_2 := mcts.Node(action=3, state=b"same", visits=1))
+    table.register(node_1)
+    table.register(node_2)
+
+    assert node_2 not in [node for node, _, _ in mcts.select(root)]
+    assert mcts.expand([(node_2, 1, 1.0)], num_actions=4) == []
+
+
+def test_backpropagate_through_aliases():
+    """The rewards under the first node should also reach the path of its aliases"""
+    table = mcts.TranspositionTable()
+    root = mcts.Node(state=b"root")
+    root.add(node_1 := mcts.Node(action=0, state=b"same"))
+    root.add(node_2 := mcts.Node(action=3, state=b"same"))
+    node_1.add(leaf := mcts.Node(action=1, state=b"leaf"))
+    table.register(node_1)
+    table.register(node_2)
+
+    starts = table.backpropagate(leaf, [10], reward_discount=0.5)
+
+    assert starts == [leaf, node_2]
+    assert (leaf.visits, leaf.value) == (1, 10)
+    assert (node_1.visits, node_1.value) == (1, 5)
+    assert (node_2.visits, node_2.value) == (1, 5)
+    # the root is reached by both paths, but it is updated only once
+    assert (root.visits, root.value) == (1, 2.5)
+
+
+def test_reroot_promotes_orphaned_alias():
+    """An alias whose first node is outside of the new tree should take its place"""
+    table = mcts.TranspositionTable()
+    root = mcts.Node(state=b"root")
+    root.add(node_1 := mcts.Node(action=0, state=b"same"))
+    root.add(node_2 := mcts.Node(action=3, state=b"other"))
+    node_2.add(node_3 := mcts.Node(action=1, state=b"same"))
+    node_2.add(node_4 := mcts.Node(action=2, state=b"same"))
+    for node in (node_1, node_2, node_3, node_4):
+        table.register(node)
+    assert node_3.transposition is node_1
+
+    node_2.parent = None
+    table.reroot(node_2)
+
+    assert node_3.transposition is None
+    assert node_4.transposition is node_3
+    assert node_1 not in table
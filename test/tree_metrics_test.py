@@ -0,0 +1,82 @@
+import random
+
+from monte_carlo_tree_search import Node
+from tree_metrics import MeasureTree
+
+
+def test_incremental_metrics_match_the_traversal():
+    """The metrics maintained by `add` should match a full traversal of the tree"""
+    rng = random.Random(0)
+    root = Node()
+    nodes = [root]
+    for _ in range(500):
+        child = Node(action=0)
+        rng.choice(nodes).add(child)
+        nodes.append(child)
+
+    for node in (root, nodes[1], nodes[250]):
+        measure = MeasureTree()
+        measure(node)
+        assert node.size == measure.num_nodes
+        assert node.height == measure.max_depth
+
+    depth, node = 0, root.deepest
+    while node is not root:
+        node, depth = node.parent, depth + 1
+    assert depth == root.height
+
+
+def test_add_a_subtree():
+    """A child with its own subtree should add all of its nodes to the ancestors"""
+    root = Node()
+    root.add(child := Node(action=0))
+    subtree = Node(action=1)
+    subtree.add(leaf := Node(action=2))
+
+    child.add(subtree)
+
+    assert root.size == 4
+    assert root.height == 3
+    assert root.deepest is leaf
+
+
+def test_reroot_keeps_the_metrics():
+    """A detached subtree should keep its metrics as the new root"""
+    root = Node()
+    root.add(decision := Node(action=0))
+    root.add(Node(action=1))
+    decision.add(Node(action=0))
+
+    decision.parent = None
+    decision.add(leaf := Node(action=1))
+    leaf.add(Node(action=0))
+
+    assert decision.size == 4
+    assert decision.height == 2
+    assert root.size == 4
+
+
+def test_measure_a_deep_tree():
+    """The traversal should not hit the recursion limit on a deep tree"""
+    root = node = Node()
+    for _ in range(2000):
+        node.add(child := Node(action=0))
+        node = child
+
+    measure = MeasureTree()
+    measure(root)
+
+    assert measure.num_nodes == root.size == 2001
+    assert measure.max_depth == root.height == 2000
+    assert measure.longest_path is root.deepest is node
+
+
+def test_children_of_the_constructor():
+    """The children passed to the constructor should be counted the same as the added ones"""
+    grandchild = Node(action=1)
+    root = Node(children=[Node(action=0, children=[grandchild]), Node(action=1)])
+
+    assert root.size == 4
+    assert root.height == 2
+    assert root.deepest is grandchild
+    assert grandchild.parent.parent is root
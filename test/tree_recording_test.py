@@ -0,0 +1,56 @@
+from monte_carlo_tree_search import Node
+from tree_recording import TreeRecording, flatten, save_tree
+
+
+def create_tree() -> Node:
+    root = Node(action=1, visits=3, value=2.0)
+    root.add(child := Node(action=0, visits=2, value=1.5))
+    root.add(Node(action=2, visits=1, value=0.5, is_terminal=True))
+    child.add(Node(action=3, visits=1, value=1.0, is_victory=True))
+    child.add(Node(action=1, visits=1, value=0.5))
+    return root
+
+
+def test_flatten_in_preorder():
+    """The nodes should be flattened in preorder with their parents and subtree sizes"""
+    nodes = flatten(create_tree())
+
+    assert nodes["action"].tolist() == [1, 0, 3, 1, 2]
+    assert nodes["parent"].tolist() == [-1, 0, 1, 1, 0]
+    assert nodes["size"].tolist() == [5, 3, 1, 1, 1]
+    assert nodes["visits"].tolist() == [3, 2, 1, 1, 1]
+
+
+def test_subtree_queries(tmp_path):
+    """The memory-mapped recording should answer the queries on a subtree"""
+    path = tmp_path / "0000.tree.npy"
+    save_tree(path, flatten(create_tree()))
+    tree = TreeRecording(path)
+
+    assert len(tree) == 5
+    assert tree.children() == [1, 4]
+    assert tree.children(1) == [2, 3]
+    assert tree.subtree(1)["action"].tolist() == [0, 3, 1]
+    assert tree.path(3) == [0, 1, 3]
+    assert tree.depth() == 2
+    assert tree.depth(4) == 0
+
+
+def test_to_dict(tmp_path):
+    """The nested dicts should have the layout of the old pickled recordings"""
+    path = tmp_path / "0000.tree.npy"
+    save_tree(path, flatten(create_tree()))
+
+    data = TreeRecording(path).to_dict()
+
+    assert [c["action"] for c in data["children"]] == [0, 2]
+    assert data["children"][1]["is_terminal"]
+    assert data["children"][0]["children"][0] == {
+        "action": 3,
+        "visits": 1,
+        "value": 1.0,
+        "is_terminal": False,
+        "is_victory": True,
+        "children": [],
+    }
+    assert TreeRecording(path).to_dict(1)["visits"] == 2
@@ -0,0 +1,67 @@
+from unittest.mock import MagicMock
+
+from monte_carlo_tree_search import Node
+from vector_rollout import VectorRollout
+
+
+def create_env(*steps):
+    env = MagicMock()
+    env.step.side_effect = list(steps)
+    env.serialize.return_value = "stepped"
+    return env
+
+
+def test_rollouts_in_lockstep():
+    """Each rollout should stop with its own environment and collect the same rewards as `rollout`"""
+    env_1 = create_env(
+        ("obs", 1, False, False, {"flag_get": False}),
+        ("obs", 2, True, False, {}),
+    )
+    env_2 = create_env(
+        ("obs", 10, False, False, {"flag_get": True}),
+        ("obs", 20, False, False, {}),
+        ("obs", 30, True, False, {}),
+    )
+    root = Node(state="root_state")
+    root.add(node_1 := Node(action=1))
+    root.add(node_2 := Node(action=2))
+
+    rewards = VectorRollout([env_1, env_2]).rollout([node_1, node_2])
+
+    assert rewards == [[1, 2], [10, 20, 30]]
+    assert env_1.step.call_count == 2
+    # the random actions are only sampled for the games that are still running
+    assert env_1.action_space.sample.call_count == 1
+    assert env_2.action_space.sample.call_count == 2
+    assert node_1.state == "stepped"
+    assert node_2.is_victory
+    assert env_1.deserialize.call_args[0][0] == "root_state"
+
+
+def test_rollouts_with_terminal_node_and_horizon():
+    """A terminal node is skipped and the others are cut off by the horizon"""
+    env_1 = create_env()
+    env_2 = create_env(
+        ("obs", 1, False, False, {}),
+        ("obs", 2, False, False, {"y_pos": 60}),
+        ("obs", 3, False, False, {}),
+    )
+
+    rewards = VectorRollout([env_1, env_2]).rollout(
+        [Node(is_terminal=True), Node(state="state")],
+        horizon=2,
+        evaluator=lambda info: info["y_pos"],
+    )
+
+    assert rewards == [[], [1, 2, 60]]
+    assert env_1.step.call_count == 0
+    assert env_1.action_space.sample.call_count == 0
+
+
+def test_more_nodes_than_environments():
+    """The rollout should refuse more nodes than it has environments"""
+    try:
+        VectorRollout([create_env()]).rollout([Node(state="a"), Node(state="b")])
+        assert False, "ValueError expected"
+    except ValueError:
+        pass
@@ -2,6 +2,11 @@ from monte_carlo_tree_search import Node
 
 
 class MeasureTree:
+    """Measure a tree with a full traversal.
+
+    The nodes maintain the same metrics incrementally in `Node.size`, `Node.height` and
+    `Node.deepest`, this traversal is kept to audit them.
+    """
 
     def __init__(self):
         self.num_nodes = 0
@@ -9,21 +14,22 @@ class MeasureTree:
         self.longest_path = None
 
     def __call__(self, node: Node):
-        self._measure(node, 0)
+        self._measure(node)
 
-    def _measure(self, node: Node, depth: int):
+    def _measure(self, root: Node):
         """Travserse the tree with Depth First Search and measure the metrics"""
 
-        if self.max_depth < depth:
-            self.longest_path = node
-            self.max_depth = depth
-
-        self.num_nodes += 1
+        # an explicit stack instead of recursion, the deep trees exceed the recursion limit
+        stack = [(root, 0)]
+        while stack:
+            node, depth = stack.pop()
+            if self.max_depth < depth or self.longest_path is None:
+                self.longest_path = node
+                self.max_depth = depth
 
-        # exit condition
-        if node.children is None or len(node.children) == 0:
-            return
+            self.num_nodes += 1
 
-        # recursive call
-        for child in node.children:
-            self._measure(child, depth + 1)
+            if node.children is None:
+                continue
+            for child in reversed(node.children):
+                stack.append((child, depth + 1))
@@ -0,0 +1,131 @@
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from monte_carlo_tree_search import Node
+
+# the flags of a node
+TERMINAL = 1
+VICTORY = 2
+
+# a node of a recorded tree, the nodes are stored in preorder so the subtree of a node is the
+# `size` rows that start with it
+NODE_DTYPE = np.dtype(
+    [
+        ("parent", np.int32),
+        ("action", np.int8),
+        ("flags", np.uint8),
+        ("visits", np.uint32),
+        ("size", np.uint32),
+        ("value", np.float64),
+    ]
+)
+
+
+def flatten(tree: Node) -> np.ndarray:
+    """
+    Copy the statistics of the tree into a flat array in preorder.
+    args:
+        tree: The root of the tree.
+    returns:
+        np.ndarray: The nodes of the tree as `NODE_DTYPE`, the parent of the root is -1 and so is its
+            action if it has none.
+    """
+    parents, actions, flags, visits, values = [], [], [], [], []
+    stack = [(tree, -1)]
+    while stack:
+        node, parent = stack.pop()
+        stack.extend((child, len(parents)) for child in reversed(node.children))
+        parents.append(parent)
+        actions.append(-1 if node.action is None else node.action)
+        flags.append(TERMINAL * node.is_terminal | VICTORY * node.is_victory)
+        visits.append(node.visits)
+        values.append(node.value)
+
+    # the sizes are counted here rather than taken from `Node.size`, the speculative search can be
+    # growing a subtree that is already detached from the root
+    sizes = [1] * len(parents)
+    for i in range(len(parents) - 1, 0, -1):
+        sizes[parents[i]] += sizes[i]
+
+    nodes = np.empty(len(parents), dtype=NODE_DTYPE)
+    nodes["parent"] = parents
+    nodes["action"] = actions
+    nodes["flags"] = flags
+    nodes["visits"] = visits
+    nodes["size"] = sizes
+    nodes["value"] = values
+    return nodes
+
+
+def save_tree(path: Path, nodes: np.ndarray):
+    """Save the flattened tree as a `.npy` file that `TreeRecording` can memory-map."""
+    with Path(path).open("wb") as f:
+        np.save(f, nodes)
+
+
+class TreeRecording:
+    """A recorded tree, memory-mapped so that a query only reads the rows it touches."""
+
+    def __init__(self, path: Path | np.ndarray):
+        """
+        args:
+            path: The `.tree.npy` file of a step, or the nodes, e.g. from `EpisodeReader.tree`.
+        """
+        if isinstance(path, np.ndarray):
+            self.nodes = path
+        else:
+            self.nodes = np.load(path, mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def children(self, index: int = 0) -> List[int]:
+        """Return the indices of the children of the node, skipping over their subtrees."""
+        children = []
+        end = index + int(self.nodes[index]["size"])
+        child = index + 1
+        while child < end:
+            children.append(child)
+            child += int(self.nodes[child]["size"])
+        return children
+
+    def subtree(self, index: int = 0) -> np.ndarray:
+        """Return the rows of the subtree under the node, the node is the first of them."""
+        return self.nodes[index : index + int(self.nodes[index]["size"])]
+
+    def path(self, index: int) -> List[int]:
+        """Return the indices of the nodes from the root to the node."""
+        path = [index]
+        while (parent := int(self.nodes[path[-1]]["parent"])) >= 0:
+            path.append(parent)
+        return path[::-1]
+
+    def depth(self, index: int = 0) -> int:
+        """Return the depth of the deepest node in the subtree under the node."""
+        subtree = self.subtree(index)
+        # the depth of a node is one more than the depth of its parent, which comes earlier
+        depths = np.zeros(len(subtree), dtype=np.int64)
+        parents = subtree["parent"] - index
+        for i in range(1, len(subtree)):
+            depths[i] = depths[parents[i]] + 1
+        return int(depths.max())
+
+    def to_dict(self, index: int = 0) -> dict:
+        """Rebuild the nested dicts of the old `.tree.json` recordings for the subtree under the node."""
+        subtree = np.asarray(self.subtree(index))
+        dicts = []
+        for parent, action, flags, visits, _, value in subtree.tolist():
+            data = {
+                "action": None if action < 0 else action,
+                "visits": visits,
+                "value": value,
+                "is_terminal": bool(flags & TERMINAL),
+                "is_victory": bool(flags & VICTORY),
+                "children": [],
+            }
+            if dicts:
+                dicts[parent - index]["children"].append(data)
+            dicts.append(data)
+        return dicts[0]
@@ -0,0 +1,148 @@
+from typing import Any, Callable, List, Tuple
+import copy
+
+import numpy as np
+import gymnasium as gym
+
+from monte_carlo_tree_search import Node, replay_state
+
+
+class VectorRollout:
+    """A number of simulation environments in one process that run their rollouts in lockstep.
+
+    One task carries the rollouts of many nodes, which amortizes the task scheduling and the IPC
+    of the pool over the rollouts. Only that overhead is saved: the lockstep is a Python loop that
+    steps the environments one after another, so the emulation itself is not any faster.
+    """
+
+    def __init__(self, envs: List[gym.Env]):
+        """
+        args:
+            envs: The simulation environments, they must be reset already.
+        """
+        self.envs = envs
+
+    def __len__(self) -> int:
+        return len(self.envs)
+
+    def step(
+        self, actions: List[int], active: np.ndarray, lean: bool = False
+    ) -> Tuple[np.ndarray, np.ndarray, List[dict | None]]:
+        """Step the active environments with their actions.
+
+        args:
+            actions: The action of each environment.
+            active: The mask of the environments to step.
+            lean: Step with `step_lean`, the infos are the `LeanInfo` of the steps.
+        returns:
+            np.ndarray: The rewards, 0 for the inactive environments.
+            np.ndarray: The done flags, True for the inactive environments.
+            List[dict | None]: The info of each environment, None for the inactive ones.
+        """
+        rewards = np.zeros(len(self.envs))
+        dones = np.ones(len(self.envs), dtype=bool)
+        infos = [None] * len(self.envs)
+        for i in np.flatnonzero(active):
+            if lean:
+                reward, terminated, truncated, infos[i] = self.envs[i].step_lean(
+                    actions[i]
+                )
+            else:
+                _, reward, terminated, truncated, infos[i] = self.envs[i].step(
+                    actions[i]
+                )
+            rewards[i] = reward
+            dones[i] = terminated or truncated
+
+        return rewards, dones, infos
+
+    def rollout(
+        self,
+        nodes: List[Node],
+        horizon: int | None = None,
+        evaluator: Callable[[dict], float] | None = None,
+        lean: bool = False,
+        restore: bool = False,
+        policy: Callable[[gym.Env, Any], int] | None = None,
+    ) -> List[List[float]]:
+        """Run the rollouts of the nodes, the same as `rollout` on each of them.
+
+        args:
+            nodes: The nodes to start the rollouts from, at most one per environment.
+            horizon: The max number of random steps after the node, None to play until the end.
+            evaluator: Score the state where a rollout is cut off by the horizon from its `info`.
+            lean: Take the random steps with `step_lean` of the environments.
+            restore: Load the states with `restore` of the environments instead of a reset.
+            policy: Choose the actions of the random steps, a copy of it runs on each environment.
+        returns:
+            List[List[float]]: The rewards collected during each rollout.
+        """
+        if len(nodes) > len(self.envs):
+            raise ValueError("There are more nodes than environments")
+
+        n = len(nodes)
+        rewards = [[] for _ in range(n)]
+        active = np.zeros(len(self.envs), dtype=bool)
+        infos = [None] * len(self.envs)
+
+        # restore the start states and run the nodes that are not run yet
+        for i, node in enumerate(nodes):
+            if node.is_terminal:
+                continue
+            env = self.envs[i]
+            if node.state is None and node.parent and node.parent.state is None:
+                replay_state(node.parent, env, restore=restore)
+            if not restore:
+                env.reset()
+            load = env.restore if restore else env.deserialize
+            if node.state is not None:
+                load(node.state)
+            elif node.parent:
+                load(node.parent.state)
+                _, reward, terminated, truncated, infos[i] = env.step(node.action)
+                rewards[i].append(reward)
+                if infos[i]["flag_get"] == True:
+                    node.is_victory = True
+                node.is_terminal = terminated or truncated
+                node.state = env.serialize()
+                if node.is_terminal:
+                    continue
+            else:
+                raise ValueError("The node is not a terminal node, but it does not have")
+            active[i] = True
+
+        # run the rest of the games with random actions in lockstep
+        policies = None
+        if policy is not None:
+            policies = [copy.deepcopy(policy) for _ in self.envs]
+            for p in policies:
+                p.reset()
+        steps = 0
+        while active.any() and (horizon is None or steps < horizon):
+            if policies is None:
+                actions = [
+                    env.action_space.sample() if a else None
+                    for env, a in zip(self.envs, active)
+                ]
+            else:
+                actions = [
+                    p(env, info) if a else None
+                    for p, env, info, a in zip(policies, self.envs, infos, active)
+                ]
+            step_rewards, dones, step_infos = self.step(actions, active, lean)
+            for i in np.flatnonzero(active):
+                rewards[i].append(step_rewards[i])
+                infos[i] = step_infos[i]
+            active &= ~dones
+            steps += 1
+
+        # estimate the rest of the games that are cut off
+        if evaluator is not None:
+            for i in np.flatnonzero(active):
+                info = infos[i]
+                if lean and steps > 0:
+                    info = info._asdict()
+                if info is not None:
+                    rewards[i].append(evaluator(info))
+
+        return rewards